@@ -0,0 +1,269 @@
+"""
+Benchmark de latencia del chatbot con catálogos sintéticos.
+
+Uso (desde la carpeta mi_ecommerce):
+
+    python -m chatbot.benchmark
+    python -m chatbot.benchmark --sizes 1000 10000 --repeat 10 --json resultados.json
+
+Para cada tamaño genera un catálogo sintético en una base SQLite temporal
+(no toca MySQL), lo carga como lo haría el servidor y reproduce un corpus de
+consultas en español por intención, tanto con process_any_query (answer_message
+para las comparaciones, que arman su tabla ahí) como con el endpoint HTTP.
+Reporta p50/p95/p99 en milisegundos y la memoria asignada por consulta, para
+que las regresiones se noten al comparar corridas.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+COLUMNS = [
+    ('brand_name', 'TEXT'), ('model', 'TEXT'), ('price', 'INTEGER'), ('avg_rating', 'REAL'),
+    ('5G_or_not', 'INTEGER'), ('processor_brand', 'TEXT'), ('num_cores', 'INTEGER'),
+    ('processor_speed', 'REAL'), ('battery_capacity', 'INTEGER'), ('fast_charging_available', 'INTEGER'),
+    ('fast_charging', 'INTEGER'), ('ram_capacity', 'INTEGER'), ('internal_memory', 'INTEGER'),
+    ('screen_size', 'REAL'), ('refresh_rate', 'INTEGER'), ('num_rear_cameras', 'INTEGER'), ('os', 'TEXT'),
+    ('primary_camera_rear', 'REAL'), ('primary_camera_front', 'REAL'),
+    ('extended_memory_available', 'INTEGER'), ('resolution_height', 'INTEGER'), ('resolution_width', 'INTEGER'),
+]
+
+SERIES = {
+    'samsung': ['Galaxy S', 'Galaxy A', 'Galaxy M', 'Galaxy Z Fold'],
+    'apple': ['iPhone '],
+    'google': ['Pixel '],
+    'xiaomi': ['Redmi Note ', 'Mi ', '13T '],
+    'motorola': ['Moto G', 'Edge '],
+    'oneplus': ['Nord ', 'OnePlus '],
+    'realme': ['Narzo ', 'GT '],
+    'oppo': ['Reno ', 'Find X'],
+    'vivo': ['V', 'Y'],
+    'nokia': ['G', 'X'],
+    'poco': ['X', 'F'],
+    'honor': ['Magic ', 'X'],
+}
+SUFFIXES = ['', ' Pro', ' Plus', ' Ultra', ' Lite', ' 5G', ' Max']
+
+
+def generate_phones(size, seed=42):
+    """Filas sintéticas con el esquema de la tabla smartphones (modelos únicos, nulos donde el dataset real los tiene)"""
+    rnd = random.Random(seed)
+    brands = list(SERIES)
+    rows, seen = [], set()
+    while len(rows) < size:
+        brand = rnd.choice(brands)
+        model = f"{rnd.choice(SERIES[brand])}{rnd.randint(1, 999)}{rnd.choice(SUFFIXES)}"
+        if model.lower() in seen:
+            model = f"{model} {len(rows)}"
+        seen.add(model.lower())
+        maybe = lambda value: value if rnd.random() > 0.05 else None  # noqa: E731
+        rows.append((
+            brand, model, rnd.randint(5000, 150000), round(rnd.uniform(3, 5), 1),
+            rnd.randint(0, 1), rnd.choice(['snapdragon', 'dimensity', 'exynos', 'bionic']),
+            8, round(rnd.uniform(1.8, 3.4), 2), rnd.randint(3000, 7000), 1,
+            maybe(rnd.choice([18, 33, 67, 120])), rnd.choice([3, 4, 6, 8, 12, 16]),
+            rnd.choice([64, 128, 256, 512]), round(rnd.uniform(5.5, 7.0), 2),
+            rnd.choice([60, 90, 120, 144]), rnd.randint(1, 4), 'ios' if brand == 'apple' else 'android',
+            rnd.choice([12, 48, 50, 64, 108, 200]), rnd.choice([8, 12, 16, 32]),
+            rnd.randint(0, 1), 2400, 1080,
+        ))
+    return rows
+
+
+def write_catalog(path, rows):
+    """Reemplaza la tabla smartphones de la base SQLite de prueba"""
+    with sqlite3.connect(path) as db:
+        db.execute('DROP TABLE IF EXISTS smartphones')
+        db.execute('CREATE TABLE smartphones (%s)' % ', '.join(f'"{name}" {kind}' for name, kind in COLUMNS))
+        db.executemany('INSERT INTO smartphones VALUES (%s)' % ', '.join('?' * len(COLUMNS)), rows)
+
+
+def build_corpus(rows, seed=7):
+    """Consultas en español por intención, usando modelos reales del catálogo generado"""
+    rnd = random.Random(seed)
+    sample = rnd.sample(rows, min(6, len(rows)))
+    names = [f"{brand} {model}".lower() for brand, model, *_ in sample]
+    typo = lambda text: text[:len(text) // 2] + text[len(text) // 2 + 1:]  # noqa: E731
+    return {
+        'greeting': ['hola', 'buenos días', 'buenas tardes, busco celular'],
+        'brand': ['samsung', 'modelos de xiaomi', 'celulares de motorola', '¿tienen oppo?'],
+        'model': [names[0], sample[1][1].lower(), typo(names[2])],
+        'comparison': [f'compara {names[3]} vs {names[4]}', f'{names[5]} versus {names[0]}'],
+        'camera': ['celular con buena cámara', 'para tomar fotos', 'cámara para selfie'],
+        'battery': ['buena batería', 'que tenga batería de larga duración'],
+        'price': ['algo barato', 'precio medio', 'opciones económicas'],
+        '5g': ['celulares con 5g', 'un 5g barato'],
+        'recommendation': ['recomienda uno rápido', 'sugiere algo para juegos'],
+    }
+
+
+def configure(db_path):
+    """Configura Django contra la base SQLite de prueba, sin la configuración del proyecto"""
+    from django.conf import settings
+    import django
+
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmark',
+        ALLOWED_HOSTS=['*'],
+        ROOT_URLCONF='chatbot.urls',
+        INSTALLED_APPS=[
+            'django.contrib.admin', 'django.contrib.auth', 'django.contrib.contenttypes',
+            'django.contrib.sessions', 'django.contrib.messages',
+        ],
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': db_path}},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CHATBOT_CATALOG_REFRESH_SECONDS=0,
+        # El benchmark envía ráfagas desde una sola IP a propósito
+        CHATBOT_RATE_LIMIT_ENABLED=False,
+    )
+    django.setup()
+
+
+def percentiles(samples):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3), 'n': len(samples)}
+
+
+def measure(call, queries, repeat):
+    """Latencias en milisegundos de llamar a call con cada consulta, repeat veces"""
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            call(query)
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def measure_memory(call, queries):
+    """Pico promedio de memoria asignada por consulta (KiB), medido aparte porque tracemalloc es lento"""
+    peaks = []
+    for query in queries:
+        tracemalloc.start()
+        call(query)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+    return round(sum(peaks) / len(peaks), 1)
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run(db_path, sizes, repeat=5, cached=False):
+    from django.test import Client
+
+    from chatbot.catalog import catalog_manager
+    from chatbot.views import answer_message, process_any_query, response_cache
+
+    client = Client()
+    counter = iter(range(10 ** 9))
+
+    def direct(query):
+        if not cached:
+            response_cache.clear()
+        return process_any_query(query, session_id='benchmark')
+
+    def conversation(query):
+        # Las comparaciones arman su tabla en answer_message; process_any_query solo
+        # devuelve la invitación a comparar y mediría eso en lugar de la tabla
+        if not cached:
+            response_cache.clear()
+        data, status = answer_message(query, f'benchmark-{next(counter)}')
+        if status != 200:
+            raise RuntimeError(f"{query!r} respondió {status}")
+        return data
+
+    def http(query):
+        if not cached:
+            response_cache.clear()
+        # Una sesión nueva por consulta para que el modo comparación no se arrastre
+        payload = json.dumps({'message': query, 'session_id': f'benchmark-{next(counter)}'})
+        response = client.post('/api/chat/', data=payload, content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f"{query!r} respondió {response.status_code}")
+        return response
+
+    results = []
+    for size in sizes:
+        rows = generate_phones(size)
+        write_catalog(db_path, rows)
+
+        started = time.perf_counter()
+        catalog_manager.refresh(force=True)
+        load_seconds = time.perf_counter() - started
+        catalog = catalog_manager.current()
+
+        corpus = build_corpus(rows)
+        report = {
+            'size': size,
+            'load_s': round(load_seconds, 3),
+            'columns_mb': round(catalog.columns.nbytes / 2 ** 20, 2),
+            'max_rss_mb': max_rss_mb(),
+            'intents': {},
+        }
+        for intent, queries in corpus.items():
+            if intent == 'comparison':
+                path, call_direct = 'answer_message', conversation
+            else:
+                path, call_direct = 'process_any_query', direct
+            for call in (call_direct, http):
+                call(queries[0])  # Calentamiento
+            report['intents'][intent] = {
+                path: {**percentiles(measure(call_direct, queries, repeat)),
+                       'alloc_kib': measure_memory(call_direct, queries)},
+                'http': {**percentiles(measure(http, queries, repeat)),
+                         'alloc_kib': measure_memory(http, queries)},
+            }
+        results.append(report)
+        print_report(report)
+    return results
+
+
+def print_report(report):
+    print(f"\n== {report['size']:,} celulares: carga {report['load_s']}s, "
+          f"columnas {report['columns_mb']} MB, RSS máx {report['max_rss_mb']} MB")
+    print(f"{'intención':<15}{'ruta':<19}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'KiB':>9}")
+    for intent, paths in report['intents'].items():
+        for path, stats in paths.items():
+            print(f"{intent:<15}{path:<19}{stats['p50_ms']:>9.3f}{stats['p95_ms']:>9.3f}"
+                  f"{stats['p99_ms']:>9.3f}{stats['alloc_kib']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5, help='veces que se reproduce cada consulta')
+    parser.add_argument('--cached', action='store_true', help='no vaciar la caché de respuestas entre consultas')
+    parser.add_argument('--json', help='guardar los resultados en este archivo')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartphones.sqlite3')
+        configure(db_path)
+        # Los logs por petición distorsionan los tiempos
+        logging.disable(logging.CRITICAL)
+        results = run(db_path, args.sizes, repeat=args.repeat, cached=args.cached)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,557 @@
+import contextvars
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .columnar import ColumnarCatalog
+from .fuzzy import FuzzyIndex, NameLookup
+from .semantic import SemanticIndex
+from .snapshot import current_snapshot, is_complete, read_snapshot, write_snapshot
+from .spelling import build_speller, catalog_tokens
+
+logger = logging.getLogger(__name__)
+
+# Vistas ordenadas que se construyen una sola vez por versión del catálogo.
+# nombre -> (columnas que deben tener valor, claves de orden con su valor por defecto, descendente).
+# Sin claves se conserva el orden del catálogo.
+RANKINGS = {
+    'camera': (['primary_camera_rear'], [('num_rear_cameras', 1), ('primary_camera_rear', 0)], True),
+    'battery': (['battery_capacity'], [('battery_capacity', 0)], True),
+    'display': (['screen_size', 'refresh_rate'], [('screen_size', 0), ('refresh_rate', 0)], True),
+    'performance': (['ram_capacity', 'processor_speed'], [('ram_capacity', 0), ('processor_speed', 0)], True),
+    'price': (['price'], [('price', 0)], False),
+    '5g': (['5G_or_not'], [], False),
+    '5g_price': (['5G_or_not', 'price'], [('price', 0)], False),
+}
+
+# Criterios de recomendación: nombre -> [(columna, mayor es mejor)].
+# Las columnas de un mismo criterio se reparten su peso por igual.
+CRITERIA = {
+    'camera': [('primary_camera_rear', True)],
+    'battery': [('battery_capacity', True)],
+    'performance': [('ram_capacity', True), ('processor_speed', True)],
+    'price': [('price', False)],
+    'display': [('screen_size', True)],
+}
+
+# Columnas que se pueden filtrar por rango: se guardan sus posiciones ordenadas por valor
+FILTER_COLUMNS = [
+    'price', 'ram_capacity', 'internal_memory', 'battery_capacity', 'primary_camera_rear',
+    'primary_camera_front', 'screen_size', 'refresh_rate', 'fast_charging', 'processor_speed',
+]
+# Columnas sí/no que se filtran con un mapa de bits
+FLAG_COLUMNS = ['5G_or_not', 'fast_charging_available', 'extended_memory_available']
+
+
+class Catalog:
+    """
+    Catálogo de smartphones en memoria junto con sus índices.
+
+    Los datos se guardan por columnas (ver ColumnarCatalog) y todos los
+    índices (por modelo, por nombre completo, n-gramas, ortografía, TF-IDF,
+    rankings y filtros por columna) se construyen al crear el objeto, así que
+    las consultas solo leen.
+
+    Con from_snapshot, las columnas, rankings, criterios, filtros y los arreglos
+    de los índices de búsqueda se mapean desde una instantánea en disco
+    compartida entre procesos en lugar de calcularse; solo el corrector
+    ortográfico y los diccionarios chicos (marcas, vocabulario) se arman en cada worker.
+    """
+
+    def __init__(self, phones, version=None, columns=None, derived=None):
+        self.version = version or catalog_version(phones)
+        self.columns = columns if columns is not None else ColumnarCatalog.from_rows(phones)
+        self.source = 'snapshot' if derived else 'database'
+        self._object_bytes = None
+
+        # Índices por nombre, n-gramas, texto y marca: arreglos mapeados desde la instantánea o calculados
+        indexes = derived.get('indexes') if derived else None
+        self._use_indexes(indexes or self._build_indexes())
+
+        # Corrector ortográfico: vocabulario de intenciones más las palabras de marcas y modelos
+        self.speller = build_speller(tokens=dict(zip(
+            self.indexes['speller_words'].tolist(), self.indexes['speller_counts'].tolist()
+        )))
+
+        if derived:
+            self.rankings = derived['rankings']
+            self.sorted_prices = derived['sorted_prices']
+            self.criteria = derived['criteria']
+        else:
+            self.rankings = {name: self._build_ranking(*spec) for name, spec in RANKINGS.items()}
+            self.sorted_prices = self.columns.numeric('price')[self.rankings['price']]
+            self.criteria = {name: self._build_criterion(spec) for name, spec in CRITERIA.items()}
+
+        if derived and derived.get('filters'):
+            self.filters = derived['filters']
+            self.filter_values = derived['filter_values']
+            self.flags = derived['flags']
+        else:
+            self._build_filters()
+        self.flag_counts = {name: int(np.count_nonzero(flag)) for name, flag in self.flags.items()}
+
+    @classmethod
+    def from_snapshot(cls, directory, version):
+        columns, derived, meta = read_snapshot(directory, version)
+        return cls(None, version=meta['version'], columns=columns, derived=derived)
+
+    def use_snapshot(self, directory):
+        """
+        Cambia los arreglos propios por los de la instantánea de esta misma
+        versión (mismo contenido, pero mapeados y compartidos). Solo antes de
+        publicar el catálogo, mientras ninguna petición lo está leyendo.
+        """
+        columns, derived, _ = read_snapshot(directory, self.version)
+        self.columns = columns
+        self.rankings = derived['rankings']
+        self.sorted_prices = derived['sorted_prices']
+        self.criteria = derived['criteria']
+        if derived['filters']:
+            self.filters = derived['filters']
+            self.filter_values = derived['filter_values']
+            self.flags = derived['flags']
+        if derived['indexes']:
+            self._use_indexes(derived['indexes'])
+        self.source = 'snapshot'
+
+    def __len__(self):
+        return len(self.columns)
+
+    def _build_indexes(self):
+        """
+        Arreglos de los índices por nombre (huellas ordenadas), de n-gramas y
+        TF-IDF (en formato CSR), de posiciones por marca y las palabras del
+        catálogo para el corrector. Son los que se guardan en la instantánea.
+        """
+        brands = self.columns.strings('brand_name')
+        models = self.columns.strings('model')
+        full_names = [f"{brand.lower()} {model.lower()}" for brand, model in zip(brands, models)]
+        # Modelo -> posición (con modelos repetidos gana el último) y marca + modelo -> posición (el primero)
+        model_hashes, model_positions = NameLookup.build([model.lower() for model in models], keep='last')
+        name_hashes, name_positions = NameLookup.build(full_names)
+        fuzzy_grams, fuzzy_offsets, fuzzy_positions, fuzzy_lengths = FuzzyIndex.build(zip(brands, models))
+
+        # Posiciones de cada marca (ya en orden de catálogo) agrupando una sola vez por código
+        codes = self.columns.values['brand_name'] if self.columns.has('brand_name') else np.zeros(0, np.int32)
+        brand_order = np.argsort(codes, kind='stable').astype(np.int32)
+        brand_count = len(self.columns.tables['brand_name']) if self.columns.has('brand_name') else 0
+        brand_bounds = np.searchsorted(codes[brand_order], np.arange(brand_count + 1))
+
+        tokens = catalog_tokens(zip(brands, models))
+        words = sorted(tokens)
+        return {
+            'model_hashes': model_hashes,
+            'model_positions': model_positions,
+            'name_hashes': name_hashes,
+            'name_positions': name_positions,
+            'fuzzy_grams': fuzzy_grams,
+            'fuzzy_offsets': fuzzy_offsets,
+            'fuzzy_positions': fuzzy_positions,
+            'fuzzy_lengths': fuzzy_lengths,
+            'brand_order': brand_order,
+            'brand_bounds': brand_bounds.astype(np.int64),
+            'speller_words': np.array(words, dtype=np.str_),
+            'speller_counts': np.array([tokens[word] for word in words], dtype=np.int64),
+            **SemanticIndex(self.columns).arrays(),
+        }
+
+    def _use_indexes(self, indexes):
+        """Arma los índices de búsqueda sobre los arreglos de _build_indexes (propios o mapeados)"""
+        self.indexes = indexes
+        self.phone_index = NameLookup(
+            indexes['model_hashes'], indexes['model_positions'], lambda pos: self.names_of(pos)[1]
+        )
+        self.full_name_index = NameLookup(
+            indexes['name_hashes'], indexes['name_positions'], lambda pos: self.names_of(pos)[0]
+        )
+        self.fuzzy_index = FuzzyIndex(
+            indexes['fuzzy_grams'], indexes['fuzzy_offsets'], indexes['fuzzy_positions'], indexes['fuzzy_lengths'],
+            self.names_of,
+        )
+        self.semantic = SemanticIndex.from_arrays(len(self), indexes)
+        self._build_brand_index()
+
+    def names_of(self, pos):
+        """(marca + modelo, solo modelo) en minúsculas, como los buscan los índices por nombre"""
+        brand = self.columns.value('brand_name', pos) if self.columns.has('brand_name') else None
+        model = self.columns.value('model', pos) if self.columns.has('model') else None
+        model = (model or '').lower()
+        return f"{(brand or '').lower()} {model}", model
+
+    def _build_ranking(self, required, keys, descending):
+        sign = -1 if descending else 1
+        return self.columns.order(
+            [sign * self.columns.numeric(name, fill) for name, fill in keys],
+            mask=self.columns.where(*required)
+        )
+
+    def _build_criterion(self, columns):
+        scores = [self.columns.normalized(name, higher_is_better) for name, higher_is_better in columns]
+        return np.mean(scores, axis=0)
+
+    def _build_filters(self):
+        """
+        Índices para filtrar por columna: posiciones con valor ordenadas de
+        menor a mayor (con sus valores, para la búsqueda binaria) y mapas de bits
+        de las columnas sí/no.
+        """
+        self.filters, self.filter_values, self.flags = {}, {}, {}
+        for name in FILTER_COLUMNS:
+            if self.columns.has(name) and self.columns.kinds[name] != 'str':
+                positions = self.columns.order([self.columns.values[name]], mask=self.columns.valid[name])
+                self.filters[name] = positions.astype(np.int32)
+                self.filter_values[name] = self.columns.values[name][positions]
+        for name in FLAG_COLUMNS:
+            if self.columns.has(name):
+                self.flags[name] = self.columns.truthy(name)
+
+    def recommend(self, weights, k=3, mask=None):
+        """
+        Posiciones de los k teléfonos con mejor puntaje ponderado.
+
+        weights asocia cada criterio (ver CRITERIA) con su peso; el puntaje es
+        la suma ponderada de los criterios ya normalizados a [0, 1], calculada
+        en una sola pasada vectorizada.
+        """
+        score = np.zeros(len(self))
+        for name, weight in weights.items():
+            if weight:
+                score += weight * self.criteria[name]
+        return self.columns.top_k(score, k, mask)
+
+    def memory_report(self):
+        """
+        Memoria del catálogo: arreglos compartidos (mapeados desde disco) o
+        propios del proceso, y estructuras de Python que cada worker arma
+        aunque arranque desde la instantánea (corrector, vocabulario TF-IDF,
+        marcas), estimadas con sys.getsizeof.
+        """
+        arrays = (
+            list(self.columns.values.values()) + list(self.columns.valid.values())
+            + list(self.columns.tables.values()) + list(self.rankings.values())
+            + list(self.criteria.values()) + [self.sorted_prices]
+            + list(self.filters.values()) + list(self.filter_values.values()) + list(self.flags.values())
+            + list(self.indexes.values())
+        )
+        mapped = sum(array.nbytes for array in arrays if isinstance(array, np.memmap))
+        private = sum(array.nbytes for array in arrays if not isinstance(array, np.memmap))
+        if self._object_bytes is None:
+            self._object_bytes = sum(map(object_bytes, (
+                self.speller.words, self.speller.deletes, self.semantic.terms,
+                self.brand_index, self.brand_substrings, self.columns._decoded,
+            )))
+        return {
+            'source': self.source,
+            'phones': len(self),
+            'shared_mb': round(mapped / 2 ** 20, 2),
+            'private_arrays_mb': round(private / 2 ** 20, 2),
+            'private_objects_mb': round(self._object_bytes / 2 ** 20, 2),
+        }
+
+    def phone(self, pos):
+        """Teléfono en la posición indicada, como diccionario"""
+        return self.columns.row(pos)
+
+    def phones(self, positions):
+        return self.columns.rows(positions)
+
+    def _build_brand_index(self):
+        """
+        Índices de marca: nombre en minúsculas -> códigos de marca, y cada
+        subcadena de esos nombres -> códigos de las marcas que la contienen.
+        Las marcas son pocas y cortas, así que el índice de subcadenas es chico
+        y una consulta cuesta una búsqueda en diccionario.
+        """
+        self.brand_index = {}
+        self.brand_substrings = {}
+        self._brand_groups = []
+        self._brand_merged = {}
+        if not self.columns.has('brand_name'):
+            return
+
+        brand_table = [brand.lower() for brand in self.columns.table('brand_name')]
+        for code, brand in enumerate(brand_table):
+            self.brand_index.setdefault(brand, []).append(code)
+            substrings = {brand[i:j] for i in range(len(brand) + 1) for j in range(i, len(brand) + 1)}
+            for substring in substrings:
+                self.brand_substrings.setdefault(substring, []).append(code)
+
+        # Posiciones de cada marca como vistas sobre brand_order (ver _build_indexes)
+        order, bounds = self.indexes['brand_order'], self.indexes['brand_bounds'].tolist()
+        self._brand_groups = [order[bounds[code]:bounds[code + 1]] for code in range(len(brand_table))]
+
+    def _positions_for_brands(self, codes):
+        if len(codes) == 1:
+            return self._brand_groups[codes[0]]
+        key = tuple(codes)
+        if key not in self._brand_merged:
+            self._brand_merged[key] = np.sort(np.concatenate([self._brand_groups[code] for code in codes]))
+        return self._brand_merged[key]
+
+    def brand_in(self, text):
+        """
+        Marca que nombra el mensaje, como clave para brand_positions, o None.
+        Vale el mensaje completo (también parcial: 'sams' encontrará 'Samsung') o
+        una de sus palabras o pares de palabras ("modelos de samsung", "¿tienen
+        xiaomi?"): una búsqueda en diccionario por palabra.
+        """
+        text = text.lower().strip()
+        if text in self.brand_index or (text and text in self.brand_substrings):
+            return text
+        words = re.findall(r'\w+', text)
+        for i, word in enumerate(words):
+            for name in (' '.join(words[i:i + 2]), word):
+                if name in self.brand_index:
+                    return name
+        return None
+
+    def brand_positions(self, brand_query):
+        """
+        Posiciones de los teléfonos de una marca.
+        Primero coincidencia exacta y, si no hay, parcial (ej: 'sams' encontrará 'Samsung').
+        """
+        codes = self.brand_index.get(brand_query) or self.brand_substrings.get(brand_query)
+        if not codes:
+            return np.array([], dtype=np.intp)
+        return self._positions_for_brands(codes)
+
+
+def object_bytes(obj):
+    """Tamaño aproximado de un diccionario, lista o conjunto de Python con todo su contenido"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return size + sum(object_bytes(key) + object_bytes(value) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return size + sum(object_bytes(item) for item in obj)
+    return size
+
+
+def catalog_version(phones):
+    """Huella del contenido del catálogo"""
+    return hashlib.sha1(repr(phones).encode('utf-8')).hexdigest()[:12]
+
+
+def fetch_smartphones():
+    """Lee la tabla smartphones completa como lista de diccionarios"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT * FROM smartphones")
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def fetch_catalog_marker():
+    """
+    Marcador barato de cambios en la tabla smartphones.
+    Si CHATBOT_CATALOG_MARKER_SQL está definida se usa su resultado (en
+    cualquier motor); si no, en MySQL se usa CHECKSUM TABLE. En otros motores
+    sin esa consulta devuelve None y el gestor relee la tabla completa en cada
+    revisión para comparar la huella del contenido.
+    """
+    query = getattr(settings, 'CHATBOT_CATALOG_MARKER_SQL', None)
+    if query:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            # Como texto, para guardarlo tal cual en el meta de la instantánea
+            return repr(cursor.fetchone())
+    if connection.vendor != 'mysql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("CHECKSUM TABLE smartphones")
+        return cursor.fetchone()[1]
+
+
+class CatalogManager:
+    """
+    Mantiene la versión vigente del catálogo y la refresca en segundo plano.
+
+    Un hilo revisa periódicamente el marcador de cambios de la tabla; si
+    cambió, lee las filas y construye un Catalog nuevo con todos sus índices
+    fuera del camino de las peticiones. Solo cuando está completo se
+    reemplaza la referencia, así que una petición siempre ve un catálogo
+    entero (el anterior o el nuevo, nunca uno a medio construir).
+    """
+
+    # Segundos de espera antes de reintentar la carga inicial si la base de datos no respondió
+    retry_seconds = 5
+
+    def __init__(self, loader=fetch_smartphones, marker=fetch_catalog_marker, snapshot_dir=None):
+        self.loader = loader
+        self.marker = marker
+        self.snapshot_dir = snapshot_dir
+        self._snapshot = None
+        self._empty = Catalog([])
+        self._marker_value = None
+        self._retry_at = 0
+        self._init_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def current(self):
+        """Catálogo vigente; se carga en el primer uso y no al importar el módulo"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._initialize()
+        return snapshot
+
+    def _initialize(self):
+        # Solo un hilo hace la carga inicial; los demás esperan y reutilizan el resultado
+        with self._init_lock:
+            if self._snapshot is None and time.monotonic() >= self._retry_at:
+                # Arrancar desde la instantánea compartida si existe; si no, desde la base de datos
+                if not self.load_snapshot() and not self.refresh(force=True):
+                    self._retry_at = time.monotonic() + self.retry_seconds
+                self.start()
+        return self._snapshot if self._snapshot is not None else self._empty
+
+    def refresh(self, force=False):
+        """Reconstruye el catálogo si la tabla cambió. Devuelve True si hubo reemplazo"""
+        with self._refresh_lock:
+            try:
+                marker = self.marker()
+                if not force and marker is not None and marker == self._marker_value:
+                    return False
+
+                # Si otro worker ya publicó la instantánea de este estado de la tabla, mapearla
+                if not force and marker is not None and self.load_snapshot(marker=marker):
+                    return True
+
+                phones = self.loader()
+                version = catalog_version(phones)
+                if not force and self._snapshot is not None and version == self._snapshot.version:
+                    self._marker_value = marker
+                    return False
+
+                snapshot = Catalog(phones, version=version)
+                self._publish(snapshot, marker)
+            except Exception as e:
+                logger.error(f"Error al cargar smartphones: {str(e)}")
+                return False
+
+            # Reemplazo atómico: una sola asignación de referencia
+            self._snapshot = snapshot
+            self._marker_value = marker
+            logger.info(f"Catálogo {version} cargado con {len(snapshot)} celulares")
+            return True
+
+    def _snapshot_dir(self):
+        if self.snapshot_dir is not None:
+            return self.snapshot_dir
+        return getattr(settings, 'CHATBOT_CATALOG_SNAPSHOT_DIR', None)
+
+    def load_snapshot(self, marker=None):
+        """
+        Reemplaza el catálogo por la instantánea vigente en disco, si existe y
+        es distinta de la actual (y corresponde a marker, si se indica).
+        """
+        directory = self._snapshot_dir()
+        if not directory:
+            return False
+        current = current_snapshot(directory)
+        if not current or (marker is not None and current.get('marker') != marker):
+            return False
+        if self._snapshot is not None and self._snapshot.version == current['version']:
+            self._marker_value = current.get('marker')
+            return True
+        try:
+            snapshot = Catalog.from_snapshot(directory, current['version'])
+        except Exception as e:
+            logger.error(f"Error al leer la instantánea del catálogo: {str(e)}")
+            return False
+
+        # Una instantánea de una versión anterior del código no trae todos los índices: se completa
+        if not is_complete(directory, current['version']):
+            self._publish(snapshot, current.get('marker'))
+
+        self._snapshot = snapshot
+        self._marker_value = current.get('marker')
+        logger.info(f"Catálogo {snapshot.version} mapeado desde {directory} con {len(snapshot)} celulares")
+        return True
+
+    def _publish(self, snapshot, marker):
+        """
+        Guarda la instantánea para que los demás workers la mapeen en vez de
+        reconstruirla. Se llama antes de publicar el catálogo en este proceso.
+        """
+        directory = self._snapshot_dir()
+        if not directory or not len(snapshot):
+            return
+        try:
+            write_snapshot(snapshot, os.fspath(directory), marker=marker)
+            # Usar también aquí los arreglos mapeados, para no mantener además la copia privada
+            snapshot.use_snapshot(os.fspath(directory))
+        except Exception as e:
+            logger.error(f"Error al escribir la instantánea del catálogo: {str(e)}")
+
+    def start(self, interval=None):
+        """Inicia el hilo que revisa cambios cada `interval` segundos (0 lo desactiva)"""
+        if interval is None:
+            interval = getattr(settings, 'CHATBOT_CATALOG_REFRESH_SECONDS', 60)
+        if not interval or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll, args=(interval,), name='chatbot-catalog-refresh', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            finally:
+                # El hilo tiene su propia conexión; no dejarla abierta entre revisiones
+                connection.close()
+
+
+catalog_manager = CatalogManager()
+
+
+def warm_up():
+    """Carga el catálogo y arranca la revisión periódica antes de la primera petición"""
+    started = time.perf_counter()
+    catalog = catalog_manager.current()
+    logger.info(f"Catálogo precargado con {len(catalog)} celulares en {time.perf_counter() - started:.2f}s")
+    return catalog
+
+# Catálogo fijado para la petición en curso
+_pinned_catalog = contextvars.ContextVar('chatbot_catalog', default=None)
+
+
+def get_catalog():
+    """Catálogo de la petición en curso o, fuera de una petición, el más reciente"""
+    pinned = _pinned_catalog.get()
+    return pinned if pinned is not None else catalog_manager.current()
+
+
+@contextmanager
+def pinned_catalog():
+    """
+    Fija el catálogo vigente durante una petición, para que un reemplazo en
+    segundo plano no mezcle posiciones de dos versiones distintas.
+    También sirve como decorador: @pinned_catalog()
+    """
+    if _pinned_catalog.get() is not None:
+        yield _pinned_catalog.get()
+        return
+    token = _pinned_catalog.set(catalog_manager.current())
+    try:
+        yield _pinned_catalog.get()
+    finally:
+        _pinned_catalog.reset(token)
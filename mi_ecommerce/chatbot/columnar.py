@@ -0,0 +1,193 @@
+from decimal import Decimal
+
+import numpy as np
+
+NUMERIC_DTYPES = {
+    'bool': np.bool_,
+    'int': np.int64,
+    'float': np.float64,
+}
+
+
+def infer_kind(values):
+    """Deduce el tipo de una columna a partir de sus valores no nulos"""
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add('bool')
+        elif isinstance(value, int):
+            kinds.add('int')
+        elif isinstance(value, (float, Decimal)):
+            kinds.add('float')
+        else:
+            kinds.add('str')
+
+    if not kinds or 'str' in kinds:
+        return 'str'
+    if 'float' in kinds:
+        return 'float'
+    if 'int' in kinds:
+        return 'int'
+    return 'bool'
+
+
+class ColumnarCatalog:
+    """
+    Catálogo de smartphones almacenado por columnas.
+
+    Cada especificación numérica es un arreglo NumPy tipado con su máscara de
+    valores presentes, y cada columna de texto (marca, modelo, sistema...) se
+    guarda como códigos enteros sobre una tabla de cadenas únicas. Las filas
+    completas solo se materializan como diccionarios cuando se van a mostrar.
+    """
+
+    def __init__(self, size, column_names, kinds, values, valid, tables):
+        self.size = size
+        self.column_names = column_names
+        self.kinds = kinds
+        self.values = values    # columna -> valores numéricos o códigos de cadena
+        self.valid = valid      # columna -> máscara de valores no nulos
+        self.tables = tables    # columna de texto -> tabla de cadenas (UTF-8)
+        self._decoded = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Construye el catálogo columnar desde la lista de diccionarios de la consulta"""
+        size = len(rows)
+        column_names = list(rows[0].keys()) if rows else []
+        kinds, values, valid, tables = {}, {}, {}, {}
+
+        for name in column_names:
+            raw = [row.get(name) for row in rows]
+            kind = infer_kind(raw)
+            kinds[name] = kind
+
+            if kind == 'str':
+                lookup = {}
+                codes = np.fromiter(
+                    (-1 if v is None else lookup.setdefault(str(v), len(lookup)) for v in raw),
+                    dtype=np.int32, count=size
+                )
+                values[name] = codes
+                valid[name] = codes >= 0
+                tables[name] = np.array([s.encode('utf-8') for s in lookup] or [b''], dtype=np.bytes_)
+                continue
+
+            present = np.fromiter((v is not None for v in raw), dtype=np.bool_, count=size)
+            filled = [0 if v is None else (float(v) if isinstance(v, Decimal) else v) for v in raw]
+            array = np.array(filled, dtype=NUMERIC_DTYPES[kind])
+            if kind == 'int' and size:
+                # Usar el entero más pequeño que represente todo el rango
+                array = array.astype(np.promote_types(
+                    np.min_scalar_type(int(array.min())), np.min_scalar_type(int(array.max()))
+                ))
+            values[name] = array
+            valid[name] = present
+
+        return cls(size, column_names, kinds, values, valid, tables)
+
+    def __len__(self):
+        return self.size
+
+    def has(self, name):
+        return name in self.kinds
+
+    @property
+    def nbytes(self):
+        """Memoria ocupada por los arreglos del catálogo"""
+        arrays = list(self.values.values()) + list(self.valid.values()) + list(self.tables.values())
+        return sum(array.nbytes for array in arrays)
+
+    def table(self, name):
+        """Tabla de cadenas decodificada de una columna de texto"""
+        if name not in self._decoded:
+            self._decoded[name] = [s.decode('utf-8') for s in self.tables[name].tolist()]
+        return self._decoded[name]
+
+    def value(self, name, pos):
+        """Valor de una celda como tipo nativo de Python (None si es nulo)"""
+        if not self.valid[name][pos]:
+            return None
+        if self.kinds[name] == 'str':
+            return self.tables[name][self.values[name][pos]].decode('utf-8')
+        return self.values[name][pos].item()
+
+    def row(self, pos):
+        """Materializa una fila como diccionario, igual que las filas de la consulta SQL"""
+        pos = int(pos)
+        return {name: self.value(name, pos) for name in self.column_names}
+
+    def rows(self, positions):
+        return [self.row(pos) for pos in positions]
+
+    def strings(self, name):
+        """Valores de una columna de texto por fila ('' para nulos)"""
+        if not self.has(name):
+            return [''] * self.size
+        table = self.table(name)
+        return [table[code] if code >= 0 else '' for code in self.values[name].tolist()]
+
+    def numeric(self, name, fill=0):
+        """Columna numérica como float64, con los nulos reemplazados por fill"""
+        if not self.has(name) or self.kinds[name] == 'str':
+            return np.full(self.size, fill, dtype=np.float64)
+        return np.where(self.valid[name], self.values[name], fill).astype(np.float64)
+
+    def normalized(self, name, higher_is_better=True):
+        """
+        Columna numérica escalada a [0, 1] (mín-máx sobre los valores presentes).
+        1 es siempre el mejor valor; los nulos quedan en 0.
+        """
+        scaled = np.zeros(self.size, dtype=np.float64)
+        if not self.has(name) or self.kinds[name] == 'str' or not self.valid[name].any():
+            return scaled
+        present = self.valid[name]
+        column = self.values[name][present].astype(np.float64)
+        low, high = column.min(), column.max()
+        span = high - low
+        unit = (column - low) / span if span else np.ones_like(column)
+        scaled[present] = unit if higher_is_better else 1 - unit
+        return scaled
+
+    def truthy(self, name):
+        """Máscara de filas cuyo valor es verdadero en Python (no nulo, distinto de 0 o '')"""
+        if not self.has(name):
+            return np.zeros(self.size, dtype=np.bool_)
+        if self.kinds[name] == 'str':
+            lengths = np.char.str_len(self.tables[name])
+            codes = self.values[name]
+            return (codes >= 0) & (lengths[np.maximum(codes, 0)] > 0)
+        return self.valid[name] & (self.values[name] != 0)
+
+    def where(self, *names):
+        """Posiciones donde todas las columnas indicadas son verdaderas"""
+        mask = np.ones(self.size, dtype=np.bool_)
+        for name in names:
+            mask &= self.truthy(name)
+        return mask
+
+    def order(self, keys, mask=None):
+        """
+        Posiciones ordenadas de forma estable por varias claves.
+
+        keys va de la clave principal a la menos importante; para orden
+        descendente se pasa la columna negada.
+        """
+        positions = np.flatnonzero(mask) if mask is not None else np.arange(self.size)
+        if not keys or not len(positions):
+            return positions
+        return positions[np.lexsort([key[positions] for key in reversed(keys)])]
+
+    def top_k(self, key, k, mask=None):
+        """Las k posiciones con mayor valor de key (vectorizado con argpartition)"""
+        positions = np.flatnonzero(mask) if mask is not None else np.arange(self.size)
+        if k <= 0:
+            return positions[:0]
+        if len(positions) > k:
+            scores = key[positions]
+            best = np.argpartition(-scores, k - 1)[:k]
+            positions = positions[best]
+        # Ordenar los k finalistas de mayor a menor, desempatando por posición
+        return positions[np.lexsort((positions, -key[positions]))]
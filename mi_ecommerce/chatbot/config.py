@@ -1,4 +1,5 @@
 # chatbot/config.py
 import os
 
-OPENAI_API_KEY = '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'  # Aquí va tu clave de OpenAI
+# Clave de la API del modelo de lenguaje (OpenAI u OpenRouter); se lee del entorno para no guardarla en el repositorio
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
@@ -0,0 +1,112 @@
+"""
+Resolución de los teléfonos que menciona un mensaje.
+
+Buscar un modelo con tolerancia a errores es la parte cara de cada turno, así
+que se hace una sola vez: TurnEntities guarda las posiciones encontradas y el
+enrutamiento, la comparación y los detalles trabajan con esas posiciones en
+lugar de volver a buscar por nombre.
+"""
+import re
+from functools import cached_property
+
+from .catalog import get_catalog
+from .metrics import metrics
+from .response_cache import normalize_query
+
+# Términos que separan los modelos en una comparación
+COMPARISON_TERMS = re.compile(
+    r'(comparar|compara|comparemos|comparación|vs|versus|contra|frente a|diferencia|diferencias|comparativa|cuál es mejor|cuál es la diferencia)'
+)
+SEPARATORS = re.compile(r'[,&/]| y | con ')
+
+# Máximo de teléfonos en una comparación, para no saturar la tabla
+MAX_COMPARED = 4
+
+
+def find_exact_position(query, catalog=None):
+    """Posición del teléfono cuyo modelo, o marca + modelo, es exactamente la consulta, o None"""
+    catalog = catalog or get_catalog()
+    query_lower = query.lower().strip()
+
+    # 1. Coincidencia exacta en modelos (case insensitive)
+    pos = catalog.phone_index.get(query_lower)
+    if pos is None:
+        # 2. Coincidencia exacta en marca + modelo
+        pos = catalog.full_name_index.get(query_lower)
+    return pos
+
+
+def find_phone_position(query, catalog=None):
+    """Posición en el catálogo del teléfono que coincide con la consulta, o None"""
+    catalog = catalog or get_catalog()
+    query_lower = query.lower().strip()
+
+    pos = find_exact_position(query_lower, catalog)
+    if pos is not None:
+        metrics.count('model_lookup_exact')
+        return pos
+
+    # 3. Búsqueda aproximada con tolerancia a errores: el índice de n-gramas
+    # preselecciona unos pocos candidatos y solo a ellos se les calcula la similitud
+    pos = catalog.fuzzy_index.best_match(query_lower, threshold=0.6)  # Umbral de similitud
+    metrics.count('model_lookup_fuzzy' if pos is not None else 'model_lookup_miss')
+    return pos
+
+
+def unique(positions):
+    """Posiciones sin repetir, en el orden en que aparecen"""
+    seen = set()
+    return [pos for pos in positions if not (pos in seen or seen.add(pos))]
+
+
+class TurnEntities:
+    """
+    Teléfonos mencionados en un mensaje, resueltos como mucho una vez por turno.
+
+    Cada búsqueda se hace la primera vez que alguien la pide y queda guardada,
+    así que un mensaje que se enruta a una respuesta cacheada no paga la
+    búsqueda del modelo. Las posiciones son del catálogo fijado al crearla.
+    """
+
+    def __init__(self, text, catalog=None):
+        self.text = text
+        self.catalog = catalog or get_catalog()
+
+    @cached_property
+    def comparison(self):
+        """(posiciones a comparar, nombres que no se encontraron)"""
+        query_lower = self.text.lower()
+
+        # Limpiar términos de comparación y dividir por comas y otros separadores
+        clean_query = COMPARISON_TERMS.sub(',', query_lower)
+        candidates = [m.strip() for m in SEPARATORS.split(clean_query) if m.strip()]
+
+        # Si hay al menos dos candidatos, buscar el modelo real más parecido a cada uno
+        if len(candidates) >= 2:
+            found, missing = [], []
+            for candidate in candidates:
+                pos = find_phone_position(candidate, self.catalog)
+                if pos is not None:
+                    found.append(pos)
+                else:
+                    missing.append(candidate)
+            return unique(found)[:MAX_COMPARED], missing
+
+        # Si no, buscar modelos conocidos en el mensaje completo (solo entre los candidatos del índice)
+        found = unique(self.catalog.fuzzy_index.model_matches(query_lower, threshold=0.7))
+        return (found[:MAX_COMPARED] if len(found) >= 2 else []), []
+
+    @property
+    def compared(self):
+        """Posiciones de los teléfonos a comparar"""
+        return self.comparison[0]
+
+    @cached_property
+    def model(self):
+        """Posición del teléfono que nombra el mensaje completo, o None"""
+        return find_phone_position(normalize_query(self.text), self.catalog)
+
+    @cached_property
+    def exact_model(self):
+        """Si el mensaje completo es el nombre exacto de un modelo (sin tolerancia a errores)"""
+        return find_exact_position(normalize_query(self.text), self.catalog) is not None
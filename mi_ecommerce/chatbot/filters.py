@@ -0,0 +1,217 @@
+"""
+Consultas con varias condiciones a la vez.
+
+parse_filters convierte un mensaje como "5G con 8GB de RAM y más de 5000 mAh
+por menos de 20000" en una conjunción de predicados sobre las columnas de la
+tabla smartphones, y filter_positions la evalúa con los índices que el
+catálogo ya trae armados: valores ordenados por columna (búsqueda binaria)
+y mapas de bits para las columnas sí/no. Se parte del predicado más
+selectivo y el resto solo se comprueba sobre esos candidatos.
+"""
+import math
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from .catalog import CRITERIA
+from .prices import parse_number, parse_price_range
+
+# Condición low <= columna <= high. Para las columnas sí/no low = high = 1;
+# para la marca, low = high = nombre de la marca en minúsculas.
+Predicate = namedtuple('Predicate', 'column low high')
+
+_AT_LEAST = r'más de|mas de|mayor a|mayor que|mayores a|al menos|mínimo|minimo|desde|arriba de'
+_AT_MOST = r'menos de|menor a|menor que|menores a|máximo|maximo|hasta|no más de|no mas de|debajo de'
+_OPERATOR = rf'(?:(?P<most>{_AT_MOST})|(?P<least>{_AT_LEAST}))?\s*(?:de\s+)?'
+_NUMBER = r'(?P<number>\d+(?:[.,]\d+)*)'
+
+# Especificaciones con unidad: columna -> expresión con el número
+SPECS = {
+    'ram_capacity': rf'{_OPERATOR}{_NUMBER}\s*gb\s*(?:de\s+)?ram\b',
+    'internal_memory': rf'{_OPERATOR}{_NUMBER}\s*(?P<unit>gb|tb)\b',
+    'battery_capacity': rf'{_OPERATOR}{_NUMBER}\s*mah\b',
+    'primary_camera_front': rf'{_OPERATOR}{_NUMBER}\s*mp\s*(?:de\s+)?(?:cámara\s+)?(?:frontal|selfie)',
+    'primary_camera_rear': rf'{_OPERATOR}{_NUMBER}\s*mp\b',
+    'screen_size': rf'{_OPERATOR}{_NUMBER}\s*(?:pulgadas|pulg\b|")',
+    'refresh_rate': rf'{_OPERATOR}{_NUMBER}\s*hz\b',
+    'fast_charging': rf'{_OPERATOR}{_NUMBER}\s*w\b',
+    'processor_speed': rf'{_OPERATOR}{_NUMBER}\s*ghz\b',
+}
+_SPECS = [(column, re.compile(pattern)) for column, pattern in SPECS.items()]
+SPEC_COLUMNS = set(SPECS)
+
+# Columnas sí/no y las frases que las piden
+FLAGS = {
+    '5G_or_not': re.compile(r'\b5\s?g\b'),
+    'fast_charging_available': re.compile(r'carga rápida|carga rapida'),
+    'extended_memory_available': re.compile(r'memoria expandible|micro\s?sd|memoria externa'),
+}
+
+# Criterio de orden de los resultados según las columnas filtradas
+COLUMN_CRITERIA = {
+    column: criterion for criterion, columns in CRITERIA.items() for column, _ in columns
+}
+
+# Textos para describir cada columna en la respuesta (nombre, unidad)
+LABELS = {
+    'price': ('precio', '$'),
+    'ram_capacity': ('RAM', 'GB'),
+    'internal_memory': ('almacenamiento', 'GB'),
+    'battery_capacity': ('batería', 'mAh'),
+    'primary_camera_rear': ('cámara trasera', 'MP'),
+    'primary_camera_front': ('cámara frontal', 'MP'),
+    'screen_size': ('pantalla', '"'),
+    'refresh_rate': ('tasa de refresco', 'Hz'),
+    'fast_charging': ('carga rápida', 'W'),
+    'processor_speed': ('procesador', 'GHz'),
+    '5G_or_not': ('5G', None),
+    'fast_charging_available': ('carga rápida', None),
+    'extended_memory_available': ('memoria expandible', None),
+}
+
+
+def _spec_value(match):
+    # Decimales igual en todas las columnas ("2.5 GHz", "6,7 pulgadas", "12.000 mAh")
+    value = parse_number(match.group('number'))
+    if match.groupdict().get('unit') == 'tb':
+        value *= 1024
+    return value
+
+
+def parse_filters(text, catalog=None):
+    """
+    Predicados que menciona el mensaje (vacío si ninguno).
+
+    Sin comparativo, una especificación se toma como mínimo ("8GB de RAM" es
+    "8GB o más"). Las cifras de las especificaciones se quitan del texto antes
+    de buscar el rango de precios, para que "más de 5000 mAh" no sea un precio.
+    """
+    text = text.lower()
+    predicates = []
+    for column, pattern in _SPECS:
+        match = pattern.search(text)
+        if match is None:
+            continue
+        value = _spec_value(match)
+        if value is None:
+            continue
+        if match.group('most'):
+            predicates.append(Predicate(column, 0, value))
+        else:
+            predicates.append(Predicate(column, value, math.inf))
+        text = text[:match.start()] + ' ' * (match.end() - match.start()) + text[match.end():]
+
+    for column, pattern in FLAGS.items():
+        if pattern.search(text):
+            predicates.append(Predicate(column, 1, 1))
+
+    price_range = parse_price_range(text)
+    if price_range:
+        predicates.append(Predicate('price', *price_range))
+
+    if catalog is not None:
+        # Marcas nombradas como palabra completa ("samsung con 5g")
+        for word in set(re.findall(r'\w+', text)):
+            if word in catalog.brand_index:
+                predicates.append(Predicate('brand_name', word, word))
+    return predicates
+
+
+def is_structured(predicates):
+    """Si los predicados piden un filtro propio: una especificación con unidad o varias condiciones"""
+    return len(predicates) >= 2 or any(p.column in SPEC_COLUMNS for p in predicates)
+
+
+def _candidates(catalog, predicate):
+    """Posiciones que cumplen un predicado, usando el índice de su columna"""
+    column, low, high = predicate
+    if column == 'brand_name':
+        return catalog.brand_positions(low)
+    if column in catalog.flags:
+        return np.flatnonzero(catalog.flags[column])
+    values = catalog.filter_values[column]
+    start = np.searchsorted(values, low, side='left')
+    end = np.searchsorted(values, high, side='right')
+    return catalog.filters[column][start:end]
+
+
+def _estimated_size(catalog, predicate):
+    column, low, high = predicate
+    if column == 'brand_name':
+        return len(catalog.brand_positions(low))
+    if column in catalog.flags:
+        return catalog.flag_counts[column]
+    values = catalog.filter_values[column]
+    return int(np.searchsorted(values, high, side='right') - np.searchsorted(values, low, side='left'))
+
+
+def _check(catalog, predicate, positions):
+    """Máscara de las posiciones que cumplen el predicado (sin recorrer todo el catálogo)"""
+    column, low, high = predicate
+    if column == 'brand_name':
+        codes = catalog.brand_index.get(low, [])
+        return np.isin(catalog.columns.values['brand_name'][positions], codes)
+    if column in catalog.flags:
+        return catalog.flags[column][positions]
+    values = catalog.columns.values[column][positions]
+    return catalog.columns.valid[column][positions] & (values >= low) & (values <= high)
+
+
+def filter_positions(catalog, predicates):
+    """
+    Posiciones que cumplen todos los predicados, ordenadas de mejor a peor
+    según los criterios de las columnas filtradas (o todos si no hay ninguno).
+    """
+    predicates = [Predicate(*p) for p in predicates]
+    usable = [
+        p for p in predicates
+        if p.column == 'brand_name' or p.column in catalog.flags or p.column in catalog.filters
+    ]
+    if not usable:
+        return np.array([], dtype=np.intp)
+
+    # Partir del predicado más selectivo y comprobar los demás solo sobre sus candidatos
+    usable.sort(key=lambda p: _estimated_size(catalog, p))
+    positions = np.asarray(_candidates(catalog, usable[0]))
+    for predicate in usable[1:]:
+        if not len(positions):
+            break
+        positions = positions[_check(catalog, predicate, positions)]
+
+    criteria = {COLUMN_CRITERIA[p.column] for p in usable if p.column in COLUMN_CRITERIA} or set(CRITERIA)
+    score = np.zeros(len(positions))
+    for name in criteria:
+        score += catalog.criteria[name][positions]
+    # Mejor puntaje primero; a igual puntaje, orden del catálogo
+    return positions[np.lexsort((positions, -score))]
+
+
+def _amount(value, unit):
+    number = f"{value:,.0f}" if float(value).is_integer() else f"{value:g}"
+    if unit == '$':
+        return f"${number}"
+    if unit == '"':
+        return f'{number}"'
+    return f"{number} {unit}"
+
+
+def describe_filters(predicates):
+    """Descripción en español de cada predicado ("RAM desde 8 GB", "precio de hasta $20,000")"""
+    parts = []
+    for column, low, high in predicates:
+        if column == 'brand_name':
+            parts.append(f"marca {low.title()}")
+            continue
+        label, unit = LABELS.get(column, (column, ''))
+        if unit is None:
+            parts.append(f"con {label}")
+            continue
+
+        if math.isinf(high):
+            parts.append(f"{label} desde {_amount(low, unit)}")
+        elif low <= 0:
+            parts.append(f"{label} de hasta {_amount(high, unit)}")
+        else:
+            parts.append(f"{label} entre {_amount(low, unit)} y {_amount(high, unit)}")
+    return parts
@@ -0,0 +1,92 @@
+"""
+Mensajes que se refieren a la última lista mostrada.
+
+"detalles del 2", "compara el 1 y el 3", "el último", "¿cuánto cuesta ese?"
+no nombran ningún modelo: señalan un número de la lista anterior o el
+teléfono del que se acaba de hablar. Se resuelven por índice sobre las
+posiciones que la sesión guardó, sin buscar en el catálogo.
+"""
+import re
+from collections import namedtuple
+
+# Referencias encontradas en un mensaje: números como se mostraron (-1 = el último),
+# si señala al teléfono del que se venía hablando ("ese", "compáralo"), si pide
+# comparar y el resto del mensaje sin las referencias (para ver si además nombra un modelo)
+FollowUp = namedtuple('FollowUp', 'numbers pronoun compare rest')
+
+ORDINAL_WORDS = {
+    'primero': 1, 'primer': 1, 'primera': 1, 'segundo': 2, 'segunda': 2,
+    'tercero': 3, 'tercer': 3, 'tercera': 3, 'cuarto': 4, 'cuarta': 4,
+    'quinto': 5, 'quinta': 5, 'sexto': 6, 'sexta': 6, 'séptimo': 7, 'septimo': 7,
+    'octavo': 8, 'noveno': 9, 'décimo': 10, 'decimo': 10,
+    'último': -1, 'ultimo': -1, 'última': -1, 'ultima': -1,
+}
+
+# Lo que sigue al número indica que es una característica ("el 8 gb") o parte
+# del nombre de un modelo ("el 12 pro max", "el 13 mini") y no un lugar en la lista
+_NOT_REF = (
+    r'(?!\s*(?:gb|tb|mp|mah|hz|w|pulgadas|%|mil|k|g'
+    r'|pro|max|plus|ultra|lite|mini|neo|prime|power|play|fold|flip|note|edge|gt|se|fe'
+    r'|[a-z]*\d+[a-z]*|[a-df-np-xz])\b)'
+)
+_NUMBER_REF = re.compile(
+    rf'(?:\b(?:el|la|del|al|número|numero|opción|opcion|modelo)\s*|#)(\d{{1,2}})\b{_NOT_REF}'
+)
+# Números siguientes en una enumeración ("el 1, 3 y 4"), solo si ya hubo una referencia
+_MORE_NUMBERS = re.compile(rf'(?:,|\by\b|\be\b|\bcon\b|\bvs\b|\bcontra\b)\s*(?:el\s+|la\s+)?(\d{{1,2}})\b{_NOT_REF}')
+_ORDINALS = re.compile(r'\b(' + '|'.join(ORDINAL_WORDS) + r')\b')
+# "este"/"esta" solo cuentan solos o con un sustantivo que nombre al teléfono: sin tilde
+# "esta" suele ser el verbo ("¿cuánto esta el iPhone?") y "este" un adjetivo ("este año")
+_PRONOUNS = re.compile(
+    r'\b(?:ése|ésa|éste|ésta|aquel|aquél|compáralo|comparalo)\b'
+    r'|\b(?:ese|esa)(?:\s+(?:modelo|celular|teléfono|telefono|equipo))?\b'
+    r'|\b(?:este|esta)(?:\s+(?:modelo|celular|teléfono|telefono|equipo)\b|\s*(?=[?!.,]|$))'
+)
+_COMPARE = re.compile(r'\b(?:compar\w*|vs|versus|contra|diferencias?)\b')
+
+# Mensajes más largos que esto no se toman como referencia a la lista
+MAX_WORDS = 12
+
+
+def parse_followup(text):
+    """Referencias a la lista anterior que contiene el mensaje, o None si no hay ninguna"""
+    text = text.lower()
+    if len(text.split()) > MAX_WORDS:
+        return None
+
+    found = []
+    spans = []
+    for match in _NUMBER_REF.finditer(text):
+        found.append((match.start(), int(match.group(1))))
+        spans.append(match.span())
+    if found:
+        for match in _MORE_NUMBERS.finditer(text, found[0][0]):
+            found.append((match.start(), int(match.group(1))))
+            spans.append(match.span())
+    for match in _ORDINALS.finditer(text):
+        found.append((match.start(), ORDINAL_WORDS[match.group(1)]))
+        spans.append(match.span())
+    pronouns = list(_PRONOUNS.finditer(text))
+    spans.extend(match.span() for match in pronouns)
+
+    numbers = list(dict.fromkeys(number for _, number in sorted(found)))
+    if not numbers and not pronouns:
+        return None
+    rest = text
+    for start, end in spans:
+        rest = rest[:start] + ' ' * (end - start) + rest[end:]
+    return FollowUp(numbers, bool(pronouns), bool(_COMPARE.search(text)), ' '.join(rest.split()))
+
+
+def pick(positions, first, number):
+    """
+    Posición del teléfono que se mostró con ese número, o None si no estaba en la lista.
+    En una página de "ver más" (6 a 10) también vale contar desde 1 ("el 2" = el 7).
+    """
+    if number == -1:
+        return positions[-1] if positions else None
+    if first <= number < first + len(positions):
+        return positions[number - first]
+    if 1 <= number <= len(positions):
+        return positions[number - 1]
+    return None
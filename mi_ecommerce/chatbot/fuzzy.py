@@ -0,0 +1,184 @@
+import hashlib
+from difflib import SequenceMatcher
+
+import numpy as np
+
+
+def name_hash(text):
+    """Huella de 64 bits de un nombre, igual en todos los procesos (hash() cambia entre procesos)"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def grams(text, n=3):
+    """Conjunto de n-gramas de un texto, con relleno en los bordes"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NameLookup:
+    """
+    Búsqueda exacta de nombres en minúsculas -> posición.
+
+    En lugar de un diccionario de Python por worker, guarda las huellas de los
+    nombres ordenadas junto con su posición, así que son dos arreglos que se
+    pueden mapear desde la instantánea. name_of(pos) da el nombre guardado y se
+    usa para confirmar la coincidencia.
+    """
+
+    def __init__(self, hashes, positions, name_of):
+        self.hashes = hashes
+        self.positions = positions
+        self.name_of = name_of
+
+    @staticmethod
+    def build(names, keep='first'):
+        """
+        (huellas, posiciones) de una lista de nombres por posición.
+        Con nombres repetidos gana el primero o el último (keep='last').
+        """
+        hashes = np.fromiter((name_hash(name) for name in names), dtype=np.uint64, count=len(names))
+        positions = np.arange(len(names), dtype=np.int32)
+        if keep == 'last':
+            hashes, positions = hashes[::-1], positions[::-1]
+        order = np.argsort(hashes, kind='stable')
+        hashes, positions = hashes[order], positions[order]
+        first = np.ones(len(hashes), dtype=np.bool_)
+        first[1:] = hashes[1:] != hashes[:-1]
+        return hashes[first], positions[first]
+
+    def get(self, name):
+        """Posición con ese nombre exacto, o None"""
+        key = np.uint64(name_hash(name))
+        i = int(np.searchsorted(self.hashes, key))
+        if i < len(self.hashes) and self.hashes[i] == key:
+            pos = int(self.positions[i])
+            if self.name_of(pos) == name:
+                return pos
+        return None
+
+
+class FuzzyIndex:
+    """
+    Índice invertido de n-gramas sobre marca + modelo.
+
+    En lugar de comparar la consulta contra todo el catálogo, se buscan los
+    n-gramas de la consulta en el índice, se preseleccionan los teléfonos con
+    más n-gramas en común y solo sobre esos pocos candidatos se calcula la
+    similitud exacta con SequenceMatcher.
+
+    Las listas de posiciones se guardan en formato CSR (n-gramas ordenados,
+    desplazamientos y todas las posiciones en un solo arreglo) para poder
+    guardarlas en la instantánea y mapearlas; lengths tiene el largo de cada
+    nombre completo para el desempate. names_of(pos) devuelve (marca + modelo,
+    solo modelo) en minúsculas.
+    """
+
+    def __init__(self, gram_keys, offsets, positions, lengths, names_of, n=3, max_candidates=24, scan_budget=10000):
+        self.gram_keys = gram_keys
+        self.offsets = offsets
+        self.positions = positions
+        self.lengths = lengths
+        self.names_of = names_of
+        self.n = n
+        self.max_candidates = max_candidates
+        self.scan_budget = scan_budget
+
+    @staticmethod
+    def build(names, n=3):
+        """
+        (n-gramas, desplazamientos, posiciones, largo del nombre completo por
+        posición) de una lista de (marca, modelo) por posición
+        """
+        postings = {}
+        lengths = []
+        for pos, (brand, model) in enumerate(names):
+            model = model.lower()
+            full_name = f"{brand.lower()} {model}"
+            lengths.append(len(full_name))
+            for gram in grams(full_name, n) | grams(model, n):
+                postings.setdefault(gram, []).append(pos)
+
+        keys = sorted(postings)
+        sizes = np.array([len(postings[gram]) for gram in keys], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        # Las posiciones de cada n-grama quedan ya ordenadas (4 bytes por entrada)
+        positions = np.fromiter(
+            (pos for gram in keys for pos in postings[gram]), dtype=np.int32, count=int(offsets[-1])
+        )
+        return np.array(keys, dtype=f'<U{n}'), offsets, positions, np.array(lengths, dtype=np.int32)
+
+    def grams(self, text):
+        """Devuelve el conjunto de n-gramas de un texto, con relleno en los bordes"""
+        return grams(text, self.n)
+
+    def _postings(self, query):
+        """Listas de posiciones de los n-gramas de la consulta que están en el índice"""
+        grams = sorted(self.grams(query))
+        found = np.searchsorted(self.gram_keys, grams)
+        return [
+            self.positions[self.offsets[i]:self.offsets[i + 1]]
+            for gram, i in zip(grams, found.tolist())
+            if i < len(self.gram_keys) and self.gram_keys[i] == gram
+        ]
+
+    def candidates(self, query):
+        """
+        Preselecciona las posiciones con más n-gramas en común con la consulta.
+
+        Los n-gramas se recorren del más raro al más frecuente y se deja de
+        acumular cuando se supera el presupuesto de entradas, de modo que el
+        costo no depende del tamaño del catálogo.
+        """
+        postings = sorted(self._postings(query), key=len)
+        selected = []
+        scanned = 0
+        for ids in postings:
+            if selected and scanned + len(ids) > self.scan_budget:
+                break
+            selected.append(ids)
+            scanned += len(ids)
+
+        if not selected:
+            return []
+
+        # Más n-gramas en común primero (a igual cantidad, orden del catálogo)
+        ids, counts = np.unique(np.concatenate(selected), return_counts=True)
+        pool = np.argsort(-counts, kind='stable')[:self.max_candidates * 4]
+        ids, counts = ids[pool], counts[pool]
+
+        # Desempate: nombres de longitud parecida a la consulta primero
+        order = np.lexsort((np.abs(self.lengths[ids] - len(query)), -counts))
+        # Conservar el orden del catálogo para desempatar igual que el recorrido lineal
+        return sorted(ids[order[:self.max_candidates]].tolist())
+
+    @staticmethod
+    def score(matcher, text, floor):
+        """Similitud exacta, descartando antes con las cotas superiores baratas de difflib"""
+        matcher.set_seq2(text)
+        if matcher.real_quick_ratio() <= floor or matcher.quick_ratio() <= floor:
+            return 0
+        return matcher.ratio()
+
+    def best_match(self, query, threshold=0.6):
+        """Posición del teléfono más parecido a la consulta (marca + modelo o solo modelo)"""
+        best_pos = None
+        best_score = 0
+        matcher = SequenceMatcher(None, query)
+        for pos in self.candidates(query):
+            full_name, model_only = self.names_of(pos)
+            floor = max(best_score, threshold)
+            current_score = max(self.score(matcher, full_name, floor), self.score(matcher, model_only, floor))
+            if current_score > best_score and current_score > threshold:
+                best_score = current_score
+                best_pos = pos
+        return best_pos
+
+    def model_matches(self, query, threshold=0.7):
+        """Posiciones cuyo modelo supera el umbral de similitud con la consulta"""
+        matcher = SequenceMatcher(None, query)
+        return [
+            pos for pos in self.candidates(query)
+            if self.score(matcher, self.names_of(pos)[1], threshold) > threshold
+        ]
@@ -0,0 +1,109 @@
+from collections import deque
+
+# Vocabulario de cada intención. Las coincidencias son por subcadena sobre el
+# mensaje en minúsculas, igual que los antiguos `any(term in query_lower ...)`.
+INTENT_TERMS = {
+    'greeting': ['hola', 'buenos días', 'buenas tardes'],
+    'farewell': ['gracias', 'adiós', 'hasta luego', 'chao'],
+    'help': ['ayuda', 'qué puedes hacer', 'opciones'],
+    'comparison': [
+        'comparar', 'compara', 'comparemos', 'comparación',
+        'vs', 'versus', 'contra', 'frente a',
+        'diferencia', 'diferencias', 'comparativa',
+        'cuál es mejor', 'cuál es la diferencia'
+    ],
+    'brand_listing': ['modelos de', 'modelos', 'celulares de', 'teléfonos de'],
+    'price': ['económi', 'barat', 'precio'],
+    'camera': ['cámara', 'camara', 'foto', 'fotografía'],
+    'display': ['pantalla', 'display', 'pantall'],
+    'battery': ['batería', 'bateria', 'duraci'],
+    '5g': ['5g', '5 g'],
+    'performance': ['ram', 'procesador', 'rendimiento', 'velocidad'],
+    'recommendation': ['recomienda', 'sugiere', 'mejor'],
+    'more': ['ver más', 'ver mas', 'muestra más', 'muestra mas', 'muéstrame más', 'muestrame mas', 'siguientes'],
+
+    # Variantes que usan las opciones contextuales
+    'start': ['hola', 'buenos días', 'inicio'],
+    'compare_option': ['comparar', 'vs', 'versus', 'diferencia'],
+    'suggest': ['recomienda', 'sugiere'],
+
+    # Matices dentro de los manejadores
+    'speed': ['velocidad', 'rápido', 'juegos', 'rendimiento'],
+    'selfie': ['selfie', 'frontal'],
+    'low_price': ['bajo', 'económi'],
+    'mid_price': ['medio', 'intermedio'],
+    'gaming': ['gaming'],
+}
+
+# Términos que son raíces y no palabras completas (el corrector ortográfico no los propone)
+INTENT_STEMS = {'económi', 'barat', 'pantall', 'duraci'}
+
+# Intenciones que por sí solas cambian el rumbo de la conversación (saludo, despedida,
+# modo comparación, "ver más"...): el corrector nunca convierte otra palabra en uno de sus términos
+ROUTING_INTENTS = {'greeting', 'farewell', 'help', 'comparison', 'brand_listing', 'more', 'start', 'compare_option'}
+
+# Intenciones que piden una característica: con ellas una marca suelta no es un listado de la marca
+FEATURE_INTENTS = {'price', 'camera', 'display', 'battery', '5g', 'performance', 'recommendation', 'speed', 'selfie'}
+
+
+class KeywordAutomaton:
+    """
+    Autómata Aho-Corasick construido con todos los vocabularios de intención.
+
+    Recorre el mensaje una sola vez y devuelve todas las intenciones cuyos
+    términos aparecen en él, sin importar cuántos términos haya en total.
+    """
+
+    def __init__(self, vocabularies):
+        self.goto = [{}]
+        self.fail = [0]
+        outputs = [set()]
+
+        for intent, terms in vocabularies.items():
+            for term in terms:
+                state = 0
+                for char in term:
+                    next_state = self.goto[state].get(char)
+                    if next_state is None:
+                        next_state = len(self.goto)
+                        self.goto.append({})
+                        self.fail.append(0)
+                        outputs.append(set())
+                        self.goto[state][char] = next_state
+                    state = next_state
+                outputs[state].add(intent)
+
+        # Enlaces de fallo por niveles (BFS), heredando las salidas del sufijo
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                outputs[next_state] |= outputs[self.fail[next_state]]
+
+        self.outputs = [frozenset(output) for output in outputs]
+
+    def scan(self, text):
+        """Conjunto de intenciones presentes en el texto (una sola pasada)"""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        hits = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                hits |= outputs[state]
+        return frozenset(hits)
+
+
+intent_automaton = KeywordAutomaton(INTENT_TERMS)
+
+
+def detect_intents(text):
+    """Intenciones presentes en un mensaje del usuario"""
+    return intent_automaton.scan(text.lower())
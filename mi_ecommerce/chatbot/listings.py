@@ -0,0 +1,109 @@
+import contextvars
+import math
+from contextlib import contextmanager
+
+import numpy as np
+
+from .filters import filter_positions
+
+# Teléfonos por página en listados y en cada "ver más"
+PAGE_SIZE = 5
+
+# Listado que ofrece la respuesta en curso (para poder continuarlo con "ver más")
+# y teléfonos que numera (para resolver "detalles del 2")
+_offered_listing = contextvars.ContextVar('chatbot_listing', default=None)
+
+
+@contextmanager
+def recording_listing():
+    """Recoge el listado y los resultados que muestre la respuesta generada dentro del bloque"""
+    box = {}
+    token = _offered_listing.set(box)
+    try:
+        yield box
+    finally:
+        _offered_listing.reset(token)
+
+
+def offer_more(listing):
+    """Marca que la respuesta en curso muestra la primera página de listing"""
+    box = _offered_listing.get()
+    if box is not None and listing is not None:
+        box['listing'] = listing
+
+
+def show_results(positions, first=1, numbered=True):
+    """
+    Marca que la respuesta en curso muestra esos teléfonos numerados desde
+    first, o uno solo sin numerar (numbered=False, la ficha de un modelo)
+    """
+    box = _offered_listing.get()
+    if box is not None and positions is not None:
+        box['results'] = ([int(pos) for pos in positions], first, numbered)
+
+
+def affine_permutation(size, rng):
+    """
+    Parámetros (a, b) de la permutación i -> (a*i + b) % size.
+
+    Con a coprimo con size recorre todas las posiciones sin repetir, así que
+    sirve para muestrear páginas al azar sin barajar ni copiar la lista completa.
+    """
+    if size <= 1:
+        return 1, 0
+    a = rng.randrange(1, size)
+    while math.gcd(a, size) != 1:
+        a = rng.randrange(1, size)
+    return a, rng.randrange(size)
+
+
+def listing_positions(catalog, listing, start, k=PAGE_SIZE):
+    """
+    Posiciones de la página [start, start + k) de un listado. Cuesta O(k):
+    las vistas ordenadas y los grupos por marca ya están en el catálogo.
+    Los filtros y las búsquedas por texto se vuelven a evaluar, con costo
+    proporcional a sus candidatos.
+    """
+    kind = listing['kind']
+    if kind == 'ranking':
+        return catalog.rankings[listing['name']][start:start + k]
+    if kind == 'price_range':
+        ranking = catalog.rankings['price']
+        first = np.searchsorted(catalog.sorted_prices, listing['low'], side='left')
+        end = np.searchsorted(catalog.sorted_prices, listing['high'], side='right')
+        return ranking[min(first + start, end):min(first + start + k, end)]
+    if kind == 'brand':
+        phone_ids = catalog.brand_positions(listing['brand'])
+        size = len(phone_ids)
+        steps = np.arange(start, min(start + k, size), dtype=np.int64)
+        return phone_ids[(listing['a'] * steps + listing['b']) % max(size, 1)]
+    if kind == 'filter':
+        return filter_positions(catalog, listing['predicates'])[start:start + k]
+    if kind == 'semantic':
+        return catalog.semantic.page(listing['query'], start, k)[0]
+    raise ValueError(f"Tipo de listado desconocido: {kind}")
+
+
+def listing_size(catalog, listing):
+    """Cantidad total de teléfonos del listado"""
+    kind = listing['kind']
+    if kind == 'ranking':
+        return len(catalog.rankings[listing['name']])
+    if kind == 'price_range':
+        first = np.searchsorted(catalog.sorted_prices, listing['low'], side='left')
+        end = np.searchsorted(catalog.sorted_prices, listing['high'], side='right')
+        return int(end - first)
+    if kind == 'filter':
+        if 'total' in listing:
+            return listing['total']
+        return len(filter_positions(catalog, listing['predicates']))
+    if kind == 'semantic':
+        return listing['total']
+    return len(catalog.brand_positions(listing['brand']))
+
+
+def has_more(catalog, listing, start):
+    """Si al listado (de esta versión del catálogo) le quedan teléfonos desde start"""
+    if listing.get('version', catalog.version) != catalog.version:
+        return False
+    return start < listing_size(catalog, listing)
@@ -0,0 +1,322 @@
+"""
+Respaldo opcional con un modelo de lenguaje para preguntas que el chatbot no entiende.
+
+Se usa una API compatible con /chat/completions de OpenAI (OpenAI, OpenRouter
+o un servidor local). El prompt se arma con datos del catálogo (resumen y los
+teléfonos más parecidos a la pregunta) para que el modelo no invente modelos
+ni precios.
+
+Para no bloquear a los workers ni disparar la latencia:
+
+- un único cliente HTTP asíncrono (httpx) por proceso, con su pool de
+  conexiones, vive en un hilo con su propio event loop,
+- las vistas síncronas nunca esperan al modelo: usan la respuesta cacheada
+  si la hay y, si no, piden una en segundo plano (queda en la caché para la
+  próxima vez) y contestan enseguida con la respuesta genérica,
+- solo el chat en streaming (asíncrono) espera la respuesta, como mucho
+  `timeout` segundos y con await, sin ocupar un hilo,
+- hay un límite global de peticiones simultáneas: si está lleno no se pide
+  nada en lugar de hacer cola,
+- las respuestas se cachean por prompt normalizado y una misma pregunta que
+  ya está en vuelo se espera en lugar de repetirse.
+
+Para probarlo sin red hay un servidor de prueba:
+
+    python -m chatbot.llm --stub --port 8765 [--delay 2]
+
+y en settings CHATBOT_LLM_URL = 'http://127.0.0.1:8765/v1/chat/completions'.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .response_cache import ResponseCache
+
+try:
+    import httpx
+except ImportError:  # el respaldo queda desactivado
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "Eres el asistente de una tienda de celulares. Responde en español, en un máximo de "
+    "cuatro oraciones y con tono amable. Usa solo los datos del catálogo que se te dan: "
+    "no inventes modelos, precios ni características. Si la pregunta no tiene que ver con "
+    "celulares o el catálogo no alcanza para responderla, dilo y sugiere buscar por cámara, "
+    "batería, precio o marca."
+)
+
+# Columnas con las que se describe cada teléfono en el prompt (columna, plantilla)
+PROMPT_COLUMNS = [
+    ('price', "${:,.0f}"),
+    ('ram_capacity', "{:g} GB RAM"),
+    ('internal_memory', "{:g} GB"),
+    ('battery_capacity', "{:g} mAh"),
+    ('primary_camera_rear', "cámara {:g} MP"),
+    ('screen_size', "pantalla {:g}\""),
+]
+
+# Rankings de los que se toman ejemplos cuando la pregunta no se parece a ningún teléfono
+CONTEXT_RANKINGS = ['price', 'camera', 'battery', 'performance']
+
+# Pregunta que la respuesta en curso dejó pedida al modelo (para que el streaming la espere)
+_deferred = contextvars.ContextVar('chatbot_llm_deferred', default=None)
+
+
+@contextmanager
+def recording_deferred():
+    """Recoge la pregunta que una respuesta generada dentro del bloque dejó pendiente con el modelo"""
+    box = {}
+    token = _deferred.set(box)
+    try:
+        yield box
+    finally:
+        _deferred.reset(token)
+
+
+def defer(key, messages):
+    """Marca que la respuesta en curso es la genérica porque la del modelo aún no está"""
+    box = _deferred.get()
+    if box is not None:
+        box['request'] = (key, messages)
+
+
+def describe_phone(phone):
+    """Una línea con los datos principales del teléfono (solo los que tiene)"""
+    parts = [
+        template.format(phone[column]) for column, template in PROMPT_COLUMNS
+        if isinstance(phone.get(column), (int, float))
+    ]
+    if phone.get('5G_or_not') is not None:
+        parts.append("5G" if phone['5G_or_not'] else "sin 5G")
+    return f"- {phone['brand_name']} {phone['model']}: {', '.join(parts)}"
+
+
+def catalog_context(catalog, query, k=5):
+    """
+    Datos del catálogo para el prompt: resumen (cantidad, marcas, precios) y
+    hasta k teléfonos, los más parecidos a la pregunta o, si no hay ninguno,
+    los primeros de algunos rankings.
+    """
+    positions = list(catalog.semantic.search(query, k=k, min_score=0.01))
+    if not positions:
+        for name in CONTEXT_RANKINGS:
+            positions.extend(int(pos) for pos in catalog.rankings[name][:2] if int(pos) not in positions)
+        positions = positions[:k]
+
+    lines = [f"Catálogo: {len(catalog)} celulares de las marcas {', '.join(sorted(catalog.brand_index))}."]
+    if len(catalog.sorted_prices):
+        lines.append(f"Precios desde ${catalog.sorted_prices[0]:,.0f} hasta ${catalog.sorted_prices[-1]:,.0f}.")
+    lines.append("Algunos modelos:")
+    lines.extend(describe_phone(phone) for phone in catalog.phones(positions))
+    return "\n".join(lines)
+
+
+def build_messages(query, catalog, k=5):
+    """Mensajes del chat: instrucciones, datos del catálogo y la pregunta del cliente"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": catalog_context(catalog, query, k)},
+        {"role": "user", "content": query},
+    ]
+
+
+class LLMClient:
+    """
+    Cliente del modelo de lenguaje compartido por todos los hilos del proceso.
+
+    start() es para el código síncrono (las vistas): nunca espera, devuelve
+    la respuesta cacheada o None y deja la petición en curso. complete() es
+    para el código asíncrono y la espera como mucho timeout segundos. Los
+    contadores se exponen con stats().
+    """
+
+    def __init__(self, url, api_key='', model='', timeout=4.0, connect_timeout=1.0,
+                 max_concurrency=8, max_tokens=300, cache_size=512, cache_ttl=3600):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self.max_tokens = max_tokens
+        self.cache = ResponseCache(max_entries=cache_size, ttl=cache_ttl)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._pending = {}
+        self._counts = {'requests': 0, 'shared': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+
+    @property
+    def available(self):
+        return httpx is not None and bool(self.url)
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _ensure_loop(self):
+        """Event loop en un hilo aparte con el cliente HTTP y su pool (se crea al primer uso)"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='chatbot-llm', daemon=True).start()
+                self._client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                    ),
+                )
+                self._loop = loop
+            return self._loop
+
+    async def _post(self, messages):
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        payload = {'messages': messages, 'max_tokens': self.max_tokens, 'temperature': 0.3}
+        if self.model:
+            payload['model'] = self.model
+        response = await self._client.post(self.url, json=payload, headers=headers)
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content'].strip()
+
+    def _request(self, key, messages):
+        """
+        Petición en vuelo para key: la que ya estaba (sin ocupar otro lugar) o
+        una nueva, o None si el límite de concurrencia está lleno. Al terminar
+        su respuesta queda en la caché, aunque nadie la haya esperado.
+        """
+        loop = self._ensure_loop()
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self._counts['shared'] += 1
+                return future
+            if not self._slots.acquire(blocking=False):
+                self._counts['rejected'] += 1
+                return None
+            self._counts['requests'] += 1
+            future = asyncio.run_coroutine_threadsafe(self._post(messages), loop)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key, future):
+        """Libera el lugar de concurrencia y guarda la respuesta cuando termina una petición"""
+        with self._lock:
+            self._pending.pop(key, None)
+        self._slots.release()
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, httpx.TimeoutException):
+            self._count('timeouts')
+        elif error is not None:
+            logger.error(f"Error del modelo de lenguaje: {str(error)}")
+            self._count('errors')
+        elif future.result():
+            self.cache.set(key, future.result())
+
+    def start(self, key, messages):
+        """
+        Respuesta cacheada para key (el prompt normalizado) o None. Si no la
+        hay, la pide en segundo plano para la próxima vez. No espera nunca.
+        """
+        if not self.available:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        self._request(key, messages)
+        return None
+
+    async def complete(self, key, messages):
+        """
+        Respuesta del modelo para messages, cacheada con key. Se espera con
+        await como mucho timeout segundos; si no llega, la petición sigue y su
+        respuesta queda en la caché.
+        """
+        if not self.available:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        future = self._request(key, messages)
+        if future is None:
+            return None
+        try:
+            # shield: al agotarse el tiempo no se cancela la petición (puede estar compartida)
+            answer = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except Exception:
+            return None  # tiempo agotado o error: se cuentan en _finish, al terminar la petición
+        return answer or None
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            in_flight = len(self._pending)
+        return {
+            **counts,
+            'available': self.available,
+            'in_flight': in_flight,
+            'max_concurrency': self.max_concurrency,
+            'timeout': self.timeout,
+            'cache': self.cache.stats(),
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Servidor de prueba: responde como /chat/completions con el primer modelo del prompt"""
+
+    delay = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.delay)
+        context = '\n'.join(m['content'] for m in body.get('messages', []) if m.get('role') == 'system')
+        phones = [line[2:] for line in context.splitlines() if line.startswith('- ')]
+        question = next((m['content'] for m in body.get('messages', []) if m.get('role') == 'user'), '')
+        content = f"(stub) Sobre \"{question}\": te sugiero el {phones[0]}." if phones else "(stub) Sin datos."
+        data = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': content}}]}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # el cliente ya se rindió (tiempo agotado)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stub(port=8765, delay=0.0):
+    StubHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    print(f"Servidor de prueba en http://127.0.0.1:{port}/v1/chat/completions (demora {delay}s)")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--stub', action='store_true', help='levantar el servidor de prueba')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='segundos que tarda cada respuesta')
+    args = parser.parse_args()
+    if args.stub:
+        serve_stub(args.port, args.delay)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Límites superiores de los buckets de latencia, en segundos
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Rutas que significan que no se entendió la consulta (el modelo de lenguaje solo responde lo que las reglas no entienden)
+MISS_ROUTES = {'general', 'llm'}
+
+
+class Histogram:
+    """Conteo, suma, máximo y buckets acumulables de una serie de duraciones"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Estimación del cuantil q: límite del bucket donde cae (como histogram_quantile)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, hits in zip(BUCKETS, self.buckets):
+            seen += hits
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class ChatMetrics:
+    """
+    Métricas en memoria del chatbot (por proceso).
+
+    Guarda la latencia de cada etapa del pipeline (intenciones, entidades,
+    manejador, render, total), la latencia y el número de respuestas por
+    ruta y contadores sueltos (búsquedas aproximadas, fallos...).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.routes = {}
+            self.cached_routes = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Mide el bloque como una etapa del pipeline"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def record_route(self, route, seconds, cached=False):
+        """Registra qué manejador respondió y cuánto tardó"""
+        with self._lock:
+            self.routes.setdefault(route, Histogram()).observe(seconds)
+            if cached:
+                self.cached_routes[route] = self.cached_routes.get(route, 0) + 1
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            answered = sum(histogram.count for histogram in self.routes.values())
+            missed = sum(self.routes[route].count for route in MISS_ROUTES if route in self.routes)
+            return {
+                'uptime_s': round(time.time() - self.started, 1),
+                'stages': {name: histogram.summary() for name, histogram in self.stages.items()},
+                'routes': {
+                    name: {**histogram.summary(), 'cached': self.cached_routes.get(name, 0)}
+                    for name, histogram in self.routes.items()
+                },
+                'counters': dict(self.counters),
+                'miss_rate': round(missed / answered, 4) if answered else 0.0,
+            }
+
+    def prometheus(self):
+        """Las mismas métricas en el formato de texto de Prometheus"""
+        lines = []
+        with self._lock:
+            for metric, label, series in (
+                ('chatbot_stage_seconds', 'stage', self.stages),
+                ('chatbot_route_seconds', 'route', self.routes),
+            ):
+                lines.append(f'# TYPE {metric} histogram')
+                for name, histogram in series.items():
+                    cumulative = 0
+                    for bound, hits in zip(BUCKETS + ('+Inf',), histogram.buckets):
+                        cumulative += hits
+                        lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.total}')
+                    lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+            lines.append('# TYPE chatbot_route_cached_total counter')
+            for name, hits in self.cached_routes.items():
+                lines.append(f'chatbot_route_cached_total{{route="{name}"}} {hits}')
+            lines.append('# TYPE chatbot_events_total counter')
+            for name, value in self.counters.items():
+                lines.append(f'chatbot_events_total{{event="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def process_memory():
+    """
+    Memoria de este worker en MB. En Linux separa la parte propia (anónima)
+    de la mapeada desde archivos, que incluye la instantánea compartida del catálogo.
+    """
+    report = {'pid': os.getpid()}
+    names = {'VmRSS': 'rss_mb', 'RssAnon': 'private_mb', 'RssFile': 'file_mapped_mb'}
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in names:
+                    report[names[key]] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        try:
+            import resource
+            report['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:  # Windows
+            pass
+    return report
+
+
+metrics = ChatMetrics()
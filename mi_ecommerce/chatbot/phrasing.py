@@ -0,0 +1,35 @@
+import contextvars
+import random
+import zlib
+from contextlib import contextmanager
+
+# Generador de azar de la respuesta en curso; fuera de una respuesta se usa el global
+_phrasing_rng = contextvars.ContextVar('chatbot_phrasing_rng', default=None)
+
+
+def current_rng():
+    rng = _phrasing_rng.get()
+    return rng if rng is not None else random
+
+
+def choose(options):
+    """Elige una variante de frase con el generador de la respuesta en curso"""
+    return current_rng().choice(options)
+
+
+def phrasing_variant(session_id, variants):
+    """Variante de redacción asignada a una sesión (estable entre procesos)"""
+    return zlib.crc32(str(session_id).encode('utf-8')) % max(variants, 1)
+
+
+@contextmanager
+def seeded_phrasing(seed):
+    """
+    Hace deterministas las elecciones de frases dentro del bloque: la misma
+    semilla produce siempre la misma respuesta, así que se puede cachear.
+    """
+    token = _phrasing_rng.set(random.Random(seed))
+    try:
+        yield
+    finally:
+        _phrasing_rng.reset(token)
@@ -0,0 +1,88 @@
+import math
+import re
+
+# Un monto: "$12,000", "12.000", "12000", "12 mil", "12k", "1.5 mil"
+_AMOUNT = r'(\$)?\s*(\d+(?:[.,]\d+)*)\s*(mil\b|k\b)?'
+
+_BETWEEN = re.compile(rf'(?:entre|de|desde)\s+{_AMOUNT}\s+(?:y|a|hasta)\s+{_AMOUNT}')
+_UPPER = re.compile(
+    rf'(?:menos de|menor a|menores a|hasta|máximo|maximo|no más de|no mas de|'
+    rf'por debajo de|debajo de|bajo)\s+{_AMOUNT}'
+)
+_LOWER = re.compile(
+    rf'(?:más de|mas de|mayor a|mayores a|desde|mínimo|minimo|'
+    rf'por encima de|encima de|arriba de)\s+{_AMOUNT}'
+)
+
+# Sin "$" ni "mil", un número menor que esto no se toma como precio ("menos de 6 pulgadas")
+MIN_BARE_PRICE = 1000
+
+# Especificaciones: un número pegado a una de estas palabras no es un precio
+# ("batería de más de 5000", "con bateria mayor a 6000", "más de 5000 de batería")
+_SPEC = r'(?:batería|bateria|mah|cámara|camara|mp|megapíxeles|megapixeles|pantalla|pulgadas|pulg|ram|gb|tb|hz)'
+_SPEC_BEFORE = re.compile(rf'\b{_SPEC}\s+(?:de\s+|con\s+)?$')
+_SPEC_AFTER = re.compile(rf'\s*(?:de\s+)?{_SPEC}\b')
+
+
+def parse_number(number):
+    """Número escrito con separadores de miles ("12.000", "12,000") o decimales ("2.5", "6,7"), o None"""
+    if re.fullmatch(r'\d{1,3}(?:[.,]\d{3})+', number):
+        return float(re.sub(r'[.,]', '', number))
+    try:
+        return float(number.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def parse_amount(currency, number, unit):
+    """Convierte un monto capturado a número, o None si no parece un precio"""
+    value = parse_number(number)
+    if value is None:
+        return None
+    if unit:
+        value *= 1000
+    if not currency and not unit and value < MIN_BARE_PRICE:
+        return None
+    return value
+
+
+def _matches(pattern, text):
+    """Coincidencias de pattern que no son la cifra de una especificación"""
+    for match in pattern.finditer(text):
+        if not _SPEC_BEFORE.search(text, 0, match.start()) and not _SPEC_AFTER.match(text, match.end()):
+            yield match
+
+
+def parse_price_range(text):
+    """
+    Rango de precios (mínimo, máximo) mencionado en un mensaje, o None.
+
+    Entiende "entre 8000 y 12000", "de 8 mil a 12 mil", "de 5 a 10 mil",
+    "menos de 20 mil", "hasta $15,000", "más de 30k"... Los límites abiertos
+    son 0 e infinito. Las cifras de batería, cámara o pantalla no son precios.
+    """
+    text = text.lower()
+
+    for match in _matches(_BETWEEN, text):
+        low_currency, low_number, low_unit = match.group(1, 2, 3)
+        high = parse_amount(*match.group(4, 5, 6))
+        # "de 5 a 10 mil": la unidad del segundo monto vale para los dos si así no queda mayor
+        if high is not None and not low_unit and match.group(6):
+            shared = parse_amount(low_currency, low_number, match.group(6))
+            if shared is not None and shared <= high:
+                low_unit = match.group(6)
+        low = parse_amount(low_currency, low_number, low_unit)
+        if low is not None and high is not None:
+            return (low, high) if low <= high else (high, low)
+
+    for match in _matches(_UPPER, text):
+        high = parse_amount(*match.groups())
+        if high is not None:
+            return 0, high
+
+    for match in _matches(_LOWER, text):
+        low = parse_amount(*match.groups())
+        if low is not None:
+            return low, math.inf
+
+    return None
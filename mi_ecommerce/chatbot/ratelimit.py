@@ -0,0 +1,145 @@
+"""
+Límite de peticiones por cliente para los endpoints del chat.
+
+Cada cliente (IP o sesión) tiene un cubo de fichas: se recarga a `rate`
+fichas por segundo hasta `burst` y cada mensaje gasta una. Sin fichas la
+petición se rechaza (429) antes de tocar el catálogo. Las vistas síncronas
+rechazan en el acto para no dejar un hilo del worker dormido; solo el
+endpoint asíncrono espera (sin ocupar hilo) si la ficha siguiente llega
+dentro de `max_wait`.
+
+Con un alias de caché compartido (Redis/Memcached) el límite vale para todos
+los workers: ahí el cubo se aproxima con una ventana fija de burst / rate
+segundos contada con cache.incr, que es atómico en esos backends.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+
+class RateLimiter:
+    """
+    Cubos de fichas por clave. En memoria (por proceso) si no hay alias de
+    caché, con un máximo de claves para que muchos clientes no agoten la memoria.
+    """
+
+    def __init__(self, rate, burst, alias=None, max_wait=0.0, max_keys=10000, prefix='chatbot:rl'):
+        self.rate = rate
+        self.burst = burst
+        self.alias = alias
+        self.max_wait = max_wait
+        self.max_keys = max_keys
+        self.prefix = prefix
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.backend_errors = 0
+
+    @property
+    def shared(self):
+        return bool(self.alias) and self.alias in settings.CACHES
+
+    def acquire(self, key, cost=1):
+        """
+        Gasta cost fichas de la clave sin esperar nunca.
+        Devuelve (permitido, segundos para reintentar).
+        """
+        allowed, retry_after = self._take(key, cost)
+        self._record(allowed)
+        return allowed, retry_after
+
+    async def acquire_async(self, key, cost=1):
+        """
+        Como acquire, pero si la ficha llega dentro de max_wait espera con
+        asyncio.sleep (sin ocupar un hilo) y reintenta una vez.
+        """
+        take = sync_to_async(self._take, thread_sensitive=False) if self.shared else self._take
+        result = take(key, cost)
+        allowed, retry_after = await result if self.shared else result
+        if not allowed and retry_after <= self.max_wait:
+            await asyncio.sleep(retry_after)
+            result = take(key, cost)
+            allowed, retry_after = await result if self.shared else result
+            if allowed:
+                with self._lock:
+                    self.delayed += 1
+        self._record(allowed)
+        return allowed, retry_after
+
+    def _record(self, allowed):
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.rejected += 1
+
+    def _take(self, key, cost=1):
+        if self.shared:
+            try:
+                return self._take_shared(key, cost)
+            except Exception:
+                # Si el backend compartido falla se sigue con el límite local, sin cortar el servicio
+                with self._lock:
+                    self.backend_errors += 1
+        return self._take_local(key, cost)
+
+    def _take_local(self, key, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / self.rate
+
+    def _take_shared(self, key, cost=1):
+        window = self.burst / self.rate
+        now = time.time()
+        slot = int(now // window)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+        cache_key = f"{self.prefix}:{digest}:{slot}"
+        cache = caches[self.alias]
+        cache.add(cache_key, 0, timeout=int(window) + 1)
+        try:
+            used = cache.incr(cache_key, cost)
+        except ValueError:
+            # La clave expiró entre add e incr
+            cache.add(cache_key, cost, timeout=int(window) + 1)
+            used = cost
+        allowed = used <= self.burst
+        return allowed, 0.0 if allowed else (slot + 1) * window - now
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.alias if self.shared else 'local',
+                'rate': self.rate,
+                'burst': self.burst,
+                'max_wait': self.max_wait,
+                'tracked_keys': len(self._buckets),
+                'allowed': self.allowed,
+                'delayed': self.delayed,
+                'rejected': self.rejected,
+                'backend_errors': self.backend_errors,
+            }
+
+
+def client_ip(request):
+    """IP del cliente; detrás de un proxy de confianza, la primera de X-Forwarded-For"""
+    if getattr(settings, 'CHATBOT_RATE_LIMIT_TRUST_PROXY', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', 'unknown')
@@ -0,0 +1,65 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_query(text):
+    """Forma canónica de un mensaje: minúsculas, espacios simples y sin signos de apertura/cierre"""
+    text = _SPACES.sub(' ', text.lower()).strip()
+    return text.lstrip('¿¡').rstrip('?!.').strip()
+
+
+class ResponseCache:
+    """
+    Caché LRU en memoria con expiración por tiempo y contadores de uso.
+    Seguro para varios hilos; cada proceso tiene la suya.
+    """
+
+    def __init__(self, max_entries=2048, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,204 @@
+"""
+Búsqueda por significado sobre el catálogo, sin servicios externos.
+
+Cada teléfono se describe con las palabras de su marca, modelo, sistema y
+procesador más descriptores derivados de sus especificaciones ("dura",
+"fotos", "barato", "mamá"...). Con eso se arma un índice TF-IDF disperso:
+para cada término, las posiciones que lo contienen y su peso ya normalizado
+por documento. Una consulta suma los pesos de sus términos (producto punto
+disperso) y se queda con los k mejores, así que el costo depende de los
+términos de la consulta y no de cuántas reglas haya.
+"""
+import math
+import re
+
+import numpy as np
+
+from .spelling import fold
+
+_TOKEN = re.compile(r'\w+')
+
+# Descriptores: palabras que se asocian a los teléfonos que cumplen todas las condiciones
+# (columna, mínimo, máximo), igual que los predicados de filters.py
+DESCRIPTORS = [
+    ('batería bateria dure dura durar duración aguante autonomía',
+     [('battery_capacity', 5000, math.inf)]),
+    ('barato barata económico económica accesible ahorrar presupuesto regalo',
+     [('price', 0, 15000)]),
+    ('premium lujo gama alta',
+     [('price', 40000, math.inf)]),
+    ('cámara fotos fotografía instagram viajes',
+     [('primary_camera_rear', 50, math.inf)]),
+    ('selfie selfies videollamadas',
+     [('primary_camera_front', 16, math.inf)]),
+    ('fluida fluido juegos gamer gaming',
+     [('refresh_rate', 120, math.inf)]),
+    ('rápido potente juegos gamer gaming multitarea trabajo',
+     [('ram_capacity', 8, math.inf)]),
+    ('pantalla grande videos series películas leer lectura',
+     [('screen_size', 6.5, math.inf)]),
+    ('compacto pequeño chico',
+     [('screen_size', 0, 6.2)]),
+    ('almacenamiento espacio memoria',
+     [('internal_memory', 256, math.inf)]),
+    ('5g internet', [('5G_or_not', 1, 1)]),
+    ('microsd expandible', [('extended_memory_available', 1, 1)]),
+    ('carga rápida', [('fast_charging', 33, math.inf)]),
+    # Perfil para personas mayores: pantalla grande, batería y precio contenido
+    ('mamá papá abuelo abuela abuelos mayores sencillo fácil',
+     [('battery_capacity', 4500, math.inf), ('screen_size', 6.4, math.inf),
+      ('price', 0, 25000)]),
+]
+
+# Columnas de texto cuyas palabras describen al teléfono
+TEXT_COLUMNS = ['brand_name', 'model', 'os', 'processor_brand']
+
+# Palabras de la consulta que no describen nada ("mi" también es una serie de Xiaomi)
+STOPWORDS = set(
+    'a al algo alguno alguna busco como con de del el en es la las le lo los me mi mis muy mucho '
+    'para por pero que quiero se sea su sus te tenga tiene un una uno y o'.split()
+)
+
+# Términos de la consulta que se consideran como máximo (acota la latencia)
+MAX_QUERY_TERMS = 16
+
+
+def tokens(text):
+    return _TOKEN.findall(fold(text))
+
+
+class SemanticIndex:
+    """
+    Índice TF-IDF disperso del catálogo.
+
+    Cada término (una palabra de texto o un descriptor completo) tiene una
+    lista con (posiciones, pesos, idf); los pesos son el idf dividido por la
+    norma del vector de cada teléfono, así que el producto punto con la
+    consulta normalizada es la similitud coseno. terms asocia cada palabra
+    con las listas que activa (las palabras de un descriptor comparten la suya).
+
+    Las listas se guardan en formato CSR (offsets, positions, weights) para
+    poder guardarlas en la instantánea; from_arrays las recupera sin recalcular.
+    """
+
+    def __init__(self, columns=None, size=0):
+        self.size = len(columns) if columns is not None else size
+        self.terms = {}
+        if columns is not None:
+            self._build(columns)
+
+    def _build(self, columns):
+        groups = []     # posiciones de cada término
+
+        for name in TEXT_COLUMNS:
+            if not columns.has(name) or columns.kinds[name] != 'str':
+                continue
+            # Plegar la tabla de cadenas de una vez y anotar qué códigos contienen cada palabra;
+            # los números se dejan fuera (los modelos concretos ya los resuelve la búsqueda por nombre)
+            table = fold('\n'.join(columns.table(name))).split('\n')
+            codes_by_word = {}
+            for code, text in enumerate(table):
+                for word in set(_TOKEN.findall(text)):
+                    if word.isalpha():
+                        codes_by_word.setdefault(word, []).append(code)
+            codes = columns.values[name]
+            for word, word_codes in codes_by_word.items():
+                hit = np.zeros(len(table), dtype=np.bool_)
+                hit[word_codes] = True
+                positions = np.flatnonzero(hit[codes] & (codes >= 0))
+                if len(positions):
+                    self.terms.setdefault(word, []).append(len(groups))
+                    groups.append(positions)
+
+        for words, predicates in DESCRIPTORS:
+            mask = np.ones(self.size, dtype=np.bool_)
+            for column, low, high in predicates:
+                if not columns.has(column) or columns.kinds[column] == 'str':
+                    mask[:] = False
+                    break
+                values = columns.values[column]
+                mask &= columns.valid[column] & (values >= low) & (values <= high)
+            positions = np.flatnonzero(mask)
+            if len(positions):
+                for word in set(tokens(words)):
+                    self.terms.setdefault(word, []).append(len(groups))
+                groups.append(positions)
+
+        # idf por término y norma de cada documento (tf binario)
+        idfs = [math.log((1 + self.size) / (1 + len(positions))) + 1 for positions in groups]
+        norms = np.zeros(self.size)
+        for positions, idf in zip(groups, idfs):
+            norms[positions] += idf * idf
+        norms = np.sqrt(norms)
+        norms[norms == 0] = 1
+        lengths = [len(positions) for positions in groups]
+        self.offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self.positions = np.concatenate(groups or [[]]).astype(np.int32)
+        self.weights = np.concatenate(
+            [idf / norms[positions] for positions, idf in zip(groups, idfs)] or [[]]
+        ).astype(np.float32)
+        self.idfs = np.array(idfs, dtype=np.float64)
+
+    @classmethod
+    def from_arrays(cls, size, arrays):
+        """Índice a partir de los arreglos de arrays() (por ejemplo, mapeados desde la instantánea)"""
+        index = cls(size=size)
+        for name in ('offsets', 'positions', 'weights', 'idfs'):
+            setattr(index, name, arrays[f'semantic_{name}'])
+        words = arrays['semantic_words'].tolist()
+        bounds = arrays['semantic_word_offsets'].tolist()
+        term_ids = arrays['semantic_word_terms'].tolist()
+        index.terms = {word: term_ids[bounds[i]:bounds[i + 1]] for i, word in enumerate(words)}
+        return index
+
+    def arrays(self):
+        words = sorted(self.terms)
+        lengths = [len(self.terms[word]) for word in words]
+        return {
+            'semantic_offsets': self.offsets,
+            'semantic_positions': self.positions,
+            'semantic_weights': self.weights,
+            'semantic_idfs': self.idfs,
+            'semantic_words': np.array(words, dtype=np.str_),
+            'semantic_word_offsets': np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+            'semantic_word_terms': np.array([term for word in words for term in self.terms[word]], dtype=np.int32),
+        }
+
+    def search(self, text, k=5, min_score=0.15):
+        """
+        Posiciones de los k teléfonos más parecidos al texto (de mayor a menor
+        similitud) o vacía si ninguno llega a min_score.
+        """
+        return self.page(text, 0, k, min_score)[0]
+
+    def page(self, text, start, k=5, min_score=0.15):
+        """
+        Posiciones [start, start + k) de los resultados de search, más el total de
+        teléfonos que llegan a min_score (para continuar el listado con "ver más").
+        """
+        words = [word for word in dict.fromkeys(tokens(text)) if word in self.terms and word not in STOPWORDS]
+        # Varias palabras del mismo descriptor ("dure", "batería") cuentan una sola vez
+        terms = list(dict.fromkeys(term for word in words[:MAX_QUERY_TERMS] for term in self.terms[word]))
+        if not terms:
+            return np.array([], dtype=np.intp), 0
+
+        query_norm = math.sqrt(sum(self.idfs[term] ** 2 for term in terms))
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in terms:
+            first, end = self.offsets[term], self.offsets[term + 1]
+            scores[self.positions[first:end]] += self.weights[first:end] * (self.idfs[term] / query_norm)
+
+        best = np.flatnonzero(scores >= min_score)
+        total = len(best)
+        if total > start + k:
+            # Los start + k mejores; entre empatados en el corte, los primeros del catálogo,
+            # para que cada página continúe exactamente la anterior
+            cut = np.partition(scores[best], total - start - k)[total - start - k]
+            above, ties = best[scores[best] > cut], best[scores[best] == cut]
+            best = np.concatenate((above, ties[:start + k - len(above)]))
+        # Mayor similitud primero; a igual similitud, orden del catálogo
+        return best[np.lexsort((best, -scores[best]))][start:start + k], total
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.offsets, self.positions, self.weights, self.idfs))
@@ -0,0 +1,158 @@
+"""
+Instantáneas del catálogo en disco, compartidas entre procesos.
+
+Cada versión del catálogo se guarda como una carpeta con un archivo .npy por
+arreglo (columnas, máscaras, tablas de cadenas, rankings, criterios, filtros y
+los índices de búsqueda por nombre, n-gramas y TF-IDF)
+más un meta.json. Los workers abren los .npy con np.load(mmap_mode='r'): el sistema
+operativo mapea las mismas páginas para todos, así que los datos del catálogo
+ocupan memoria una sola vez sin importar cuántos workers haya, y un worker
+puede arrancar desde la instantánea sin consultar MySQL.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .columnar import ColumnarCatalog
+
+logger = logging.getLogger(__name__)
+
+# Grupos de arreglos derivados (nombre -> arreglo) que se guardan junto a las columnas
+DERIVED_GROUPS = ('rankings', 'criteria', 'filters', 'filter_values', 'flags', 'indexes')
+
+# Versiones que se conservan en disco (la vigente y la anterior, que algún worker puede seguir usando)
+KEEP_VERSIONS = 2
+
+
+def _arrays(catalog):
+    """Arreglos del catálogo por nombre de archivo, con su descripción en el meta"""
+    columns = catalog.columns
+    arrays, layout = {}, {'values': {}, 'valid': {}, 'tables': {}, **{group: {} for group in DERIVED_GROUPS}}
+    for i, name in enumerate(columns.column_names):
+        arrays[f'values_{i}'] = columns.values[name]
+        arrays[f'valid_{i}'] = columns.valid[name]
+        layout['values'][name] = f'values_{i}'
+        layout['valid'][name] = f'valid_{i}'
+        if name in columns.tables:
+            arrays[f'table_{i}'] = columns.tables[name]
+            layout['tables'][name] = f'table_{i}'
+    for group in DERIVED_GROUPS:
+        for i, (name, array) in enumerate(getattr(catalog, group).items()):
+            arrays[f'{group}_{i}'] = array
+            layout[group][name] = f'{group}_{i}'
+    arrays['sorted_prices'] = catalog.sorted_prices
+    return arrays, layout
+
+
+def write_snapshot(catalog, directory, marker=None):
+    """
+    Escribe la instantánea de una versión y la marca como vigente.
+    La carpeta se arma aparte y se publica con un rename, así que nadie lee una a medias.
+    """
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, catalog.version)
+    if not is_complete(directory, catalog.version):
+        arrays, layout = _arrays(catalog)
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=directory)
+        for filename, array in arrays.items():
+            np.save(os.path.join(staging, f'{filename}.npy'), np.ascontiguousarray(array))
+        meta = {
+            'version': catalog.version,
+            'marker': marker,
+            'size': len(catalog),
+            'column_names': catalog.columns.column_names,
+            'kinds': catalog.columns.kinds,
+            'layout': layout,
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        # Una carpeta de esta versión sin todos los grupos (escrita por una versión anterior
+        # del código) se aparta; los workers que la tengan mapeada siguen leyendo sus archivos
+        stale = None
+        if os.path.isdir(target):
+            stale = tempfile.mkdtemp(prefix='.old-', dir=directory)
+            try:
+                os.rename(target, os.path.join(stale, catalog.version))
+            except OSError:
+                pass
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Otro worker publicó la misma versión primero
+            shutil.rmtree(staging, ignore_errors=True)
+        if stale:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    _write_current(directory, catalog.version, marker)
+    _prune(directory, catalog.version)
+
+
+def _write_current(directory, version, marker):
+    handle, path = tempfile.mkstemp(prefix='.current-', dir=directory)
+    with os.fdopen(handle, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'marker': marker}, f)
+    os.replace(path, os.path.join(directory, 'current.json'))
+
+
+def _prune(directory, current):
+    versions = [
+        entry for entry in os.scandir(directory)
+        if entry.is_dir() and not entry.name.startswith('.') and entry.name != current
+    ]
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[KEEP_VERSIONS - 1:]:
+        # En Windows puede fallar si algún proceso aún la tiene mapeada; se reintenta en la próxima
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def is_complete(directory, version):
+    """Si la instantánea de esa versión existe y trae todos los grupos de DERIVED_GROUPS"""
+    try:
+        with open(os.path.join(directory, version, 'meta.json'), encoding='utf-8') as f:
+            layout = json.load(f)['layout']
+    except (OSError, ValueError, KeyError):
+        return False
+    return all(group in layout for group in DERIVED_GROUPS)
+
+
+def current_snapshot(directory):
+    """{'version', 'marker'} de la instantánea vigente, o None si no hay"""
+    try:
+        with open(os.path.join(directory, 'current.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_snapshot(directory, version):
+    """
+    Abre una instantánea en modo solo lectura (mapeada en memoria).
+    Devuelve (ColumnarCatalog, arreglos derivados, meta).
+    """
+    path = os.path.join(directory, version)
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    layout = meta['layout']
+
+    def load(filename):
+        return np.load(os.path.join(path, f'{filename}.npy'), mmap_mode='r')
+
+    columns = ColumnarCatalog(
+        meta['size'],
+        meta['column_names'],
+        meta['kinds'],
+        {name: load(filename) for name, filename in layout['values'].items()},
+        {name: load(filename) for name, filename in layout['valid'].items()},
+        {name: load(filename) for name, filename in layout['tables'].items()},
+    )
+    # Una instantánea anterior a algún grupo lo trae vacío y el catálogo lo calcula
+    derived = {
+        group: {name: load(filename) for name, filename in layout.get(group, {}).items()}
+        for group in DERIVED_GROUPS
+    }
+    derived['sorted_prices'] = load('sorted_prices')
+    return columns, derived, meta
@@ -0,0 +1,221 @@
+"""
+Corrección ortográfica de los mensajes antes de enrutarlos.
+
+Corrector al estilo SymSpell: para cada palabra del vocabulario se guardan de
+antemano sus variantes con una o dos letras borradas. Corregir una palabra
+es generar los borrados de la palabra escrita y buscarlos en ese diccionario,
+así que cuesta microsegundos sin importar el tamaño del vocabulario; solo a
+los pocos candidatos encontrados se les calcula la distancia de edición.
+
+Las comparaciones ignoran tildes ("bateria" = "batería") y la corrección
+devuelve la forma del vocabulario, con sus tildes.
+
+Solo se corrige hacia palabras de marcas y modelos o términos de intención
+que no cambian el rumbo de la conversación: "comprar" no puede volverse
+"comparar" ni "gratis" volverse "gracias". Las palabras frecuentes del
+español y los términos de esas intenciones se conocen (no se corrigen) pero
+nunca se proponen.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from .intents import INTENT_STEMS, INTENT_TERMS, ROUTING_INTENTS
+
+# Palabras frecuentes que nunca se corrigen, aunque se parezcan a otra del vocabulario
+# ("todo" no es "foto", "comprar" no es "comparar", "gratis" no es "gracias")
+COMMON_WORDS = (
+    'algo algún alguno alguna busco buscando bueno buena buenas buenos cual cuál cuanto cuánto como cómo '
+    'cuesta dame desde dure dime donde dónde entre este esta esto estos estas hasta hola modelo muestra '
+    'mucho mucha muy nada otro otra otros otras para pero poco puede quiero quisiera tiene tienen '
+    'tenga tengo todo toda todos todas tambien también vale venden vender usar sirve sobre menos '
+    'mayor menor gama alta baja nuevo nueva calidad bien dura larga mejores peor '
+    # Compra, envío y pago
+    'comprar compra compras compro compré comprarlo comprarla gratis gratuito gratuita envío envio '
+    'envíos envios enviar envían envian entrega entregas domicilio tienda tiendas pagar pago pagos '
+    'tarjeta crédito credito débito debito efectivo transferencia cuotas meses factura garantía garantia '
+    'devolución devolucion cambio cambios oferta ofertas descuento descuentos cupón cupon promoción '
+    'promocion stock disponible disponibles agotado pedido pedidos carrito cuenta usuario contraseña '
+    'horario dirección direccion ciudad sucursal llega llegan llegar tarda tardan recibir vendedor '
+    # Verbos y palabras de uso general
+    'necesito necesitas quieres puedo puedes podría podrias podrías tienes saber gustaría gustaria '
+    'conocer ayudar hacer hablar llamar pregunta preguntar respuesta cuándo cuando porque porqué '
+    'cuántos cuantos cuántas cuantas mismo misma ahora luego antes después despues siempre nunca '
+    'nuevo usado usados original originales regalo persona personas trabajo escuela casa hijo hija '
+    'favor gusto claro entonces también además ademas solo sólo igual mejor tiempo semana '
+    'estoy estás estas están estan somos eres sería seria fuera había habia hay'
+).split()
+
+# Palabras completas del dominio que no están en los vocabularios de intención
+DOMAIN_WORDS = (
+    'celular celulares teléfono teléfonos smartphone smartphones económico económica económicos '
+    'económicas barato barata baratos baratas pantalla pantallas duración cámaras fotos juegos '
+    'memoria almacenamiento carga rápida modelos marca marcas'
+).split()
+
+# Prioridad al desempatar candidatos a la misma distancia
+INTENT_PRIORITY, CATALOG_PRIORITY, COMMON_PRIORITY = 3, 2, 1
+
+_WORD = re.compile(r'\w+')
+
+# Palabras más cortas que esto no se corrigen ("vs", "ram", "cama" tienen demasiados vecinos)
+MIN_LENGTH = 5
+# Palabras de marcas y modelos más cortas que esto no entran al vocabulario ("pro", "max")
+MIN_CATALOG_LENGTH = 4
+
+
+def fold(text):
+    """Minúsculas y sin tildes ni diéresis (la ñ también se pliega a n)"""
+    decomposed = unicodedata.normalize('NFD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def edit_distance(a, b, limit):
+    """Distancia de Damerau-Levenshtein (transposiciones adyacentes), o limit + 1 si la supera"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SpellChecker:
+    """
+    Diccionario de borrados sobre un vocabulario de palabras plegadas.
+
+    words asocia cada forma plegada con (forma correcta, prioridad, frecuencia);
+    deletes asocia cada borrado (hasta max_distance letras dentro de los
+    primeros prefix_length caracteres) con las formas plegadas que lo generan.
+    """
+
+    def __init__(self, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = {}
+        self.deletes = {}
+        self._targets = set()
+
+    def add(self, word, priority, count=1, target=True):
+        """
+        Agrega una palabra al vocabulario. Con target=False la palabra se
+        conoce (no se corrige) pero nunca se propone como corrección de otra.
+        """
+        folded = fold(word)
+        known = self.words.get(folded)
+        if known is not None:
+            # La forma con más prioridad (la del vocabulario de intenciones, con tildes) es la que se propone
+            spelled, known_priority, known_count = known
+            if known_priority >= priority:
+                word, priority = spelled, known_priority
+            count += known_count
+        self.words[folded] = (word, priority, count)
+        if target and folded not in self._targets:
+            self._targets.add(folded)
+            for variant in self._variants(folded):
+                self.deletes.setdefault(variant, []).append(folded)
+
+    def _variants(self, word):
+        """La palabra (recortada al prefijo) y todos sus borrados hasta max_distance letras"""
+        word = word[:self.prefix_length]
+        variants = {word}
+        frontier = {word}
+        for _ in range(self.max_distance):
+            frontier = {item[:i] + item[i + 1:] for item in frontier for i in range(len(item))}
+            variants |= frontier
+        return variants
+
+    def lookup(self, word, max_distance=None):
+        """Forma correcta más cercana a word (tildes incluidas), o None si no hay ninguna dentro de la distancia"""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        folded = fold(word)
+        known = self.words.get(folded)
+        if known is not None:
+            return known[0]
+
+        best, best_key = None, None
+        seen = set()
+        for variant in self._variants(folded):
+            for candidate in self.deletes.get(variant, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(folded, candidate, limit)
+                if distance > limit:
+                    continue
+                spelled, priority, count = self.words[candidate]
+                key = (distance, -priority, -count)
+                if best_key is None or key < best_key:
+                    best, best_key = spelled, key
+        return best
+
+    def correct(self, text):
+        """
+        El texto con cada palabra desconocida cambiada por la más cercana del vocabulario.
+        Las palabras cortas o con dígitos ("a54", "5g", "13") se dejan como están.
+        Devuelve (texto, número de correcciones); si no hubo ninguna, el texto original.
+        """
+        corrections = 0
+
+        def replace(match):
+            nonlocal corrections
+            token = match.group(0)
+            if len(token) < MIN_LENGTH or any(char.isdigit() for char in token):
+                return token
+            # Hasta una letra de diferencia en palabras cortas y dos en las largas
+            suggestion = self.lookup(token, 1 if len(token) <= 5 else 2)
+            if suggestion is None or suggestion == token.lower():
+                return token
+            corrections += 1
+            return suggestion
+
+        corrected = _WORD.sub(replace, text)
+        return (corrected, corrections) if corrections else (text, 0)
+
+    def __len__(self):
+        return len(self.words)
+
+
+def catalog_tokens(names):
+    """Palabras de marcas y modelos (pares (marca, modelo)) que entran al corrector, con su frecuencia"""
+    tokens = Counter(_WORD.findall(' '.join(f"{brand} {model}" for brand, model in names).lower()))
+    return Counter({
+        token: count for token, count in tokens.items() if len(token) >= MIN_CATALOG_LENGTH and token.isalpha()
+    })
+
+
+def build_speller(names=(), tokens=None):
+    """
+    Corrector con el vocabulario de intenciones, las palabras frecuentes y las
+    palabras de marcas y modelos del catálogo (pares (marca, modelo), o ya
+    contadas con catalog_tokens).
+    Los términos de ROUTING_INTENTS y las palabras frecuentes no se proponen.
+    """
+    speller = SpellChecker()
+    routing = {
+        word for intent in ROUTING_INTENTS for term in INTENT_TERMS[intent] for word in term.split()
+    }
+    for terms in INTENT_TERMS.values():
+        for term in terms:
+            for word in term.split():
+                if word not in INTENT_STEMS:
+                    speller.add(word, INTENT_PRIORITY, target=word not in routing)
+    for word in DOMAIN_WORDS:
+        speller.add(word, INTENT_PRIORITY, target=word not in routing)
+
+    if tokens is None:
+        tokens = catalog_tokens(names)
+    for token, count in tokens.items():
+        speller.add(token, CATALOG_PRIORITY, count)
+
+    for word in COMMON_WORDS:
+        speller.add(word, COMMON_PRIORITY, target=False)
+    return speller
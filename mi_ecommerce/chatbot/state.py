@@ -0,0 +1,152 @@
+import hashlib
+import logging
+from array import array
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se conserva el estado de una conversación sin actividad
+DEFAULT_TTL = 60 * 5
+
+
+def pack_phones(catalog, positions):
+    """
+    Referencia compacta a una lista de teléfonos: versión del catálogo más
+    las posiciones como enteros de 4 bytes, en lugar de los diccionarios completos.
+    """
+    return (catalog.version, array('i', (int(pos) for pos in positions)).tobytes())
+
+
+def unpack_phones(catalog, packed):
+    """Posiciones guardadas con pack_phones; vacío si el catálogo cambió desde entonces"""
+    if not packed or packed[0] != catalog.version:
+        return []
+    positions = array('i')
+    positions.frombytes(packed[1])
+    return positions.tolist()
+
+
+class SessionState:
+    """
+    Estado de una conversación durante una petición.
+
+    Se lee completo al inicio (una sola clave) y los cambios se acumulan
+    en memoria hasta que el almacén los escribe juntos al final.
+    """
+
+    def __init__(self, session_id, values):
+        self.session_id = session_id
+        self._values = values
+        self._changed = {}
+
+    def get(self, field, default=None):
+        value = self._changed.get(field, self._values.get(field))
+        return default if value is None else value
+
+    def set(self, field, value):
+        self._changed[field] = value
+
+    def delete(self, *fields):
+        for field in fields:
+            self._changed[field] = None
+
+    def merged(self):
+        """Campos con valor después de aplicar los cambios pendientes"""
+        values = {**self._values, **self._changed}
+        return {field: value for field, value in values.items() if value is not None}
+
+
+class ConversationStore:
+    """
+    Almacén del estado de conversación compartido entre procesos.
+
+    Usa un alias de caché de Django (CHATBOT_STATE_CACHE), así que el backend
+    se elige en settings.CACHES: la caché en base de datos para un solo
+    servidor (su tabla se crea con `python manage.py createcachetable`), Redis
+    o Memcached si hay varios. Cada sesión es una sola clave con todos sus
+    campos, que expira sola a los CHATBOT_STATE_TTL segundos sin barridos
+    aparte; cada turno hace una lectura y solo escribe si el estado cambió.
+
+    Si el backend falla (por ejemplo, falta la tabla de la caché en base de
+    datos) se registra el error y el estado se guarda en memoria del proceso,
+    así el chat sigue respondiendo aunque cada worker vea solo sus sesiones.
+
+    Dos turnos simultáneos de la misma sesión no se combinan: cada uno lee el
+    estado al empezar y al terminar escribe la sesión completa, así que gana
+    el último en escribir.
+    """
+
+    def __init__(self, alias=None, ttl=None, prefix='chatbot'):
+        self.alias = alias
+        self.ttl = ttl
+        self.prefix = prefix
+        self._local = None
+        self._failed = False
+
+    @property
+    def cache(self):
+        alias = self.alias or getattr(settings, 'CHATBOT_STATE_CACHE', 'default')
+        return caches[alias if alias in settings.CACHES else 'default']
+
+    @property
+    def local(self):
+        """Caché en memoria del proceso para cuando el backend compartido no responde"""
+        if self._local is None:
+            self._local = LocMemCache('chatbot-state-fallback', {
+                'TIMEOUT': self.timeout, 'OPTIONS': {'MAX_ENTRIES': 20000},
+            })
+        return self._local
+
+    @property
+    def timeout(self):
+        return self.ttl if self.ttl is not None else getattr(settings, 'CHATBOT_STATE_TTL', DEFAULT_TTL)
+
+    def key(self, session_id):
+        # El session_id lo envía el cliente: se resume para que la clave sea válida en cualquier backend
+        digest = hashlib.sha1(str(session_id).encode('utf-8')).hexdigest()[:20]
+        return f"{self.prefix}:{digest}"
+
+    def _call(self, method, *args, **kwargs):
+        """Operación sobre el backend compartido o, si la base de datos falla, sobre la memoria del proceso"""
+        try:
+            return getattr(self.cache, method)(*args, **kwargs)
+        except DatabaseError as e:
+            # Se avisa una vez por proceso; mientras tanto cada operación vuelve a probar el backend
+            if not self._failed:
+                self._failed = True
+                logger.error(
+                    f"Estado de conversación en memoria del proceso: el backend compartido falló ({str(e)}). "
+                    f"Con la caché en base de datos, crea su tabla con `python manage.py createcachetable`"
+                )
+            return getattr(self.local, method)(*args, **kwargs)
+
+    def load(self, session_id):
+        return SessionState(session_id, self._call('get', self.key(session_id)) or {})
+
+    def save(self, state):
+        """Escribe la sesión completa si algo cambió (un set), o la borra si quedó vacía"""
+        values = state.merged()
+        if values != state._values:
+            if values:
+                self._call('set', self.key(state.session_id), values, timeout=self.timeout)
+            else:
+                self._call('delete', self.key(state.session_id))
+        state._values = values
+        state._changed = {}
+
+    @contextmanager
+    def session(self, session_id):
+        """Carga el estado de la sesión y guarda sus cambios al salir del bloque"""
+        state = self.load(session_id)
+        try:
+            yield state
+        finally:
+            self.save(state)
+
+
+conversation_store = ConversationStore()
@@ -0,0 +1,520 @@
+import json
+import math
+import re
+import tempfile
+import time
+from difflib import SequenceMatcher
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .benchmark import COLUMNS, generate_phones
+from .catalog import RANKINGS, Catalog, CatalogManager, _pinned_catalog, fetch_catalog_marker
+from .entities import find_phone_position
+from .filters import Predicate, filter_positions, parse_filters
+from .followups import parse_followup, pick
+from .intents import INTENT_TERMS, ROUTING_INTENTS, detect_intents
+from .listings import PAGE_SIZE, recording_listing
+from .phrasing import choose, phrasing_variant, seeded_phrasing
+from .prices import parse_price_range
+from .ratelimit import RateLimiter
+from .response_cache import ResponseCache
+from .snapshot import current_snapshot, write_snapshot
+from .spelling import build_speller
+from .state import ConversationStore
+from . import views
+from .views import answer_message, process_any_query, response_cache, route_query
+
+# Catálogo mínimo para el vocabulario de marcas y modelos
+NAMES = [('samsung', 'Galaxy S21'), ('apple', 'iPhone 13'), ('xiaomi', 'Redmi Note 12'), ('motorola', 'Moto G84')]
+
+
+class SpellingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.speller = build_speller(NAMES)
+
+    def test_common_words_are_not_corrected(self):
+        cases = [
+            'quiero comprar un celular',
+            'envío gratis?',
+            'tienda cerca',
+            'pagar con tarjeta a meses',
+            'cuanto tarda la entrega',
+            'tienen garantía?',
+        ]
+        for message in cases:
+            with self.subTest(message=message):
+                self.assertEqual(self.speller.correct(message), (message, 0))
+
+    def test_typos_are_corrected(self):
+        cases = [
+            ('camara con bateria', 'cámara con batería'),
+            ('pantala grande', 'pantalla grande'),
+            ('quiero un telefono barto', 'quiero un teléfono barato'),
+            ('modelos de samsng', 'modelos de samsung'),
+            ('un celualr con buen procesadr', 'un celular con buen procesador'),
+        ]
+        for message, expected in cases:
+            with self.subTest(message=message):
+                self.assertEqual(self.speller.correct(message)[0], expected)
+
+    def test_corrections_never_add_routing_intents(self):
+        routing = {word for intent in ROUTING_INTENTS for term in INTENT_TERMS[intent] for word in term.split()}
+        cases = ['comprar', 'gratis', 'gracas', 'ayudas', 'comparr', 'contrato', 'versos', 'holas', 'opcion']
+        for word in cases:
+            with self.subTest(word=word):
+                corrected = self.speller.correct(word)[0]
+                self.assertNotIn(corrected, routing)
+                self.assertFalse(
+                    (detect_intents(corrected) - detect_intents(word)) & ROUTING_INTENTS,
+                    f"{word!r} -> {corrected!r}",
+                )
+
+
+class FollowUpTests(SimpleTestCase):
+    def test_references(self):
+        cases = [
+            ('detalles del 2', [2], False, False),
+            ('el 2', [2], False, False),
+            ('compara el 1 y el 3', [1, 3], False, True),
+            ('el 1, 3 y 4', [1, 3, 4], False, False),
+            ('la tercera', [3], False, False),
+            ('el último', [-1], False, False),
+            ('¿cuánto cuesta ese?', [], True, False),
+            ('¿ese tiene 5g?', [], True, False),
+            ('este celular tiene 5g?', [], True, False),
+            ('compara ese con el 1', [1], True, True),
+        ]
+        for message, numbers, pronoun, compare in cases:
+            with self.subTest(message=message):
+                followup = parse_followup(message)
+                self.assertIsNotNone(followup)
+                self.assertEqual((followup.numbers, followup.pronoun, followup.compare), (numbers, pronoun, compare))
+
+    def test_not_references(self):
+        cases = [
+            'cuanto esta el iphone 13',
+            'cuanto cuesta el 12 pro max de apple',
+            'quiero el 13 mini',
+            'uno con el 8 gb de ram',
+            'el 5g más barato',
+            'este año salió algo bueno?',
+            'hola',
+        ]
+        for message in cases:
+            with self.subTest(message=message):
+                self.assertIsNone(parse_followup(message))
+
+    def test_rest_keeps_model_names(self):
+        self.assertEqual(parse_followup('detalles del 2').rest, 'detalles')
+        self.assertEqual(parse_followup('compara el 2 con el iphone 13').rest, 'compara con el iphone 13')
+
+    def test_pick(self):
+        page = [50, 51, 52, 53, 54]
+        self.assertEqual(pick(page, 1, 2), 51)
+        self.assertEqual(pick(page, 6, 7), 51)
+        self.assertEqual(pick(page, 6, 2), 51)
+        self.assertEqual(pick(page, 1, -1), 54)
+        self.assertIsNone(pick(page, 6, 12))
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_sync_acquire_never_waits(self):
+        limiter = RateLimiter(rate=1, burst=2, max_wait=10)
+        started = time.monotonic()
+        results = [limiter.acquire('ip')[0] for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_cost_spends_several_tokens(self):
+        limiter = RateLimiter(rate=1, burst=10)
+        self.assertTrue(limiter.acquire('ip', cost=8)[0])
+        allowed, retry_after = limiter.acquire('ip', cost=5)
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 2)
+
+
+class BrokenCache:
+    """Caché en base de datos sin su tabla (falta `createcachetable`)"""
+
+    def get(self, *args, **kwargs):
+        raise DatabaseError('no such table: chatbot_state')
+
+    set = delete = get
+
+
+class ConversationStoreTests(SimpleTestCase):
+    def test_missing_cache_table_falls_back_to_process_memory(self):
+        store = ConversationStore()
+        with mock.patch.object(ConversationStore, 'cache', BrokenCache()), self.assertLogs('chatbot.state', 'ERROR'):
+            with store.session('s') as state:
+                state.set('comparison_mode', True)
+            self.assertTrue(store.load('s').get('comparison_mode'))
+
+    def test_unchanged_state_is_not_written(self):
+        store = ConversationStore()
+        cache = mock.Mock(get=mock.Mock(return_value={'comparison_mode': True}))
+        with mock.patch.object(ConversationStore, 'cache', cache):
+            with store.session('s') as state:
+                state.set('comparison_mode', True)
+        cache.set.assert_not_called()
+        cache.delete.assert_not_called()
+
+
+# Filas mínimas de la tabla smartphones para armar un catálogo sin base de datos
+PHONES = [
+    {'brand_name': 'Samsung', 'model': 'Galaxy A54 5G', 'price': 8999, '5G_or_not': 1, 'ram_capacity': 8,
+     'internal_memory': 128, 'battery_capacity': 5000, 'primary_camera_rear': 50, 'processor_speed': 2.4},
+    {'brand_name': 'Samsung', 'model': 'Galaxy S21', 'price': 15999, '5G_or_not': 1, 'ram_capacity': 8,
+     'internal_memory': 256, 'battery_capacity': 4000, 'primary_camera_rear': 12, 'processor_speed': 2.9},
+    {'brand_name': 'Xiaomi', 'model': 'Redmi Note 12', 'price': 4999, '5G_or_not': 0, 'ram_capacity': 6,
+     'internal_memory': 128, 'battery_capacity': 5000, 'primary_camera_rear': 12, 'processor_speed': 2.2},
+    {'brand_name': 'Xiaomi', 'model': 'Xiaomi 13T 5G', 'price': 11999, '5G_or_not': 1, 'ram_capacity': 12,
+     'internal_memory': 256, 'battery_capacity': 5000, 'primary_camera_rear': 50, 'processor_speed': 3.0},
+    {'brand_name': 'Apple', 'model': 'iPhone 13', 'price': 13999, '5G_or_not': 1, 'ram_capacity': 4,
+     'internal_memory': 128, 'battery_capacity': 3240, 'primary_camera_rear': 12, 'processor_speed': 3.2},
+]
+
+
+class FilterTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.catalog = Catalog(PHONES)
+
+    def test_price_ranges(self):
+        cases = [
+            ('entre 8000 y 12000', (8000, 12000)),
+            ('de 8 mil a 12 mil', (8000, 12000)),
+            ('menos de 20 mil', (0, 20000)),
+            ('hasta $15,000', (0, 15000)),
+            ('más de 30k', (30000, math.inf)),
+            ('de 5 a 10 mil', (5000, 10000)),
+            ('entre 5 y 10k', (5000, 10000)),
+            ('el mejor para fotos', None),
+            ('batería de más de 5000', None),
+            ('con bateria mayor a 6000', None),
+            ('más de 5000 de batería', None),
+            ('cámara de más de 1000 megapixeles', None),
+        ]
+        for message, expected in cases:
+            with self.subTest(message=message):
+                self.assertEqual(parse_price_range(message), expected)
+
+    def test_predicates(self):
+        cases = [
+            ('5g con 8gb de ram y más de 5000 mah por menos de 20000', {
+                Predicate('ram_capacity', 8, math.inf), Predicate('battery_capacity', 5000, math.inf),
+                Predicate('5G_or_not', 1, 1), Predicate('price', 0, 20000),
+            }),
+            ('hasta 128gb', {Predicate('internal_memory', 0, 128)}),
+            ('1tb con memoria expandible', {
+                Predicate('internal_memory', 1024, math.inf), Predicate('extended_memory_available', 1, 1),
+            }),
+            ('samsung con 5g', {Predicate('5G_or_not', 1, 1), Predicate('brand_name', 'samsung', 'samsung')}),
+            ('xiaomi 5g', {Predicate('5G_or_not', 1, 1), Predicate('brand_name', 'xiaomi', 'xiaomi')}),
+            ('más de 2.5 ghz', {Predicate('processor_speed', 2.5, math.inf)}),
+            ('pantalla de 6,7 pulgadas', {Predicate('screen_size', 6.7, math.inf)}),
+            ('cámara de 12.5 mp', {Predicate('primary_camera_rear', 12.5, math.inf)}),
+            ('más de 5.000 mah', {Predicate('battery_capacity', 5000, math.inf)}),
+            ('el mejor para fotos', set()),
+        ]
+        for message, expected in cases:
+            with self.subTest(message=message):
+                self.assertEqual(set(parse_filters(message, self.catalog)), expected)
+
+    def test_decimal_processor_speed(self):
+        positions = filter_positions(self.catalog, parse_filters('procesador de más de 2.5 ghz', self.catalog))
+        self.assertEqual({PHONES[pos]['model'] for pos in positions}, {'Galaxy S21', 'Xiaomi 13T 5G', 'iPhone 13'})
+
+    def test_routes(self):
+        cases = [
+            ('samsung con 5g', 'filter'),
+            ('xiaomi 5g', 'filter'),
+            ('samsung 8gb de ram', 'filter'),
+            ('samsung galaxy a54 5g', 'model'),
+            ('galaxy a54 5g', 'model'),
+            ('iphone 13 128gb', 'model'),
+            ('5g con 8gb de ram', 'filter'),
+            ('entre 8000 y 12000', 'price_range'),
+            ('de 5 a 10 mil', 'price_range'),
+            ('batería de más de 5000', 'battery'),
+            ('con bateria mayor a 6000', 'battery'),
+            ('samsung', 'brand'),
+            ('modelos de samsung', 'brand'),
+            ('celulares de xiaomi', 'brand'),
+            ('tienen samsung?', 'brand'),
+            ('samsung con buena cámara', 'camera'),
+            ('sugiere algo barato con buena cámara', 'recommendation'),
+            ('recomiéndame uno con buena batería y pantalla grande', 'recommendation'),
+            ('recomienda uno rápido con buena cámara', 'recommendation'),
+        ]
+        token = _pinned_catalog.set(self.catalog)
+        try:
+            for message, expected in cases:
+                with self.subTest(message=message):
+                    self.assertEqual(route_query(message)[0], expected)
+        finally:
+            _pinned_catalog.reset(token)
+
+    def test_brand_named_anywhere_in_the_message(self):
+        cases = [
+            ('samsung', 'samsung'),
+            ('sams', 'sams'),
+            ('modelos de samsung', 'samsung'),
+            ('¿tienen xiaomi?', 'xiaomi'),
+            ('celulares de apple baratos', 'apple'),
+            ('el mejor para fotos', None),
+        ]
+        for message, expected in cases:
+            with self.subTest(message=message):
+                self.assertEqual(self.catalog.brand_in(message), expected)
+        self.assertEqual(
+            [PHONES[pos]['model'] for pos in self.catalog.brand_positions(self.catalog.brand_in('modelos de xiaomi'))],
+            ['Redmi Note 12', 'Xiaomi 13T 5G'],
+        )
+
+    def test_recommendation_weighs_every_priority(self):
+        # Solo por precio ganaría el Redmi y solo por cámara empatarían el A54 y el 13T
+        token = _pinned_catalog.set(self.catalog)
+        try:
+            route, handler = route_query('sugiere algo barato con buena cámara')
+            with recording_listing() as offered:
+                handler()
+        finally:
+            _pinned_catalog.reset(token)
+        self.assertEqual(route, 'recommendation')
+        models = [PHONES[pos]['model'] for pos in offered['results'][0]]
+        self.assertEqual(models, ['Galaxy A54 5G', 'Xiaomi 13T 5G', 'Redmi Note 12'])
+
+
+# Catálogo con más teléfonos que una página, para "ver más"
+MANY_PHONES = [
+    {'brand_name': 'Samsung', 'model': f'Galaxy A{i}', 'price': 5000 + 1000 * i, 'battery_capacity': 5000,
+     'screen_size': 6.5}
+    for i in range(12)
+] + [{'brand_name': 'Apple', 'model': 'iPhone 13', 'price': 13999, 'battery_capacity': 3240, 'screen_size': 6.1}]
+
+
+@override_settings(CHATBOT_STATE_CACHE='default')
+class ListingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.catalog = Catalog(MANY_PHONES)
+
+    def setUp(self):
+        response_cache.clear()
+        token = _pinned_catalog.set(self.catalog)
+        self.addCleanup(_pinned_catalog.reset, token)
+
+    def ask(self, message, session_id):
+        data, status = answer_message(message, session_id)
+        self.assertEqual(status, 200, data)
+        return data
+
+    def shown(self, data):
+        """Modelos que aparecen en la respuesta, en el orden en que se muestran"""
+        found = ((re.search(rf"\b{phone['model']}\b", data['response']), phone['model']) for phone in MANY_PHONES)
+        return [model for _, model in sorted((match.start(), model) for match, model in found if match)]
+
+    def paginate(self, message, session_id):
+        data = self.ask(message, session_id)
+        pages = [self.shown(data)]
+        while 'Ver más' in data['options']:
+            data = self.ask('ver más', session_id)
+            pages.append(self.shown(data))
+        return pages, self.ask('ver más', session_id)
+
+    def test_brand_listing_pages_without_repeating(self):
+        for message in ('samsung', 'modelos de samsung', '¿tienen samsung?'):
+            with self.subTest(message=message):
+                pages, last = self.paginate(message, f'brand-{message}')
+                self.assertEqual([len(page) for page in pages], [PAGE_SIZE, PAGE_SIZE, 2])
+                seen = [model for page in pages for model in page]
+                self.assertEqual(sorted(seen), sorted(f'Galaxy A{i}' for i in range(12)))
+                self.assertIn('Ya te mostré todos', last['response'])
+
+    def test_semantic_results_continue(self):
+        pages, _ = self.paginate('algo para mi abuela', 'semantic')
+        self.assertGreater(len(pages), 1)
+        seen = [model for page in pages for model in page]
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 12)
+
+    def test_numbers_beyond_the_list_are_not_references(self):
+        first = self.shown(self.ask('samsung', 'refs'))
+        # Con cinco resultados a la vista, "el 13" es el modelo y no la opción 13
+        self.assertEqual(self.shown(self.ask('tienen el 13?', 'refs')), ['iPhone 13'])
+        self.assertEqual(self.shown(self.ask('detalles del 2', 'refs')), [first[1]])
+
+    def test_more_without_listing(self):
+        data = self.ask('ver más', 'fresh')
+        self.assertIn('No hay más resultados', data['response'])
+
+
+@override_settings(CHATBOT_STATE_CACHE='default')
+class BatchTests(SimpleTestCase):
+    def setUp(self):
+        token = _pinned_catalog.set(Catalog(PHONES))
+        self.addCleanup(_pinned_catalog.reset, token)
+
+    def post(self, items, ip):
+        request = RequestFactory().post(
+            '/api/chat/batch/', data={'items': items, 'parallel': True},
+            content_type='application/json', REMOTE_ADDR=ip,
+        )
+        return views.chat_batch(request)
+
+    def test_batch_costs_one_token_regardless_of_size(self):
+        items = [{'message': 'hola', 'session_id': f's{i % 8}'} for i in range(100)]
+        with mock.patch.object(views, 'RATE_LIMIT_ENABLED', True):
+            first = self.post(items, '10.0.0.1')
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(self.post(items, '10.0.0.1').status_code, 200)
+            with self.assertLogs('chatbot.views', 'WARNING'):
+                self.assertEqual(self.post(items[:1], '10.0.0.1').status_code, 429)
+        self.assertEqual([result['status'] for result in json.loads(first.content)['results']], [200] * 100)
+
+
+def baseline_find_phone(phones, query):
+    """find_phone_by_query de la versión original: recorre todo el catálogo con difflib"""
+    query_lower = query.lower().strip()
+    index = {phone['model']: phone for phone in phones}
+    for model, phone in index.items():
+        if query_lower == model.lower():
+            return phone
+    for phone in phones:
+        if query_lower == f"{phone['brand_name'].lower()} {phone['model'].lower()}":
+            return phone
+    best_match, best_score = None, 0
+    for phone in phones:
+        full_name = f"{phone['brand_name'].lower()} {phone['model'].lower()}"
+        score = max(SequenceMatcher(None, query_lower, full_name).ratio(),
+                    SequenceMatcher(None, query_lower, phone['model'].lower()).ratio())
+        if score > best_score and score > 0.6:
+            best_match, best_score = phone, score
+    return best_match
+
+
+class CatalogIndexTests(SimpleTestCase):
+    """Los índices del catálogo responden lo mismo que los recorridos de la versión original"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        names = [name for name, _ in COLUMNS]
+        cls.phones = [dict(zip(names, row)) for row in generate_phones(400, seed=3)]
+        cls.catalog = Catalog(cls.phones)
+
+    def test_model_lookup_matches_baseline(self):
+        sample = self.phones[::37]
+        queries = (
+            [phone['model'] for phone in sample]
+            + [f"{phone['brand_name']} {phone['model']}".upper() for phone in sample]
+            + [phone['model'][:-1] for phone in sample]
+            + [f"{phone['brand_name']} {phone['model'][1:]}" for phone in sample]
+            + ['hola', 'quiero un celular', 'zzz']
+        )
+        for query in queries:
+            with self.subTest(query=query):
+                expected = baseline_find_phone(self.phones, query)
+                pos = find_phone_position(query, self.catalog)
+                self.assertEqual(None if pos is None else self.phones[pos]['model'],
+                                 None if expected is None else expected['model'])
+
+    def test_rankings_match_baseline_sorts(self):
+        for name, (required, keys, descending) in RANKINGS.items():
+            with self.subTest(ranking=name):
+                expected = sorted(
+                    [i for i, phone in enumerate(self.phones) if all(phone.get(column) for column in required)],
+                    key=lambda i: tuple(
+                        self.phones[i].get(column) if self.phones[i].get(column) is not None else default
+                        for column, default in keys
+                    ),
+                    reverse=descending,
+                )
+                self.assertEqual(self.catalog.rankings[name].tolist(), expected)
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_snapshot(self.catalog, directory, marker='m1')
+            self.assertEqual(current_snapshot(directory), {'version': self.catalog.version, 'marker': 'm1'})
+            mapped = Catalog.from_snapshot(directory, self.catalog.version)
+            self.assertEqual(mapped.source, 'snapshot')
+            self.assertEqual(mapped.phones(range(len(mapped))), self.catalog.phones(range(len(self.catalog))))
+            for name, ranking in self.catalog.rankings.items():
+                self.assertEqual(mapped.rankings[name].tolist(), ranking.tolist())
+            for phone in self.phones[::50]:
+                self.assertEqual(find_phone_position(phone['model'], mapped),
+                                 find_phone_position(phone['model'], self.catalog))
+            self.assertEqual(mapped.semantic.search('batería que dure').tolist(),
+                             self.catalog.semantic.search('batería que dure').tolist())
+            del mapped
+
+
+@override_settings(CHATBOT_CATALOG_SNAPSHOT_DIR=None)
+class CatalogManagerTests(SimpleTestCase):
+    def test_unchanged_marker_skips_reload(self):
+        loader = mock.Mock(return_value=PHONES)
+        markers = iter(['(5, 15999)', '(5, 15999)', '(6, 15999)'])
+        manager = CatalogManager(loader=loader, marker=lambda: next(markers))
+        self.assertEqual([manager.refresh(), manager.refresh()], [True, False])
+        self.assertEqual(loader.call_count, 1)
+        manager.refresh()
+        self.assertEqual(loader.call_count, 2)
+
+    @override_settings(CHATBOT_CATALOG_MARKER_SQL='SELECT COUNT(*), MAX(id) FROM smartphones')
+    def test_marker_query_from_settings(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (5, 42)
+        with mock.patch('chatbot.catalog.connection') as connection:
+            connection.cursor.return_value = cursor
+            connection.vendor = 'sqlite'
+            self.assertEqual(fetch_catalog_marker(), '(5, 42)')
+        cursor.__enter__.return_value.execute.assert_called_once_with('SELECT COUNT(*), MAX(id) FROM smartphones')
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def test_entries_expire(self):
+        cache = ResponseCache(max_entries=10, ttl=60)
+        with mock.patch('chatbot.response_cache.time.monotonic', return_value=1000):
+            cache.set('a', 1)
+        with mock.patch('chatbot.response_cache.time.monotonic', return_value=1059):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('chatbot.response_cache.time.monotonic', return_value=1061):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResponseCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(cache.evictions, 1)
+
+
+class PhrasingTests(SimpleTestCase):
+    def test_same_seed_same_choices(self):
+        picks = []
+        for _ in range(2):
+            with seeded_phrasing('1|hola'):
+                picks.append([choose(range(100)) for _ in range(10)])
+        self.assertEqual(picks[0], picks[1])
+
+    def test_session_keeps_its_phrasing(self):
+        self.assertEqual(phrasing_variant('sesion-1', 3), phrasing_variant('sesion-1', 3))
+        token = _pinned_catalog.set(Catalog(MANY_PHONES))
+        try:
+            answers = []
+            for _ in range(2):
+                response_cache.clear()
+                answers.append(process_any_query('samsung', session_id='sesion-1'))
+        finally:
+            _pinned_catalog.reset(token)
+        self.assertEqual(answers[0], answers[1])
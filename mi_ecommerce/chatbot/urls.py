@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from chatbot import views
@@ -5,6 +6,14 @@ from chatbot import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/chat/', views.chat, name='chat'),  # Usa views.chat en lugar de views.api_chat
+    path('api/chat/stream/', views.chat_stream, name='chat_stream'),  # SSE, requiere servidor ASGI
     path('', views.chat, name='chatbot_main'),   # Esto también apunta a chat
 ]
 
+# Endpoint por lotes para QA y pruebas de carga: no se publica salvo que se active en settings
+if getattr(settings, 'CHATBOT_BATCH_ENABLED', False):
+    urlpatterns.append(path('api/chat/batch/', views.chat_batch, name='chat_batch'))
+
+# Métricas internas (pid, memoria, latencias): sin login, así que solo se publican si se activan en settings
+if getattr(settings, 'CHATBOT_METRICS_ENABLED', False):
+    urlpatterns.append(path('api/chat/metrics/', views.chat_metrics, name='chat_metrics'))
@@ -1,29 +1,91 @@
-import re
 import json
+import math
 import logging
-import random
-from django.http import JsonResponse
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
-from django.db import connection
-from django.core.cache import cache
+from django.views.decorators.http import require_GET, require_http_methods
+from django.conf import settings
+from django.db import connections
+
+from .catalog import get_catalog, pinned_catalog
+from .entities import MAX_COMPARED, TurnEntities, find_phone_position, unique
+from .filters import describe_filters, filter_positions, is_structured, parse_filters
+from .followups import parse_followup, pick
+from .config import OPENAI_API_KEY
+from .intents import FEATURE_INTENTS, detect_intents
+from .llm import LLMClient, build_messages, defer, recording_deferred
+from .listings import (
+    PAGE_SIZE, affine_permutation, has_more, listing_positions, listing_size, offer_more, recording_listing,
+    show_results,
+)
+from .metrics import metrics, process_memory
+from .prices import parse_price_range
+from .ratelimit import RateLimiter, client_ip
+from .phrasing import choose, current_rng, phrasing_variant, seeded_phrasing
+from .response_cache import ResponseCache, normalize_query
+from .state import conversation_store, pack_phones, unpack_phones
 
 logger = logging.getLogger(__name__)
 
-# Precargar datos de smartphones
-try:
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM smartphones")
-        columns = [col[0] for col in cursor.description]
-        smartphones_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        logger.info(f"Base de datos cargada con {len(smartphones_data)} celulares")
-        
-        # Crear índice por modelo para búsquedas más rápidas
-        phone_index = {phone['model'].lower(): phone for phone in smartphones_data}
-except Exception as e:
-    logger.error(f"Error al cargar smartphones: {str(e)}")
-    smartphones_data = []
-    phone_index = {}
+# Respuestas ya calculadas por (versión del catálogo, consulta normalizada, variante de redacción)
+response_cache = ResponseCache(
+    max_entries=getattr(settings, 'CHATBOT_RESPONSE_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'CHATBOT_RESPONSE_CACHE_TTL', 300),
+)
+PHRASING_VARIANTS = getattr(settings, 'CHATBOT_PHRASING_VARIANTS', 3)
+
+# Cuerpos de tablas de comparación por (versión del catálogo, posiciones ordenadas)
+comparison_cache = ResponseCache(
+    max_entries=getattr(settings, 'CHATBOT_COMPARISON_CACHE_SIZE', 512),
+    ttl=getattr(settings, 'CHATBOT_COMPARISON_CACHE_TTL', 3600),
+)
+BATCH_MAX_ITEMS = getattr(settings, 'CHATBOT_BATCH_MAX_ITEMS', 1000)
+BATCH_WORKERS = getattr(settings, 'CHATBOT_BATCH_WORKERS', 4)
+
+# Límite de mensajes por IP y por sesión, comprobado antes de cualquier trabajo sobre el catálogo
+RATE_LIMIT_ENABLED = getattr(settings, 'CHATBOT_RATE_LIMIT_ENABLED', True)
+ip_limiter = RateLimiter(
+    rate=getattr(settings, 'CHATBOT_RATE_LIMIT_IP_RATE', 5),
+    burst=getattr(settings, 'CHATBOT_RATE_LIMIT_IP_BURST', 30),
+    alias=getattr(settings, 'CHATBOT_RATE_LIMIT_CACHE', None),
+    max_wait=getattr(settings, 'CHATBOT_RATE_LIMIT_MAX_WAIT', 0.5),
+    prefix='chatbot:rl:ip',
+)
+session_limiter = RateLimiter(
+    rate=getattr(settings, 'CHATBOT_RATE_LIMIT_SESSION_RATE', 1),
+    burst=getattr(settings, 'CHATBOT_RATE_LIMIT_SESSION_BURST', 5),
+    alias=getattr(settings, 'CHATBOT_RATE_LIMIT_CACHE', None),
+    max_wait=getattr(settings, 'CHATBOT_RATE_LIMIT_MAX_WAIT', 0.5),
+    prefix='chatbot:rl:session',
+)
+# Los lotes tienen su propio límite por IP: cada lote gasta una ficha, sin importar cuántos mensajes traiga
+batch_limiter = RateLimiter(
+    rate=getattr(settings, 'CHATBOT_RATE_LIMIT_BATCH_RATE', 0.2),
+    burst=getattr(settings, 'CHATBOT_RATE_LIMIT_BATCH_BURST', 2),
+    alias=getattr(settings, 'CHATBOT_RATE_LIMIT_CACHE', None),
+    prefix='chatbot:rl:batch',
+)
+
+# Respaldo con modelo de lenguaje para las preguntas que ninguna ruta entiende (desactivado por defecto)
+llm_fallback = LLMClient(
+    url=getattr(settings, 'CHATBOT_LLM_URL', ''),
+    api_key=getattr(settings, 'CHATBOT_LLM_API_KEY', None) or OPENAI_API_KEY,
+    model=getattr(settings, 'CHATBOT_LLM_MODEL', ''),
+    timeout=getattr(settings, 'CHATBOT_LLM_TIMEOUT', 4.0),
+    connect_timeout=getattr(settings, 'CHATBOT_LLM_CONNECT_TIMEOUT', 1.0),
+    max_concurrency=getattr(settings, 'CHATBOT_LLM_MAX_CONCURRENCY', 8),
+    max_tokens=getattr(settings, 'CHATBOT_LLM_MAX_TOKENS', 300),
+    cache_size=getattr(settings, 'CHATBOT_LLM_CACHE_SIZE', 512),
+    cache_ttl=getattr(settings, 'CHATBOT_LLM_CACHE_TTL', 3600),
+) if getattr(settings, 'CHATBOT_LLM_ENABLED', False) else None
+LLM_CONTEXT_PHONES = getattr(settings, 'CHATBOT_LLM_CONTEXT_PHONES', 5)
+if llm_fallback is not None and not llm_fallback.available:
+    logger.warning("CHATBOT_LLM_ENABLED está activo pero falta httpx o CHATBOT_LLM_URL; se usará la respuesta genérica")
 
 # Listas de respuestas naturales
 GREETINGS = [
@@ -62,8 +124,36 @@ COMPARISON_STARTS = [
     "Analizando las diferencias entre estos smartphones:"
 ]
 
+def rate_limit_response(limiter, key):
+    """
+    Respuesta 429 si la clave agotó sus mensajes, o None si puede seguir.
+    Nunca espera: un hilo del worker dormido sería peor que un reintento del cliente.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+    allowed, retry_after = limiter.acquire(key)
+    return None if allowed else too_many_requests(limiter, key, retry_after)
+
+async def rate_limit_response_async(limiter, key):
+    """Como rate_limit_response, pero puede esperar hasta max_wait sin ocupar un hilo"""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    allowed, retry_after = await limiter.acquire_async(key)
+    return None if allowed else too_many_requests(limiter, key, retry_after)
+
+def too_many_requests(limiter, key, retry_after, error=None):
+    logger.warning(f"Límite de mensajes alcanzado - {limiter.prefix} - {key}")
+    response = JsonResponse({
+        "error": error or "Estás enviando mensajes muy rápido. Espera un momento e inténtalo de nuevo.",
+        "options": ["Reintentar"]
+    }, status=429)
+    response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
+
 @csrf_exempt
 @require_http_methods(["POST", "OPTIONS"])
+@pinned_catalog()
 def chat(request):
     """
     Endpoint del chatbot con manejo explícito de CORS y gestión robusta de errores
@@ -82,6 +172,11 @@ def chat(request):
         response["Access-Control-Allow-Origin"] = "*"
         return response
 
+    # Rechazar a quien satura el servidor antes de leer siquiera el mensaje
+    limited = rate_limit_response(ip_limiter, client_ip(request))
+    if limited:
+        return limited
+
     # Manejo de peticiones POST
     try:
         # Validación del cuerpo de la solicitud
@@ -97,6 +192,10 @@ def chat(request):
                     "options": ["Ver opciones", "Ayuda"]
                 }, status=400)
 
+            limited = rate_limit_response(session_limiter, str(session_id))
+            if limited:
+                return limited
+
         except json.JSONDecodeError as e:
             logger.error(f"Error de JSON - Session: {session_id} - Error: {str(e)}")
             return build_response({
@@ -104,131 +203,429 @@ def chat(request):
                 "options": ["Reintentar", "Ayuda"]
             }, status=400)
 
-        try:
-            # Verificar si el usuario está en modo comparación
-            comparison_mode = cache.get(f"comparison_mode_{session_id}", False)
+        data, status = answer_message(user_message, session_id)
+        with metrics.stage('render'):
+            return build_response(data, status)
+
+    except Exception as e:
+        logger.critical(f"Error crítico en endpoint - Error: {str(e)}", exc_info=True)
+        return build_response({
+            "error": "Error interno del servidor. Por favor intenta más tarde.",
+            "options": ["Reintentar", "Contactar soporte"]
+        }, status=500)
+
+
+    except Exception as e:
+        logger.error(f"Error en chat: {str(e)}")
+        response = JsonResponse({
+            "error": "Vaya, parece que hubo un problema. Por favor intenta con otra pregunta",
+            "options": ["Reintentar", "Ayuda"]
+        }, status=500)
+        response["Access-Control-Allow-Origin"] = "*"
+        return response
+
+@pinned_catalog()
+def answer_message(user_message, session_id):
+    """
+    Genera la respuesta del chatbot a un mensaje ya validado.
+    Devuelve (datos, código HTTP); la comparten los endpoints normal y de streaming.
+    """
+    started = time.perf_counter()
+    try:
+        # Referencias a la lista anterior ("detalles del 2"), sobre el texto sin corregir
+        followup = parse_followup(user_message)
+
+        # Corregir la ortografía una sola vez, antes de buscar intenciones y modelos
+        with metrics.stage('spelling'):
+            user_message, corrections = get_catalog().speller.correct(user_message)
+        if corrections:
+            metrics.count('spelling_corrections', corrections)
+
+        # Todo el estado de la sesión se lee y se escribe en un solo lote
+        with conversation_store.session(session_id) as state, recording_listing() as offered:
+            listing = state.get('listing')
             
+            # "detalles del 2", "compara el 1 y el 3": por índice sobre lo último que se mostró
+            answered = None
+            if followup is not None:
+                with metrics.stage('handler'):
+                    answered = answer_followup(followup, state, user_message)
+
+            if answered is not None:
+                route, response_text = answered
+                if state.get('comparison_mode', False):
+                    state.delete('comparison_mode')
+                metrics.record_route(route, time.perf_counter() - started)
+                if route == 'followup_comparison':
+                    options = ["Comparar otros", "Ver características", "Ayuda"]
+                else:
+                    remaining = listing and has_more(get_catalog(), listing, listing['next'])
+                    options = (["Ver más"] if remaining else []) + ["Comparar modelos", "Ayuda"]
             # Procesamiento especial si está en modo comparación
-            if comparison_mode:
+            elif state.get('comparison_mode', False):
                 logger.info(f"Modo comparación activo - Session: {session_id}")
                 # Limpiar el modo comparación para futuras interacciones
-                cache.delete(f"comparison_mode_{session_id}")
-                cache.delete(f"comparison_phones_{session_id}")
-                
+                state.delete('comparison_mode', 'comparison_phones')
+
                 # Procesar la comparación
-                response_text = handle_comparison_request(user_message, session_id)
+                with metrics.stage('handler'):
+                    response_text = handle_comparison_request(user_message, state, TurnEntities(user_message))
+                metrics.record_route('comparison', time.perf_counter() - started)
                 options = ["Comparar otros", "Ver características", "Ayuda"]
             else:
-                # Verificar si el mensaje ya contiene modelos para comparar
-                phones_to_compare = extract_phones_from_query(user_message)
-                
-                if len(phones_to_compare) >= 2 and is_comparison_query(user_message):
+                # Detectar todas las intenciones del mensaje en una sola pasada
+                with metrics.stage('intents'):
+                    intents = detect_intents(user_message)
+
+                # Los modelos que menciona el mensaje se resuelven una sola vez y solo si alguien los pide
+                entities = TurnEntities(user_message)
+                more = bool(listing) and 'more' in intents
+                comparison = is_comparison_query(user_message, intents)
+                phones_to_compare = []
+                if comparison and not more:
+                    with metrics.stage('entities'):
+                        phones_to_compare = entities.compared
+
+                if more:
+                    # Continuar el último listado desde donde quedó
+                    with metrics.stage('handler'):
+                        response_text = generate_more_response(listing, listing['next'])
+                    metrics.record_route('more', time.perf_counter() - started)
+                    next_start = listing['next'] + PAGE_SIZE
+                    state.set('listing', {**listing, 'next': next_start})
+                    remaining = has_more(get_catalog(), listing, next_start)
+                    options = (["Ver más"] if remaining else []) + ["Comparar modelos", "Ayuda"]
+                elif intents == {'more'}:
+                    # "ver más" sin un listado que continuar: decirlo en vez de caer en la respuesta genérica
+                    response_text = "No hay más resultados que mostrarte. ¿Quieres buscar otra cosa?"
+                    metrics.record_route('more', time.perf_counter() - started)
+                    options = ["Comparar modelos", "Ayuda"]
+                elif len(phones_to_compare) >= 2:
                     logger.info(f"Comparación directa detectada - Session: {session_id}")
-                    response_text = handle_comparison_request(user_message, session_id)
+                    with metrics.stage('handler'):
+                        response_text = handle_comparison_request(user_message, state, entities)
+                    metrics.record_route('comparison', time.perf_counter() - started)
                     options = ["Comparar otros", "Ver características", "Ayuda"]
-                elif is_comparison_query(user_message):
+                elif comparison:
                     logger.info(f"Solicitud de comparación - Session: {session_id}")
-                    response_text = random.choice(COMPARISON_PROMPTS)
+                    response_text = choose(COMPARISON_PROMPTS)
                     # Activar modo comparación para la siguiente interacción
-                    cache.set(f"comparison_mode_{session_id}", True, timeout=60*5)
+                    state.set('comparison_mode', True)
+                    metrics.record_route('comparison_prompt', time.perf_counter() - started)
                     options = ["Cancelar comparación"]
                 else:
                     # Procesamiento normal para otras consultas
-                    response_text = process_any_query(user_message)
-                    options = get_contextual_options(user_message)
-            
-            logger.info(f"Respuesta exitosa - Session: {session_id}")
-            return build_response({
-                "response": response_text,
-                "options": options,
-                "source": "database"
-            })
+                    response_text = process_any_query(user_message, intents, session_id, entities)
+                    options = get_contextual_options(user_message, intents)
+                    
+                    # Guardar el cursor del listado mostrado (o descartar el anterior)
+                    if offered.get('listing'):
+                        state.set('listing', {
+                            **offered['listing'], 'next': PAGE_SIZE, 'version': get_catalog().version
+                        })
+                        if has_more(get_catalog(), offered['listing'], PAGE_SIZE):
+                            options = ["Ver más"] + options[:2]
+                    elif listing:
+                        state.delete('listing')
 
-        except KeyError as e:
-            logger.error(f"Falta campo en datos - Session: {session_id} - Error: {str(e)}")
-            return build_response({
-                "error": f"Falta información requerida: {str(e)}",
-                "options": ["Reintentar", "Ayuda"]
-            }, status=400)
+            # Recordar los teléfonos que se mostraron numerados (aunque la página tenga uno solo):
+            # una lista reemplaza a la anterior y la ficha de un teléfono queda como "ese"
+            if offered.get('results'):
+                positions, first, numbered = offered['results']
+                if numbered and positions:
+                    state.set('results', {'first': first, 'phones': pack_phones(get_catalog(), positions)})
+                    state.delete('focus')
+                elif positions:
+                    state.set('focus', pack_phones(get_catalog(), positions))
 
-        except ValueError as e:
-            logger.error(f"Error de valor - Session: {session_id} - Error: {str(e)}")
-            return build_response({
-                "error": f"Datos inválidos: {str(e)}",
-                "options": ["Reintentar", "Ayuda"]
-            }, status=400)
+        elapsed = time.perf_counter() - started
+        metrics.observe('total', elapsed)
+        logger.info(f"Respuesta exitosa - Session: {session_id} - {elapsed * 1000:.1f} ms")
+        return {
+            "response": response_text,
+            "options": options,
+            "source": "database"
+        }, 200
 
-        except Exception as e:
-            logger.error(f"Error al procesar mensaje - Session: {session_id} - Error: {str(e)}", exc_info=True)
-            return build_response({
-                "error": f"Error al procesar tu solicitud: {str(e)}",
-                "options": ["Reintentar", "Ayuda"]
-            }, status=500)
+    except KeyError as e:
+        logger.error(f"Falta campo en datos - Session: {session_id} - Error: {str(e)}")
+        return {
+            "error": f"Falta información requerida: {str(e)}",
+            "options": ["Reintentar", "Ayuda"]
+        }, 400
+
+    except ValueError as e:
+        logger.error(f"Error de valor - Session: {session_id} - Error: {str(e)}")
+        return {
+            "error": f"Datos inválidos: {str(e)}",
+            "options": ["Reintentar", "Ayuda"]
+        }, 400
 
     except Exception as e:
-        logger.critical(f"Error crítico en endpoint - Error: {str(e)}", exc_info=True)
-        return build_response({
-            "error": "Error interno del servidor. Por favor intenta más tarde.",
-            "options": ["Reintentar", "Contactar soporte"]
-        }, status=500)
+        logger.error(f"Error al procesar mensaje - Session: {session_id} - Error: {str(e)}", exc_info=True)
+        metrics.count('errors')
+        return {
+            "error": f"Error al procesar tu solicitud: {str(e)}",
+            "options": ["Reintentar", "Ayuda"]
+        }, 500
 
 
-    except Exception as e:
-        logger.error(f"Error en chat: {str(e)}")
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+@pinned_catalog()
+def chat_batch(request):
+    """
+    Procesa varios mensajes en una sola petición (pruebas de QA y de carga).
+
+    Recibe {"items": [{"message": ..., "session_id": ...}, ...], "parallel": false}
+    (o directamente la lista) y devuelve los resultados en el mismo orden, cada
+    uno con su código y su tiempo. Con parallel, las sesiones distintas se
+    procesan en paralelo; los mensajes de una misma sesión siempre en orden.
+    La URL solo existe con CHATBOT_BATCH_ENABLED (ver urls.py).
+    """
+    if request.method == "OPTIONS":
+        response = JsonResponse({}, status=200)
+        response["Access-Control-Allow-Origin"] = "*"
+        response["Access-Control-Allow-Methods"] = "POST, OPTIONS"
+        response["Access-Control-Allow-Headers"] = "Content-Type"
+        return response
+
+    def build_response(data, status=200):
+        response = JsonResponse(data, status=status)
+        response["Access-Control-Allow-Origin"] = "*"
+        return response
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error de JSON en lote - Error: {str(e)}")
+        return build_response({"error": "Formato de solicitud inválido"}, status=400)
+
+    items = data.get("items") if isinstance(data, dict) else data
+    parallel = isinstance(data, dict) and bool(data.get("parallel", False))
+    if not isinstance(items, list) or not items:
+        return build_response({"error": "Se esperaba una lista de mensajes en 'items'"}, status=400)
+    if len(items) > BATCH_MAX_ITEMS:
+        return build_response({"error": f"Máximo {BATCH_MAX_ITEMS} mensajes por lote"}, status=400)
+
+    # El lote entero gasta una ficha de su propio límite (el tamaño ya lo acota BATCH_MAX_ITEMS)
+    limited = rate_limit_response(batch_limiter, client_ip(request))
+    if limited:
+        return limited
+
+    started = time.perf_counter()
+    results = [None] * len(items)
+
+    def process(index):
+        item_started = time.perf_counter()
+        item = items[index]
+        session_id = item.get("session_id", "default") if isinstance(item, dict) else "default"
+        message = item.get("message", "") if isinstance(item, dict) else ""
+        if not isinstance(message, str) or not message.strip():
+            result, status = {"error": "Mensaje vacío o inválido"}, 400
+        else:
+            result, status = answer_message(message.strip(), session_id)
+        results[index] = {
+            "index": index,
+            "session_id": session_id,
+            "status": status,
+            "elapsed_ms": round((time.perf_counter() - item_started) * 1000, 3),
+            **result,
+        }
+
+    # Los mensajes de una misma sesión dependen del estado que deja el anterior
+    sessions = {}
+    for index, item in enumerate(items):
+        session_id = item.get("session_id", "default") if isinstance(item, dict) else "default"
+        sessions.setdefault(str(session_id), []).append(index)
+
+    def process_session(indexes, close_connections=False):
+        for index in indexes:
+            process(index)
+            # Los hilos del pool abren sus propias conexiones (estado en base de datos): no dejarlas abiertas
+            if close_connections:
+                connections.close_all()
+
+    if parallel and len(sessions) > 1:
+        # Cada hilo hereda el contexto (catálogo fijado para todo el lote)
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(sessions))) as executor:
+            list(executor.map(
+                lambda indexes: context.copy().run(process_session, indexes, True), sessions.values()
+            ))
+    else:
+        for indexes in sessions.values():
+            process_session(indexes)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Lote procesado - {len(items)} mensajes en {elapsed * 1000:.1f} ms")
+    return build_response({
+        "results": results,
+        "count": len(results),
+        "parallel": parallel,
+        "elapsed_ms": round(elapsed * 1000, 3),
+    })
+
+def sse_event(event, data):
+    """Formatea un evento Server-Sent Events con datos JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+async def chat_stream(request):
+    """
+    Variante asíncrona del chat que envía la respuesta como Server-Sent Events.
+
+    Emite 'start' de inmediato, luego la respuesta línea por línea en eventos
+    'chunk' y al final 'done' con las opciones (o 'error'). Servido por ASGI,
+    un cliente lento no ocupa un hilo mientras recibe los eventos. Es la única
+    vista que espera al modelo de lenguaje cuando su respuesta no está en caché.
+
+    Los 'chunk' se arman después: los manejadores generan la respuesta
+    completa (tarda milisegundos) y recién entonces se parte en líneas. Lo que
+    se adelanta es 'start', no el contenido; el tiempo hasta el primer 'chunk'
+    es el de la respuesta entera.
+    """
+    if request.method == "OPTIONS":
+        response = JsonResponse({}, status=200)
+        response["Access-Control-Allow-Origin"] = "*"
+        response["Access-Control-Allow-Methods"] = "POST, OPTIONS"
+        response["Access-Control-Allow-Headers"] = "Content-Type"
+        return response
+
+    # Aquí sí se puede esperar un poco la ficha siguiente: asyncio.sleep no ocupa un hilo
+    limited = await rate_limit_response_async(ip_limiter, client_ip(request))
+    if limited:
+        return limited
+
+    try:
+        data = json.loads(request.body)
+        user_message = data.get("message", "").strip()
+        session_id = data.get("session_id", "default")
+    except (json.JSONDecodeError, AttributeError) as e:
+        logger.error(f"Error de JSON en streaming - Error: {str(e)}")
         response = JsonResponse({
-            "error": "Vaya, parece que hubo un problema. Por favor intenta con otra pregunta",
+            "error": "Formato de solicitud inválido",
             "options": ["Reintentar", "Ayuda"]
-        }, status=500)
+        }, status=400)
+        response["Access-Control-Allow-Origin"] = "*"
+        return response
+
+    if not user_message:
+        response = JsonResponse({
+            "error": "Por favor, cuéntame qué celular o características estás buscando",
+            "options": ["Ver opciones", "Ayuda"]
+        }, status=400)
         response["Access-Control-Allow-Origin"] = "*"
         return response
 
-def is_comparison_query(query):
+    limited = await rate_limit_response_async(session_limiter, str(session_id))
+    if limited:
+        return limited
+
+    def answer():
+        with recording_deferred() as deferred:
+            return answer_message(user_message, session_id), deferred.get('request')
+
+    async def events():
+        yield sse_event("start", {"session_id": session_id})
+        # El procesamiento es síncrono (caché, catálogo); corre en el pool de hilos
+        (result, status), deferred = await sync_to_async(answer, thread_sensitive=False)()
+        if status != 200:
+            yield sse_event("error", {**result, "status": status})
+            return
+        if deferred is not None:
+            # La respuesta del modelo aún no estaba: aquí sí se espera, con await y sin ocupar un hilo
+            with metrics.stage('llm'):
+                llm_answer = await llm_fallback.complete(*deferred)
+            if llm_answer:
+                result = {**result, "response": llm_reply(llm_answer)}
+        # Partición posterior de la respuesta ya completa (ver el docstring)
+        for line in result["response"].splitlines(keepends=True):
+            yield sse_event("chunk", {"text": line})
+        yield sse_event("done", {"options": result["options"], "source": result["source"]})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Evitar que un proxy (nginx) acumule los eventos
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
+
+@require_GET
+def chat_metrics(request):
+    """
+    Métricas internas del chatbot (por proceso): latencia por etapa y por ruta,
+    tasa de consultas no entendidas, uso de la caché, límite de mensajes, respaldo con
+    modelo de lenguaje y memoria del worker
+    (incluida la parte compartida del catálogo). Con ?format=prometheus
+    se devuelven en formato de texto para que Prometheus las recolecte.
+    La URL solo existe con CHATBOT_METRICS_ENABLED (ver urls.py).
+    """
+    memory = process_memory()
+    if request.GET.get("format") == "prometheus":
+        cache_stats = response_cache.stats()
+        lines = [
+            "# TYPE chatbot_response_cache_total counter",
+            f'chatbot_response_cache_total{{result="hit"}} {cache_stats["hits"]}',
+            f'chatbot_response_cache_total{{result="miss"}} {cache_stats["misses"]}',
+            "# TYPE chatbot_rate_limit_total counter",
+        ] + [
+            f'chatbot_rate_limit_total{{limiter="{name}",result="{result}"}} {limiter.stats()[result]}'
+            for name, limiter in (("ip", ip_limiter), ("session", session_limiter), ("batch", batch_limiter))
+            for result in ("allowed", "delayed", "rejected")
+        ] + ([
+            "# TYPE chatbot_llm_total counter",
+        ] + [
+            f'chatbot_llm_total{{result="{result}"}} {llm_fallback.stats()[result]}'
+            for result in ("requests", "shared", "rejected", "timeouts", "errors")
+        ] if llm_fallback is not None else []) + [
+            "# TYPE chatbot_process_memory_bytes gauge",
+        ] + [
+            f'chatbot_process_memory_bytes{{pid="{memory["pid"]}",kind="{name[:-3]}"}} {int(value * 2 ** 20)}'
+            for name, value in memory.items() if name.endswith("_mb")
+        ]
+        return HttpResponse(metrics.prometheus() + "\n".join(lines) + "\n",
+                            content_type="text/plain; version=0.0.4")
+
+    return JsonResponse({
+        "catalog_version": get_catalog().version,
+        "response_cache": response_cache.stats(),
+        "comparison_cache": comparison_cache.stats(),
+        "rate_limit": {
+            "enabled": RATE_LIMIT_ENABLED, "ip": ip_limiter.stats(), "session": session_limiter.stats(),
+            "batch": batch_limiter.stats(),
+        },
+        "llm": llm_fallback.stats() if llm_fallback is not None else {"enabled": False},
+        "chat": metrics.snapshot(),
+        "memory": {**memory, "catalog": get_catalog().memory_report()},
+    })
+
+def is_comparison_query(query, intents=None):
     """Determina si la consulta es una solicitud de comparación"""
-    query_lower = query.lower()
-    
-    # Lista ampliada de términos de comparación
-    comparison_terms = [
-        'comparar', 'compara', 'comparemos', 'comparación',
-        'vs', 'versus', 'contra', 'frente a',
-        'diferencia', 'diferencias', 'comparativa',
-        'cuál es mejor', 'cuál es la diferencia'
-    ]
-    
-    return any(term in query_lower for term in comparison_terms)
+    if intents is None:
+        intents = detect_intents(query)
+    return 'comparison' in intents
 
-def handle_comparison_request(user_message, session_id):
+def handle_comparison_request(user_message, state, entities=None):
     """Maneja una solicitud de comparación entre smartphones"""
+    catalog = get_catalog()
+    if entities is None:
+        entities = TurnEntities(user_message)
     try:
-        # Extraer modelos a comparar del mensaje
-        phones_to_compare = extract_phones_from_query(user_message)
-        
-        if len(phones_to_compare) < 2:
-            return "Necesito al menos dos modelos para comparar. Por ejemplo: 'iPhone 13 vs Samsung Galaxy S21'"
-        
-        # Buscar los teléfonos en la base de datos
-        found_phones = []
-        not_found = []
-        
-        for phone_name in phones_to_compare:
-            phone = find_phone_by_query(phone_name)
-            if phone:
-                found_phones.append(phone)
-            else:
-                not_found.append(phone_name)
+        # Modelos a comparar, ya resueltos a posiciones del catálogo
+        found_phones, not_found = entities.comparison
         
         # Verificar que encontramos suficientes modelos
         if len(found_phones) < 2:
+            if not not_found:
+                return "Necesito al menos dos modelos para comparar. Por ejemplo: 'iPhone 13 vs Samsung Galaxy S21'"
             error_msg = "No pude encontrar suficientes modelos para comparar."
-            if not_found:
-                error_msg += f" No encontré: {', '.join(not_found)}."
+            error_msg += f" No encontré: {', '.join(not_found)}."
             error_msg += " Por favor intenta con otros nombres o más específicos."
             return error_msg
         
-        # Limitar a 4 teléfonos para no saturar la comparación
-        found_phones = found_phones[:4]
-        
-        # Guardar los teléfonos encontrados en caché para posible uso posterior
-        cache.set(f"comparison_phones_{session_id}", found_phones, timeout=60*5)
+        # Guardar los teléfonos encontrados (solo sus posiciones) para posible uso posterior
+        state.set('comparison_phones', pack_phones(catalog, found_phones))
         
         # Generar la comparación
         return generate_comparison_table(found_phones)
@@ -237,48 +634,72 @@ def handle_comparison_request(user_message, session_id):
         logger.error(f"Error en comparación: {str(e)}")
         return "Hubo un problema al generar la comparación. ¿Podrías intentarlo de nuevo con otros modelos?"
 
-def extract_phones_from_query(query):
-    """Extrae modelos de celulares de una consulta, con tolerancia a errores"""
-    query_lower = query.lower()
-    
-    # Limpiar términos de comparación
-    clean_query = re.sub(
-        r'(comparar|compara|comparemos|comparación|vs|versus|contra|frente a|diferencia|diferencias|comparativa|cuál es mejor|cuál es la diferencia)',
-        ',', 
-        query_lower
-    )
-    
-    # Dividir por comas y otros separadores
-    potential_models = [m.strip() for m in re.split(r'[,&/]| y | con ', clean_query) if m.strip()]
-    
-    # Si encontramos al menos dos candidatos
-    if len(potential_models) >= 2:
-        # Intentar encontrar los modelos reales más parecidos
-        found_models = []
-        for model in potential_models:
-            phone = find_phone_by_query(model)
-            if phone:
-                found_models.append(phone['model'].lower())
-        
-        return found_models[:4]  # Limitar a 4 modelos máximo
-    
-    # Si no, buscar modelos conocidos en la base de datos
-    found_models = []
-    for model in phone_index.keys():
-        if similar(query_lower, model) > 0.7:  # Umbral de similitud
-            found_models.append(model)
-    
-    # Eliminar duplicados manteniendo el orden
-    seen = set()
-    unique_models = [m for m in found_models if not (m in seen or seen.add(m))]
-    
-    return unique_models if len(unique_models) >= 2 else []
+def answer_followup(followup, state, user_message):
+    """
+    Responde a un mensaje que señala resultados anteriores ("detalles del 2",
+    "compara el 1 y el 3", "¿ese tiene 5G?") con las posiciones que la sesión
+    guardó, sin buscar en el catálogo. Devuelve (ruta, respuesta), o None si
+    no hay nada vigente a qué referirse, algún número no estaba en la lista o
+    el mensaje además nombra un modelo: entonces sigue el flujo normal.
+    """
+    catalog = get_catalog()
+    results = state.get('results')
+    shown = unpack_phones(catalog, results['phones']) if results else []
+    focus = unpack_phones(catalog, state.get('focus'))
+    if not shown and not focus:
+        return None
+    # "cuánto cuesta el 12 de apple", "ese o el iPhone 13": el modelo nombrado manda
+    if followup.rest and find_phone_position(followup.rest, catalog) is not None:
+        return None
+
+    # Solo cuentan los números que la lista mostró: "¿tienen el 13?" después de cinco
+    # resultados pregunta por un modelo, no por una opción
+    last_shown = results['first'] + len(shown) - 1 if shown else 0
+    if any(number > last_shown for number in followup.numbers):
+        return None
+
+    positions = list(focus) if followup.pronoun else []
+    for number in followup.numbers:
+        position = pick(shown, results['first'], number) if shown else None
+        if position is None:
+            return None
+        positions.append(position)
+    positions = unique(positions)
+
+    if followup.compare or len(positions) >= 2:
+        # "compara el 2 con el iPhone 13" no se resuelve solo con la lista: sigue el flujo normal
+        if len(positions) < 2:
+            return None
+        positions = positions[:MAX_COMPARED]
+        state.set('comparison_phones', pack_phones(catalog, positions))
+        return 'followup_comparison', generate_comparison_table(positions)
+    if not positions:
+        return None
+    return 'followup_details', phone_details_at(positions[0], user_message)
 
-def generate_comparison_table(phones):
-    """Genera una tabla de comparación entre múltiples smartphones"""
-    if len(phones) < 2:
+def generate_comparison_table(phone_ids):
+    """
+    Genera una tabla de comparación entre múltiples smartphones (por posición).
+
+    El cuerpo (tabla y observaciones) solo depende del conjunto de teléfonos y
+    de la versión del catálogo, así que se memoriza con esa clave; la frase
+    de apertura se elige aparte para que siga variando.
+    """
+    if len(phone_ids) < 2:
         return "Necesito al menos dos modelos para comparar."
     
+    catalog = get_catalog()
+    key = (catalog.version, tuple(sorted(int(pos) for pos in phone_ids)))
+    body = comparison_cache.get(key)
+    if body is None:
+        body = render_comparison_body(catalog.phones(key[1]))
+        comparison_cache.set(key, body)
+    
+    # Encabezado de la comparación
+    return choose(COMPARISON_STARTS) + "\n" + body
+
+def render_comparison_body(phones):
+    """Tabla Markdown y observaciones clave de una comparación"""
     # Seleccionar características relevantes para comparar
     features = [
         ('Marca', lambda p: p.get('brand_name', 'N/A')),
@@ -295,8 +716,7 @@ def generate_comparison_table(phones):
         ('Sistema', lambda p: p.get('os_version', 'N/A'))
     ]
     
-    # Encabezado de la comparación
-    response = [random.choice(COMPARISON_STARTS)]
+    response = []
     
     # Crear tabla con formato Markdown para mejor visualización
     headers = ["**Característica**"] + [f"**{phone['brand_name']} {phone['model']}**" for phone in phones]
@@ -342,105 +762,107 @@ def generate_comparison_table(phones):
     
     return "\n".join(response)
 
-def get_contextual_options(user_message):
+def get_contextual_options(user_message, intents=None):
     """Devuelve opciones contextuales basadas en la consulta del usuario"""
-    user_message = user_message.lower()
+    if intents is None:
+        intents = detect_intents(user_message)
     
-    if any(term in user_message for term in ['hola', 'buenos días', 'inicio']):
+    if 'start' in intents:
         return ["Ver celulares", "Ofertas", "Ayuda"]
     
-    if any(term in user_message for term in ['comparar', 'vs', 'versus', 'diferencia']):
+    if 'compare_option' in intents:
         return ["Comparar por precio", "Comparar por cámara", "Comparar por batería"]
     
-    if any(term in user_message for term in ['5g', '5 g']):
+    if '5g' in intents:
         return ["5G económicos", "Mejor 5G", "Comparar modelos 5G"]
     
-    if any(term in user_message for term in ['cámara', 'camara', 'foto']):
+    if 'camera' in intents:
         return ["Mejor cámara", "Selfies", "Comparar cámaras"]
     
-    if any(term in user_message for term in ['precio', 'económi', 'barat']):
+    if 'price' in intents:
         return ["Menos de $10,000", "$10,000-$20,000", "Comparar precios"]
     
-    if any(term in user_message for term in ['recomienda', 'sugiere']):
+    if 'suggest' in intents:
         return ["Para fotos", "Para juegos", "Comparar recomendaciones"]
     
     return ["Comparar modelos", "Ayuda", "Limpiar chat"]
 
 def find_phone_by_query(query):
     """Busca teléfonos que coincidan con la consulta, permitiendo errores menores"""
-    query_lower = query.lower().strip()
-    
-    # 1. Coincidencia exacta en modelos (case insensitive)
-    for model, phone in phone_index.items():
-        if query_lower == model.lower():
-            return phone
-    
-    # 2. Coincidencia exacta en marca + modelo
-    for phone in smartphones_data:
-        full_name = f"{phone['brand_name'].lower()} {phone['model'].lower()}"
-        if query_lower == full_name:
-            return phone
-    
-    # 3. Búsqueda aproximada con tolerancia a errores
-    best_match = None
-    best_score = 0
-    
-    for phone in smartphones_data:
-        # Opción 1: Buscar en marca + modelo
-        full_name = f"{phone['brand_name'].lower()} {phone['model'].lower()}"
-        
-        # Opción 2: Buscar solo en modelo
-        model_only = phone['model'].lower()
-        
-        # Calcular similitud para ambas opciones
-        score_full = similar(query_lower, full_name)
-        score_model = similar(query_lower, model_only)
-        
-        # Quedarnos con el mejor score
-        current_score = max(score_full, score_model)
-        
-        if current_score > best_score and current_score > 0.6:  # Umbral de similitud
-            best_score = current_score
-            best_match = phone
-    
-    return best_match
-
-def similar(a, b):
-    """Calcula la similitud entre dos cadenas (0 a 1)"""
-    from difflib import SequenceMatcher
-    return SequenceMatcher(None, a, b).ratio()
+    pos = find_phone_position(query)
+    return get_catalog().phone(pos) if pos is not None else None
 
-def find_phones_by_brand(brand_query):
+def find_phones_by_brand(query):
     """
-    Busca todos los teléfonos de una marca específica
+    Busca todos los teléfonos de la marca que nombra la consulta ("samsung", "modelos de xiaomi").
+    Devuelve (marca, posiciones en el catálogo), o (None, vacío) si no nombra ninguna.
     Permite búsqueda flexible (ej: 'sams' encontrará 'Samsung')
     """
-    brand_query_lower = brand_query.lower().strip()
-    
-    # Primero buscar coincidencia exacta
-    exact_match = [phone for phone in smartphones_data 
-                  if phone.get('brand_name', '').lower() == brand_query_lower]
-    if exact_match:
-        return exact_match
-    
-    # Si no hay coincidencia exacta, buscar parcial
-    partial_match = [phone for phone in smartphones_data 
-                    if brand_query_lower in phone.get('brand_name', '').lower()]
-    return partial_match
+    catalog = get_catalog()
+    brand = catalog.brand_in(query)
+    if brand is None:
+        return None, ()
+    return brand, catalog.brand_positions(brand)
 
-def generate_brand_response(phones, brand_query):
-    """Genera una respuesta con 5 modelos aleatorios de una marca"""
+def top_listing(ranking):
+    """Primera página de una vista ordenada, ofreciendo continuarla con 'ver más'"""
+    catalog = get_catalog()
+    offer_more({'kind': 'ranking', 'name': ranking})
+    positions = catalog.rankings[ranking][:PAGE_SIZE]
+    show_results(positions)
+    return catalog.phones(positions)
+
+def range_listing(low, high):
+    """Primera página de un rango de precios, ofreciendo continuarla con 'ver más'"""
+    catalog = get_catalog()
+    listing = {'kind': 'price_range', 'low': low, 'high': high}
+    offer_more(listing)
+    positions = listing_positions(catalog, listing, 0)
+    show_results(positions)
+    return catalog.phones(positions)
+
+def generate_more_response(listing, start):
+    """Siguiente página de un listado mostrado antes (respuesta a "ver más")"""
+    catalog = get_catalog()
+    if listing.get('version') != catalog.version:
+        return "El catálogo se actualizó desde tu última búsqueda. ¿Me repites qué modelos quieres ver?"
+    
+    positions = listing_positions(catalog, listing, start)
+    phones = catalog.phones(positions)
     if not phones:
+        return "Ya te mostré todos los modelos de esa búsqueda. ¿Quieres buscar otra cosa?"
+    show_results(positions, start + 1)
+    
+    response = ["Aquí tienes más opciones:"]
+    for i, phone in enumerate(phones, start + 1):
+        price_info = f" - ${phone['price']:,}" if isinstance(phone.get('price'), (int, float)) else ""
+        response.append(f"\n{i}. *{phone['brand_name']} {phone['model']}*{price_info}")
+    
+    if has_more(catalog, listing, start + len(phones)):
+        response.append("\n\nEscribe 'ver más' para seguir viendo modelos.")
+    else:
+        response.append("\n\nEsos son todos los modelos de esta búsqueda.")
+    return "\n".join(response)
+
+def generate_brand_response(phone_ids, brand_query):
+    """Genera una respuesta con 5 modelos aleatorios de una marca"""
+    catalog = get_catalog()
+    if not len(phone_ids):
         return f"No encontré modelos de la marca {brand_query} en nuestra base de datos."
     
-    # Seleccionar 5 modelos aleatorios (o menos si no hay suficientes)
-    random.shuffle(phones)
-    sample_phones = phones[:5]
+    # Seleccionar 5 modelos aleatorios (o menos si no hay suficientes) con una permutación
+    # implícita: cada página cuesta O(5) y "ver más" continúa sin repetir modelos
+    a, b = affine_permutation(len(phone_ids), current_rng())
+    listing = {'kind': 'brand', 'brand': brand_query.lower().strip(), 'a': a, 'b': b}
+    positions = listing_positions(catalog, listing, 0)
+    sample_phones = catalog.phones(positions)
+    show_results(positions)
+    offer_more(listing)
     
     # Obtener el nombre de la marca correctamente capitalizado
     brand_name = sample_phones[0]['brand_name'] if sample_phones else brand_query
     
-    intro = random.choice([
+    intro = choose([
         f"Estos son algunos modelos de {brand_name} que tenemos disponibles:",
         f"Encontramos estos modelos de {brand_name} en nuestro catálogo:",
         f"De la marca {brand_name}, te puedo mostrar estos modelos:"
@@ -471,71 +893,148 @@ def generate_brand_response(phones, brand_query):
     
     return "\n".join(response)
 
-def process_any_query(query):
+@pinned_catalog()
+def process_any_query(query, intents=None, session_id=None, entities=None):
     """
     Procesa cualquier tipo de consulta sobre características de celulares
-    con respuestas naturales y completas
+    con respuestas naturales y completas.
+
+    La respuesta depende solo de la consulta normalizada, la versión del
+    catálogo y la variante de redacción de la sesión, así que se cachea
+    con esa clave (junto con la ruta que la generó, para las métricas, y el
+    listado y los teléfonos numerados que muestra, para poder continuarlo y
+    resolver "detalles del 2"). Si el turno ya resolvió
+    los modelos del mensaje (entities) se reutilizan al enrutar.
     """
+    started = time.perf_counter()
+    normalized = normalize_query(query)
+    variant = phrasing_variant(session_id, PHRASING_VARIANTS) if session_id else 0
+    key = (get_catalog().version, normalized, variant)
+    
+    cached = response_cache.get(key)
+    if cached is not None:
+        route, response, listing, results = cached
+    else:
+        with metrics.stage('entities'):
+            route, handler = route_query(normalized, intents, entities)
+        with metrics.stage('handler'), seeded_phrasing(f"{variant}|{normalized}"), recording_listing() as offered:
+            response = handler()
+        listing = offered.get('listing')
+        results = offered.get('results')
+        # Las respuestas del modelo tienen su propia caché; así un fallo o un tiempo agotado no se guarda
+        if route != 'llm':
+            response_cache.set(key, (route, response, listing, results))
+    
+    # El listado (si lo hay) queda disponible para "ver más" y sus teléfonos para "el 2"
+    offer_more(listing)
+    if results:
+        show_results(*results)
+    metrics.record_route(route, time.perf_counter() - started, cached=cached is not None)
+    return response
+
+def route_query(query, intents=None, entities=None):
+    """
+    Dirige la consulta según sus intenciones y las entidades que menciona.
+    Devuelve (ruta, función sin argumentos que genera la respuesta).
+    """
+    catalog = get_catalog()
     query_lower = query.lower()
+    if intents is None:
+        intents = detect_intents(query)
+    if entities is None:
+        entities = TurnEntities(query, catalog)
     
     # Detección de saludos
-    if any(term in query_lower for term in ['hola', 'buenos días', 'buenas tardes']):
-        return random.choice(GREETINGS)
+    if 'greeting' in intents:
+        return 'greeting', partial(choose, GREETINGS)
     
     # Detección de despedidas
-    if any(term in query_lower for term in ['gracias', 'adiós', 'hasta luego', 'chao']):
-        return random.choice(FAREWELLS)
+    if 'farewell' in intents:
+        return 'farewell', partial(choose, FAREWELLS)
     
     # Detección de ayuda
-    if any(term in query_lower for term in ['ayuda', 'qué puedes hacer', 'opciones']):
-        return generate_help_response()
+    if 'help' in intents:
+        return 'help', generate_help_response
     
     # Detección de comparación (NUEVA VERSIÓN)
-    if is_comparison_query(query):
-        return random.choice(COMPARISON_PROMPTS)
+    if 'comparison' in intents:
+        return 'comparison_prompt', partial(choose, COMPARISON_PROMPTS)
+    
+    # Varias condiciones a la vez ("5g con 8gb de ram y más de 5000 mah por menos de 20000")
+    filters = parse_filters(query, catalog)
+    if is_structured(filters):
+        # Una sola condición puede ser parte del nombre de un modelo ("galaxy a54 5g", "iphone 13 128gb");
+        # con la marca ("samsung con 5g") solo si el mensaje es el nombre exacto del modelo
+        conditions = [p for p in filters if p.column != 'brand_name']
+        named = entities.model is not None and (len(filters) == 1 or entities.exact_model)
+        if len(conditions) >= 2 or any(p.column == 'price' for p in conditions) or not named:
+            return 'filter', partial(handle_filter_query, filters)
+    
+    # Rango de precios explícito ("entre 8000 y 12000", "menos de 20 mil")
+    price_range = parse_price_range(query)
+    if price_range:
+        return 'price_range', partial(handle_price_range_query, *price_range)
     
     # 0. Búsqueda por marca (NUEVA SECCIÓN)
     # Primero verificamos si la consulta coincide con una marca
-    brand_phones = find_phones_by_brand(query)
-    if brand_phones:
+    brand, brand_phones = find_phones_by_brand(query)
+    if len(brand_phones):
         # Verificar si el usuario pidió específicamente "modelos de [marca]"
-        if any(term in query_lower for term in ['modelos de', 'modelos', 'celulares de', 'teléfonos de']):
-            return generate_brand_response(brand_phones, query)
+        if 'brand_listing' in intents:
+            return 'brand', partial(generate_brand_response, brand_phones, brand)
         # Si no, verificar si la consulta es solo la marca (sin otras palabras)
-        elif len(query.split()) == 1 or query_lower.replace(" ", "") == brand_phones[0]['brand_name'].lower().replace(" ", ""):
-            return generate_brand_response(brand_phones, query)
+        elif len(query.split()) == 1 or query_lower.replace(" ", "") == catalog.columns.value('brand_name', brand_phones[0]).lower().replace(" ", ""):
+            return 'brand', partial(generate_brand_response, brand_phones, brand)
+        # O si pregunta por la marca sin pedir una característica ni nombrar un modelo ("¿tienen samsung?")
+        elif not intents & FEATURE_INTENTS and entities.model is None:
+            return 'brand', partial(generate_brand_response, brand_phones, brand)
     
     # 1 Búsqueda por modelo específico (CON TOLERANCIA A ERRORES)
-    matched_phone = find_phone_by_query(query)
-    if matched_phone:
-        return generate_phone_details(matched_phone, query)
+    phone_id = entities.model
+    if phone_id is not None:
+        return 'model', partial(phone_details_at, phone_id, query, intents)
+
+    # Recomendaciones y consultas con varias prioridades ("barato con buena cámara"): puntaje
+    # ponderado en vez del manejador de una sola característica
+    wanted = sum(recommendation_priorities(intents).values())
+    if wanted >= 2 or (wanted and intents & {'recommendation', 'suggest'}):
+        return 'recommendation', partial(handle_recommendation_query, query, intents)
 
     # 2. Búsqueda por características especiales (se mantiene igual)
-    if any(term in query_lower for term in ['económi', 'barat', 'precio']):
-        if '5g' in query_lower:
-            return handle_5g_affordable_query(query)
-        return handle_price_query(query)
+    if 'price' in intents:
+        if '5g' in intents:
+            return '5g_price', partial(handle_5g_affordable_query, query)
+        return 'price', partial(handle_price_query, query, intents)
     
-    if any(term in query_lower for term in ['cámara', 'camara', 'foto', 'fotografía']):
-        return handle_camera_query(query)
+    if 'camera' in intents:
+        return 'camera', partial(handle_camera_query, query, intents)
     
-    if any(term in query_lower for term in ['pantalla', 'display', 'pantall']):
-        return handle_display_query(query)
+    if 'display' in intents:
+        return 'display', partial(handle_display_query, query)
     
-    if any(term in query_lower for term in ['batería', 'bateria', 'duraci']):
-        return handle_battery_query(query)
+    if 'battery' in intents:
+        return 'battery', partial(handle_battery_query, query)
     
-    if any(term in query_lower for term in ['5g', '5 g']):
-        return handle_5g_query(query)
+    if '5g' in intents:
+        return '5g', partial(handle_5g_query, query)
     
-    if any(term in query_lower for term in ['ram', 'procesador', 'rendimiento', 'velocidad']):
-        return handle_performance_query(query)
+    if 'performance' in intents:
+        return 'performance', partial(handle_performance_query, query)
     
-    if any(term in query_lower for term in ['recomienda', 'sugiere', 'mejor']):
-        return handle_recommendation_query(query)
+    if 'recommendation' in intents:
+        return 'recommendation', partial(handle_recommendation_query, query, intents)
     
-    # 3. Búsqueda genérica (se mantiene igual)
-    return handle_general_query(query)
+    # 3. Preguntas libres: teléfonos cuya descripción se parece a la consulta (TF-IDF local)
+    matches, total = catalog.semantic.page(query, 0, PAGE_SIZE)
+    if len(matches):
+        return 'semantic', partial(handle_semantic_query, query, matches, total)
+    
+    # 4. Modelo de lenguaje con datos del catálogo, si está configurado
+    if llm_fallback is not None and llm_fallback.available:
+        return 'llm', partial(handle_llm_query, query)
+    
+    # 5. Búsqueda genérica (se mantiene igual)
+    return 'general', partial(handle_general_query, query)
 
 def generate_help_response():
     """Genera una respuesta de ayuda más natural y completa"""
@@ -554,10 +1053,17 @@ def generate_help_response():
         "'Compara el Pixel 6 con el Galaxy S22'"
     ]
     
-    return f"{random.choice(HELP_RESPONSES)}\n" + "\n".join(help_options)
+    return f"{choose(HELP_RESPONSES)}\n" + "\n".join(help_options)
 
-def generate_phone_details(phone, original_query):
+def phone_details_at(phone_id, original_query, intents=None):
+    """Detalles del teléfono en esa posición, que queda como el teléfono del que se habla ("¿y ese tiene 5G?")"""
+    show_results([phone_id], numbered=False)
+    return generate_phone_details(get_catalog().phone(phone_id), original_query, intents)
+
+def generate_phone_details(phone, original_query, intents=None):
     """Genera una descripción más humana y completa del teléfono"""
+    if intents is None:
+        intents = detect_intents(original_query)
     # Respuestas introductorias aleatorias
     intros = [
         f"¡Claro! Aquí tienes los detalles del {phone['brand_name']} {phone['model']}:",
@@ -565,17 +1071,17 @@ def generate_phone_details(phone, original_query):
         f"¡Buena elección! El {phone['brand_name']} {phone['model']} es un excelente dispositivo. Te cuento más:"
     ]
     
-    details = [random.choice(intros)]
+    details = [choose(intros)]
     
     # Precio con comentario contextual
     if 'price' in phone:
         price_comment = ""
         if phone['price'] < 15000:
-            price_comment = random.choice(PRICE_COMMENTS['low'])
+            price_comment = choose(PRICE_COMMENTS['low'])
         elif phone['price'] < 30000:
-            price_comment = random.choice(PRICE_COMMENTS['mid'])
+            price_comment = choose(PRICE_COMMENTS['mid'])
         else:
-            price_comment = random.choice(PRICE_COMMENTS['high'])
+            price_comment = choose(PRICE_COMMENTS['high'])
         details.append(f"- 💵 *Precio:* ${phone['price']:,}{price_comment}")
     
     # Características con lenguaje más natural
@@ -612,7 +1118,7 @@ def generate_phone_details(phone, original_query):
         recommendation = "\n🌟 *Opinión de clientes:* ¡Muy bien valorado por los usuarios! Un acierto seguro."
     elif phone.get('price', 0) < 20000 and phone.get('ram_capacity', 0) >= 4:
         recommendation = "\n💡 *Mi opinión:* Excelente opción si buscas buen rendimiento sin gastar mucho."
-    elif 'gaming' in original_query.lower() and phone.get('ram_capacity', 0) >= 6:
+    elif 'gaming' in intents and phone.get('ram_capacity', 0) >= 6:
         recommendation = "\n🎮 *Para gaming:* Este modelo manejará bien los juegos más demandantes."
     
     if recommendation:
@@ -624,22 +1130,19 @@ def generate_phone_details(phone, original_query):
         "\n¿Quieres que te sugiera accesorios para este dispositivo?",
         "\n¿Necesitas más información sobre alguna característica en particular?"
     ]
-    details.append(random.choice(follow_ups))
+    details.append(choose(follow_ups))
     
     return "\n".join(details)
 
 def handle_5g_affordable_query(query):
     """Respuesta mejorada para 5G económico"""
     try:
-        affordable_5g = sorted(
-            [p for p in smartphones_data if p.get('5G_or_not') and p.get('price')],
-            key=lambda x: x['price']
-        )[:5]
+        affordable_5g = top_listing('5g_price')
         
         if not affordable_5g:
             return "Por el momento no tenemos modelos 5G en el rango económico, pero puedo mostrarte algunas opciones 4G LTE con buena relación calidad-precio."
         
-        intro = random.choice([
+        intro = choose([
             "Entiendo que buscas lo mejor de ambos mundos: tecnología 5G sin gastar mucho. Estas son las opciones más accesibles:",
             "¡Buena idea! Tener 5G ya no tiene que ser caro. Mira estas alternativas económicas:",
             "Aquí tienes smartphones con 5G que no romperán tu presupuesto:"
@@ -649,7 +1152,7 @@ def handle_5g_affordable_query(query):
         for i, phone in enumerate(affordable_5g, 1):
             price_comment = ""
             if phone['price'] < 18000:
-                price_comment = random.choice(PRICE_COMMENTS['low'])
+                price_comment = choose(PRICE_COMMENTS['low'])
             
             response.append(
                 f"\n{i}. *{phone['brand_name']} {phone['model']}*"
@@ -669,25 +1172,23 @@ def handle_5g_affordable_query(query):
         logger.error(f"Error en consulta de 5G económico: {str(e)}")
         return "Vaya, hubo un problema al buscar esas opciones. ¿Te importaría intentarlo de nuevo más tarde?"
 
-def handle_camera_query(query):
+def handle_camera_query(query, intents=None):
     """Respuesta mejorada para cámaras"""
+    if intents is None:
+        intents = detect_intents(query)
     try:
         # Priorizar cámaras con múltiples lentes y alta resolución
-        best_cameras = sorted(
-            [p for p in smartphones_data if p.get('primary_camera_rear')],
-            key=lambda x: (x.get('num_rear_cameras', 1), x['primary_camera_rear']),
-            reverse=True
-        )[:5]
+        best_cameras = top_listing('camera')
         
         if not best_cameras:
             return "Actualmente no tengo los datos de cámara disponibles. ¿Te interesa que te recomiende por otra característica?"
         
         # Contextualizar según la consulta
-        if 'selfie' in query.lower() or 'frontal' in query.lower():
+        if 'selfie' in intents:
             intro = "Si lo que buscas es buena cámara frontal para selfies, estos modelos destacan:"
             key_camera = 'primary_camera_front'
         else:
-            intro = random.choice([
+            intro = choose([
                 "Para fotografía profesional, estos smartphones tienen excelentes cámaras traseras:",
                 "Si la cámara es tu prioridad, no te decepcionarán estos modelos:",
                 "Aquí tienes los celulares que mejor capturan tus momentos especiales:"
@@ -709,7 +1210,7 @@ def handle_camera_query(query):
                 camera_specs.append(f"{phone['primary_camera_rear']}MP principal")
             
             # Especificaciones frontales si es relevante
-            if ('selfie' in query.lower() or 'frontal' in query.lower()) and 'primary_camera_front' in phone:
+            if 'selfie' in intents and 'primary_camera_front' in phone:
                 camera_specs.append(f"{phone['primary_camera_front']}MP frontal")
             
             # Estabilización óptica
@@ -733,17 +1234,24 @@ def handle_camera_query(query):
         logger.error(f"Error en consulta de cámara: {str(e)}")
         return "Hubo un problema al buscar esa información. ¿Quieres intentar con otra característica?"
 
-def handle_recommendation_query(query):
+def recommendation_priorities(intents):
+    """Criterios de recomendación (ver CRITERIA en catalog.py) que pide el mensaje"""
+    return {
+        'camera': 'camera' in intents,
+        'battery': 'battery' in intents,
+        'performance': 'speed' in intents or 'performance' in intents,
+        'price': 'price' in intents,
+        'display': 'display' in intents
+    }
+
+def handle_recommendation_query(query, intents=None):
     """Nueva función para manejar solicitudes de recomendación"""
+    if intents is None:
+        intents = detect_intents(query)
+    catalog = get_catalog()
     try:
         # Analizar la consulta para determinar prioridades
-        priorities = {
-            'camera': any(term in query.lower() for term in ['cámara', 'camara', 'foto', 'fotografía']),
-            'battery': any(term in query.lower() for term in ['batería', 'bateria', 'duraci']),
-            'performance': any(term in query.lower() for term in ['velocidad', 'rápido', 'juegos', 'rendimiento']),
-            'price': any(term in query.lower() for term in ['económi', 'barat', 'precio']),
-            'display': any(term in query.lower() for term in ['pantalla', 'display', 'pantall'])
-        }
+        priorities = recommendation_priorities(intents)
         
         # Determinar el tipo de recomendación
         if sum(priorities.values()) == 0:  # Si no se especificó nada
@@ -752,27 +1260,17 @@ def handle_recommendation_query(query):
                    "'Quiero un smartphone económico con buena batería', "
                    "o 'Necesito un teléfono potente para juegos'")
         
-        # Filtrar y ordenar según prioridades
-        candidates = smartphones_data.copy()
-        
-        if priorities['price']:
-            candidates = [p for p in candidates if p.get('price')]
-            candidates.sort(key=lambda x: x['price'])
-        
-        if priorities['camera']:
-            candidates.sort(key=lambda x: x.get('primary_camera_rear', 0), reverse=True)
-        
-        if priorities['battery']:
-            candidates.sort(key=lambda x: x.get('battery_capacity', 0), reverse=True)
-        
-        if priorities['performance']:
-            candidates.sort(key=lambda x: (x.get('ram_capacity', 0), x.get('processor_speed', 0)), reverse=True)
-        
-        if priorities['display']:
-            candidates.sort(key=lambda x: x.get('screen_size', 0), reverse=True)
+        # Puntaje único: cada prioridad pedida pesa lo mismo sobre las columnas normalizadas
+        weights = {name: 1.0 for name, wanted in priorities.items() if wanted}
+        mask = catalog.columns.truthy('price') if priorities['price'] else None
+        # "recomienda un 5g barato": el 5G es requisito, no un criterio más
+        if '5g' in intents and '5G_or_not' in catalog.flags:
+            mask = catalog.flags['5G_or_not'] if mask is None else mask & catalog.flags['5G_or_not']
         
         # Tomar los 3 mejores candidatos
-        top_recommendations = candidates[:3]
+        positions = catalog.recommend(weights, k=3, mask=mask)
+        show_results(positions)
+        top_recommendations = catalog.phones(positions)
         
         if not top_recommendations:
             return "No encontré opciones que coincidan exactamente. ¿Quieres intentar con criterios más amplios?"
@@ -815,16 +1313,12 @@ def handle_performance_query(query):
     """Maneja consultas sobre rendimiento (RAM y procesador)"""
     try:
         # Ordenar por RAM y velocidad de procesador
-        performance_phones = sorted(
-            [p for p in smartphones_data if p.get('ram_capacity') and p.get('processor_speed')],
-            key=lambda x: (x['ram_capacity'], x['processor_speed']),
-            reverse=True
-        )[:5]
+        performance_phones = top_listing('performance')
         
         if not performance_phones:
             return "No tenemos información de rendimiento para mostrar en este momento."
         
-        intro = random.choice([
+        intro = choose([
             "Si buscas potencia, estos son los modelos con mejor rendimiento:",
             "Para tareas exigentes o juegos, te recomendaría estos smartphones:",
             "Estos celulares ofrecen el máximo desempeño:"
@@ -854,16 +1348,12 @@ def handle_performance_query(query):
 def handle_battery_query(query):
     """Maneja consultas sobre batería"""
     try:
-        battery_phones = sorted(
-            [p for p in smartphones_data if p.get('battery_capacity')],
-            key=lambda x: x['battery_capacity'],
-            reverse=True
-        )[:5]
+        battery_phones = top_listing('battery')
         
         if not battery_phones:
             return "No tenemos información sobre baterías en este momento."
         
-        intro = random.choice([
+        intro = choose([
             "Si lo que buscas es que la batería te dure todo el día, estos modelos son ideales:",
             "Para no preocuparte por cargar tu celular constantemente, considera estas opciones:",
             "Estos smartphones tienen las baterías más grandes del mercado:"
@@ -895,16 +1385,12 @@ def handle_battery_query(query):
 def handle_display_query(query):
     """Maneja consultas sobre pantallas"""
     try:
-        display_phones = sorted(
-            [p for p in smartphones_data if p.get('screen_size') and p.get('refresh_rate')],
-            key=lambda x: (x['screen_size'], x['refresh_rate']),
-            reverse=True
-        )[:5]
+        display_phones = top_listing('display')
         
         if not display_phones:
             return "No tenemos información detallada sobre pantallas en este momento."
         
-        intro = random.choice([
+        intro = choose([
             "Para una experiencia visual increíble, estos smartphones tienen las mejores pantallas:",
             "Si valoras mucho la calidad de imagen, considera estos modelos:",
             "Estas son las opciones con pantallas más avanzadas:"
@@ -934,12 +1420,12 @@ def handle_display_query(query):
 def handle_5g_query(query):
     """Maneja consultas sobre 5G"""
     try:
-        phones_5g = [p for p in smartphones_data if p.get('5G_or_not')][:5]
+        phones_5g = top_listing('5g')
         
         if not phones_5g:
             return "Actualmente no tenemos modelos con 5G en nuestro catálogo."
         
-        intro = random.choice([
+        intro = choose([
             "La tecnología 5G ofrece velocidades ultrarrápidas. Estos modelos la incluyen:",
             "Para futuro-proof tu compra, estos smartphones con 5G son excelentes opciones:",
             "Estos son nuestros modelos compatibles con redes 5G:"
@@ -963,19 +1449,18 @@ def handle_5g_query(query):
         logger.error(f"Error en consulta de 5G: {str(e)}")
         return "No pude obtener la información sobre 5G."
 
-def handle_price_query(query):
+def handle_price_query(query, intents=None):
     """Maneja consultas sobre precios"""
+    if intents is None:
+        intents = detect_intents(query)
     try:
-        if 'bajo' in query.lower() or 'económi' in query.lower():
-            affordable = sorted(
-                [p for p in smartphones_data if p.get('price')],
-                key=lambda x: x['price']
-            )[:5]
+        if 'low_price' in intents:
+            affordable = top_listing('price')
             
             if not affordable:
                 return "No tenemos opciones económicas en este momento."
             
-            intro = random.choice([
+            intro = choose([
                 "Estas son las opciones más accesibles sin sacrificar calidad:",
                 "Si buscas ahorrar, estos smartphones ofrecen buena relación calidad-precio:",
                 "Para presupuestos ajustados, considera estos modelos:"
@@ -983,7 +1468,7 @@ def handle_price_query(query):
             
             response = [intro]
             for i, phone in enumerate(affordable, 1):
-                price_comment = random.choice(PRICE_COMMENTS['low']) if phone['price'] < 15000 else ""
+                price_comment = choose(PRICE_COMMENTS['low']) if phone['price'] < 15000 else ""
                 response.append(
                     f"\n{i}. *{phone['brand_name']} {phone['model']}*"
                     f"\n   💵 ${phone['price']:,}{price_comment}"
@@ -996,11 +1481,8 @@ def handle_price_query(query):
             response.append("\n¿Te interesa alguno?")
             return "\n".join(response)
         
-        elif 'medio' in query.lower() or 'intermedio' in query.lower():
-            mid_range = sorted(
-                [p for p in smartphones_data if p.get('price') and 15000 <= p['price'] <= 30000],
-                key=lambda x: x['price']
-            )[:5]
+        elif 'mid_price' in intents:
+            mid_range = range_listing(15000, 30000)
             
             if not mid_range:
                 return "No tenemos opciones en gama media en este momento."
@@ -1011,7 +1493,7 @@ def handle_price_query(query):
             for i, phone in enumerate(mid_range, 1):
                 response.append(
                     f"\n{i}. *{phone['brand_name']} {phone['model']}*"
-                    f"\n   💵 ${phone['price']:,}{random.choice(PRICE_COMMENTS['mid'])}"
+                    f"\n   💵 ${phone['price']:,}{choose(PRICE_COMMENTS['mid'])}"
                     f"\n   ⚡ {phone.get('ram_capacity', 'N/A')}GB RAM"
                     f"\n   📸 {phone.get('primary_camera_rear', 'N/A')}MP cámara"
                 )
@@ -1026,6 +1508,145 @@ def handle_price_query(query):
         logger.error(f"Error en consulta de precio: {str(e)}")
         return "No pude obtener la información de precios."
 
+def handle_filter_query(filters):
+    """
+    Celulares que cumplen todas las condiciones del mensaje, de mejor a peor
+    según las características pedidas. Se resuelve con los índices por columna.
+    """
+    catalog = get_catalog()
+    try:
+        positions = filter_positions(catalog, filters)
+        conditions = ", ".join(describe_filters(filters))
+        
+        if not len(positions):
+            return (f"No encontré celulares que cumplan todo ({conditions}). "
+                    "¿Quieres que relaje alguna condición?")
+        
+        # Con pocos resultados también se guarda: "ver más" responde que no hay otros
+        offer_more({'kind': 'filter', 'predicates': [tuple(p) for p in filters], 'total': len(positions)})
+        phones = catalog.phones(positions[:PAGE_SIZE])
+        show_results(positions[:PAGE_SIZE])
+        
+        intro = choose([
+            f"Encontré {len(positions)} celulares que cumplen todo ({conditions}). Los mejores:",
+            f"Hay {len(positions)} modelos que cumplen todo ({conditions}). Te muestro los mejores:",
+        ])
+        
+        response = [intro]
+        for i, phone in enumerate(phones, 1):
+            price_info = f"${phone['price']:,}" if isinstance(phone.get('price'), (int, float)) else "N/A"
+            response.append(
+                f"\n{i}. *{phone['brand_name']} {phone['model']}*"
+                f"\n   💵 {price_info} | ⚡ {phone.get('ram_capacity', 'N/A')}GB RAM"
+                f" | 🔋 {phone.get('battery_capacity', 'N/A')} mAh | 📸 {phone.get('primary_camera_rear', 'N/A')}MP"
+            )
+        
+        if len(positions) > len(phones):
+            response.append("\n\nEscribe 'ver más' para ver los siguientes.")
+        else:
+            response.append("\n¿Quieres detalles de algún modelo?")
+        return "\n".join(response)
+    
+    except Exception as e:
+        logger.error(f"Error en consulta con filtros: {str(e)}")
+        return "No pude aplicar esos filtros. ¿Podrías reformular tu búsqueda?"
+
+def handle_price_range_query(low, high):
+    """
+    Celulares dentro de un rango de precios cualquiera, del más barato al más caro.
+    Se resuelve con búsqueda binaria sobre los precios ya ordenados del catálogo.
+    """
+    catalog = get_catalog()
+    try:
+        phones = range_listing(low, high)
+        
+        if math.isinf(high):
+            band = f"desde ${low:,.0f}"
+        elif low <= 0:
+            band = f"de hasta ${high:,.0f}"
+        else:
+            band = f"entre ${low:,.0f} y ${high:,.0f}"
+        
+        if not phones:
+            return f"No encontré celulares {band}. ¿Quieres que busque en otro rango de precios?"
+        
+        total = listing_size(catalog, {'kind': 'price_range', 'low': low, 'high': high})
+        intro = choose([
+            f"Encontré {total} celulares {band}. Estos son los más accesibles:",
+            f"Hay {total} modelos {band}; empiezo por los de mejor precio:",
+        ])
+        
+        response = [intro]
+        for i, phone in enumerate(phones, 1):
+            response.append(
+                f"\n{i}. *{phone['brand_name']} {phone['model']}*"
+                f"\n   💵 ${phone['price']:,}"
+                f"\n   ⚡ {phone.get('ram_capacity', 'N/A')}GB RAM | 📸 {phone.get('primary_camera_rear', 'N/A')}MP"
+            )
+        
+        if total > len(phones):
+            response.append("\n\nEscribe 'ver más' para ver los siguientes.")
+        else:
+            response.append("\n¿Quieres detalles de algún modelo?")
+        return "\n".join(response)
+    
+    except Exception as e:
+        logger.error(f"Error en consulta de rango de precios: {str(e)}")
+        return "No pude obtener la información de precios."
+
+def handle_semantic_query(query, phone_ids, total=None):
+    """Teléfonos cuya descripción se parece a una pregunta libre, del más parecido al menos"""
+    catalog = get_catalog()
+    try:
+        phones = catalog.phones(phone_ids)
+        show_results(phone_ids)
+        offer_more({'kind': 'semantic', 'query': query, 'total': len(phone_ids) if total is None else total})
+        intro = choose([
+            "No estoy seguro de haber entendido del todo, pero estos modelos encajan con lo que describes:",
+            "Por lo que me cuentas, creo que estos celulares te pueden servir:",
+            "Estos son los modelos que mejor se ajustan a lo que buscas:"
+        ])
+        
+        response = [intro]
+        for i, phone in enumerate(phones, 1):
+            price_info = f" - ${phone['price']:,}" if isinstance(phone.get('price'), (int, float)) else ""
+            response.append(
+                f"\n{i}. *{phone['brand_name']} {phone['model']}*{price_info}"
+                f"\n   🔋 {phone.get('battery_capacity', 'N/A')} mAh | 🖥️ {phone.get('screen_size', 'N/A')}\" | "
+                f"📸 {phone.get('primary_camera_rear', 'N/A')}MP"
+            )
+        
+        response.append("\n¿Quieres detalles de alguno o prefieres que busque por cámara, batería o precio?")
+        return "\n".join(response)
+    
+    except Exception as e:
+        logger.error(f"Error en búsqueda semántica: {str(e)}")
+        return handle_general_query(query)
+
+def handle_llm_query(query):
+    """
+    Respuesta del modelo de lenguaje, con datos del catálogo en el prompt.
+    Aquí no se espera al modelo: si su respuesta aún no está en la caché se
+    pide en segundo plano y se contesta con la genérica (chat_stream sí la espera).
+    """
+    catalog = get_catalog()
+    try:
+        key = (catalog.version, query)
+        messages = build_messages(query, catalog, LLM_CONTEXT_PHONES)
+        answer = llm_fallback.start(key, messages)
+        if answer:
+            return llm_reply(answer)
+        defer(key, messages)
+        metrics.count('llm_fallbacks')
+    except Exception as e:
+        logger.error(f"Error en respaldo con modelo de lenguaje: {str(e)}")
+        metrics.count('llm_fallbacks')
+    return handle_general_query(query)
+
+def llm_reply(answer):
+    """Respuesta del modelo con la invitación a seguir buscando en el catálogo"""
+    return answer + "\n\n¿Quieres que te muestre modelos por cámara, batería o precio?"
+
 def handle_general_query(query):
     """Maneja consultas genéricas con sugerencias útiles"""
     suggestions = [
@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+El endpoint de streaming del chatbot (api/chat/stream/) necesita este punto
+de entrada, por ejemplo: uvicorn mi_ecommerce.asgi:application
 """
 
 import os
@@ -14,3 +17,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mi_ecommerce.settings')
 
 application = get_asgi_application()
+
+# Precargar el catálogo del chatbot ahora que las apps están listas, antes de la primera petición
+from chatbot.catalog import warm_up  # noqa: E402
+
+warm_up()
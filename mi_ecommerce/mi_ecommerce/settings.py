@@ -13,6 +13,66 @@ OPENROUTER_API_KEY = 'sk-or-v1-48ee9dea6e5f02fc4b1b80afa9b6c023f762be9d5025ad627
 SITE_URL = 'http://localhost:8000'
 APP_NAME = 'Chatbot Celulares'
 
+# Chatbot: cada cuántos segundos se revisa si cambió la tabla smartphones (0 desactiva)
+CHATBOT_CATALOG_REFRESH_SECONDS = 60
+# Consulta barata cuyo resultado cambia cuando cambia la tabla (p. ej. "SELECT COUNT(*), MAX(id),
+# MAX(updated_at) FROM smartphones"). Sin ella se usa CHECKSUM TABLE en MySQL; en otros motores
+# cada revisión vuelve a leer la tabla completa para saber si cambió
+CHATBOT_CATALOG_MARKER_SQL = None
+# Chatbot: carpeta de la instantánea del catálogo que comparten todos los workers (None la desactiva)
+CHATBOT_CATALOG_SNAPSHOT_DIR = BASE_DIR / 'chatbot_snapshot'
+# Chatbot: caché de respuestas por proceso (entradas, segundos) y variantes de redacción por sesión
+CHATBOT_RESPONSE_CACHE_SIZE = 2048
+CHATBOT_RESPONSE_CACHE_TTL = 300
+CHATBOT_PHRASING_VARIANTS = 3
+# Chatbot: caché de tablas de comparación (entradas, segundos); la clave incluye la versión del catálogo
+CHATBOT_COMPARISON_CACHE_SIZE = 512
+CHATBOT_COMPARISON_CACHE_TTL = 60 * 60
+# Chatbot: estado de conversación (modo comparación, etc.) compartido entre procesos
+CHATBOT_STATE_CACHE = 'chatbot_state'
+CHATBOT_STATE_TTL = 60 * 5
+# Chatbot: endpoint por lotes para QA y pruebas de carga (desactivado: no se publica la URL),
+# máximo de mensajes por petición e hilos con parallel
+CHATBOT_BATCH_ENABLED = False
+CHATBOT_BATCH_MAX_ITEMS = 1000
+CHATBOT_BATCH_WORKERS = 4
+# Chatbot: endpoint de métricas (api/chat/metrics/, también en formato Prometheus). No pide login
+# y publica el pid y la memoria del proceso: activarlo solo si la URL no es accesible desde fuera
+CHATBOT_METRICS_ENABLED = False
+# Chatbot: límite de mensajes (fichas por segundo y ráfaga máxima) por IP y por sesión;
+# con un alias de CACHES compartido (Redis/Memcached) el límite vale para todos los workers
+CHATBOT_RATE_LIMIT_ENABLED = True
+CHATBOT_RATE_LIMIT_IP_RATE = 5
+CHATBOT_RATE_LIMIT_IP_BURST = 30
+CHATBOT_RATE_LIMIT_SESSION_RATE = 1
+CHATBOT_RATE_LIMIT_SESSION_BURST = 5
+CHATBOT_RATE_LIMIT_CACHE = None
+# Lotes por IP (cada lote cuesta una ficha, tenga los mensajes que tenga): uno cada 5 s, ráfaga de 2
+CHATBOT_RATE_LIMIT_BATCH_RATE = 0.2
+CHATBOT_RATE_LIMIT_BATCH_BURST = 2
+# Segundos que puede esperar un mensaje del endpoint de streaming que llega justo sin fichas
+# antes de rechazarlo (429); las vistas síncronas rechazan en el acto para no bloquear hilos
+CHATBOT_RATE_LIMIT_MAX_WAIT = 0.5
+# Tomar la IP de X-Forwarded-For (solo detrás de un proxy propio, p. ej. nginx)
+CHATBOT_RATE_LIMIT_TRUST_PROXY = False
+# Chatbot: respaldo con modelo de lenguaje para preguntas no entendidas (API compatible con OpenAI;
+# la clave se toma de la variable de entorno OPENAI_API_KEY). Para probar sin red:
+# python -m chatbot.llm --stub y CHATBOT_LLM_URL = 'http://127.0.0.1:8765/v1/chat/completions'
+CHATBOT_LLM_ENABLED = False
+CHATBOT_LLM_URL = 'https://openrouter.ai/api/v1/chat/completions'
+CHATBOT_LLM_MODEL = 'openai/gpt-4o-mini'
+# Segundos máximos por respuesta (total y de conexión) y peticiones simultáneas por proceso.
+# Solo el chat en streaming espera la respuesta; las vistas síncronas la piden en segundo plano
+CHATBOT_LLM_TIMEOUT = 4.0
+CHATBOT_LLM_CONNECT_TIMEOUT = 1.0
+CHATBOT_LLM_MAX_CONCURRENCY = 8
+CHATBOT_LLM_MAX_TOKENS = 300
+# Teléfonos del catálogo que se incluyen en el prompt
+CHATBOT_LLM_CONTEXT_PHONES = 5
+# Caché de respuestas del modelo por prompt normalizado (entradas, segundos)
+CHATBOT_LLM_CACHE_SIZE = 512
+CHATBOT_LLM_CACHE_TTL = 60 * 60
+
 # Seguridad
 SECRET_KEY = 'django-insecure-goh$gxpu36(*pj9ye-zzc(tivk5%mzd__v4p98!61$x#xq92&8'
 DEBUG = True
@@ -68,6 +128,23 @@ TEMPLATES = [
 ]
 
 # Base de datos
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Visible para todos los workers del servidor: una fila por sesión con su vencimiento
+    # indexado. Al desplegar, crear la tabla con `python manage.py createcachetable` (sin ella
+    # el estado queda en memoria de cada proceso). Cada escritura cuenta las filas para podar,
+    # por eso el chat solo escribe cuando la sesión cambió; con varios servidores o mucho
+    # tráfico usar django.core.cache.backends.redis.RedisCache con la misma clave
+    'chatbot_state': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'chatbot_state',
+        'TIMEOUT': 60 * 5,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
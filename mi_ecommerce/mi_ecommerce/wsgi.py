@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mi_ecommerce.settings')
 
 application = get_wsgi_application()
+
+# Precargar el catálogo del chatbot ahora que las apps están listas, antes de la primera petición
+from chatbot.catalog import warm_up  # noqa: E402
+
+warm_up()